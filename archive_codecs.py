@@ -0,0 +1,256 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+import gzip
+import importlib.util
+import logging
+import os
+from queue import Queue
+import tarfile
+from typing import BinaryIO, Deque, List, Optional, Sequence
+import zlib
+
+
+logger = logging.getLogger(__name__)
+GZIP_BLOCK_SIZE = 1024 * 1024  # uncompressed bytes per gzip member
+TAR_READ_BUFFER_SIZE = 1024 * 1024
+MEMBER_BLOCK_SIZE = 1024 * 1024  # extracted members are written in blocks of this size
+MEMBER_QUEUE_SIZE = 8  # blocks read ahead of the writing, per member being written
+
+
+@dataclass(frozen=True)
+class ArchiveFormat:
+    """A (compressed) tar format, for the output archive and the input"""
+
+    name: str  # as configured in OUTPUT.ARCHIVE_FORMAT
+    extension: str
+    module: str = ""  # (optional) dependency providing the codec
+
+    def is_available(self) -> bool:
+        return not self.module or importlib.util.find_spec(self.module) is not None
+
+
+ARCHIVE_FORMATS = [
+    ArchiveFormat("tar", ".tar"),
+    ArchiveFormat("gzip", ".tar.gz"),
+    ArchiveFormat("zstd", ".tar.zst", "zstandard"),
+    ArchiveFormat("lz4", ".tar.lz4", "lz4"),
+]
+
+
+def get_archive_format(name: str) -> ArchiveFormat:
+    """Return the ArchiveFormat called name, raises ValueError if unknown"""
+    for archive_format in ARCHIVE_FORMATS:
+        if archive_format.name == name:
+            return archive_format
+    raise ValueError(f"Unknown archive format: {name}")
+
+
+def archive_format_of(path: str) -> Optional[ArchiveFormat]:
+    """Return the ArchiveFormat of path (by extension), None if it's no archive"""
+    for archive_format in ARCHIVE_FORMATS:
+        if path.endswith(archive_format.extension):
+            return archive_format
+    return None
+
+
+def strip_archive_extension(path: str) -> str:
+    archive_format = archive_format_of(path)
+    return path[: -len(archive_format.extension)] if archive_format else path
+
+
+def write_archive(
+    fileobj: BinaryIO,
+    file_list: List[str],
+    archive_format: ArchiveFormat,
+    level: int,
+    threads: int,
+) -> None:
+    """Write the items of file_list (files or dirs) as archive to fileobj.
+
+    The archive is written as a stream, so fileobj only needs write(). Compression
+    (if any) uses up to threads threads"""
+    compressor = _open_compressor(fileobj, archive_format, level, threads)
+    try:
+        with tarfile.open(fileobj=compressor, mode="w|") as tar:  # type: ignore
+            for item in file_list:
+                tar.add(item, arcname=os.path.basename(item))
+    finally:
+        if compressor is not fileobj:
+            compressor.close()
+
+
+@dataclass
+class ExtractionReport:
+    """What extract_archive extracted from an archive, and what it skipped"""
+
+    extracted: List[str] = field(default_factory=list)  # member names
+    skipped: List[str] = field(default_factory=list)
+    extracted_bytes: int = 0
+    skipped_bytes: int = 0
+
+
+def extract_archive(
+    fileobj: BinaryIO,
+    output_folder: str,
+    archive_format: ArchiveFormat,
+    member_patterns: Sequence[str] = (),
+    threads: int = 1,
+) -> ExtractionReport:
+    """Extract the archive read from fileobj (which only needs read()) as a stream.
+
+    With member_patterns, only the members whose name matches one of them (see
+    fnmatch) are extracted. The data of file members is written by up to threads
+    threads, so writing large members overlaps with reading (and decompressing)
+    the next ones."""
+    decompressor = _open_decompressor(fileobj, archive_format)
+    report = ExtractionReport()
+    with tarfile.open(
+        fileobj=decompressor, mode="r|", bufsize=TAR_READ_BUFFER_SIZE
+    ) as tar:  # type: ignore
+        if not member_patterns and threads <= 1:
+            tar.extractall(path=output_folder, filter="data")  # type: ignore
+            return report  # NOTE: members are not listed, to keep this path lean
+        with ThreadPoolExecutor(
+            max_workers=max(threads, 1), thread_name_prefix="extract"
+        ) as executor:
+            writes: List[Future] = []
+            for member in tar:
+                if member_patterns and not any(
+                    fnmatch(member.name, pattern) for pattern in member_patterns
+                ):
+                    report.skipped.append(member.name)
+                    report.skipped_bytes += member.size
+                    continue
+                report.extracted.append(member.name)
+                report.extracted_bytes += member.size
+                if member.isfile():
+                    writes.append(_write_member(tar, member, output_folder, executor))
+                else:  # e.g. a dir or link, which has no data to write
+                    tar.extract(member, output_folder, filter="data")
+            for write in writes:
+                write.result()  # raises the error of a failed write (if any)
+    return report
+
+
+def _write_member(
+    tar: tarfile.TarFile,
+    member: tarfile.TarInfo,
+    output_folder: str,
+    executor: ThreadPoolExecutor,
+) -> Future:
+    """Read the data of member (in this thread, since the archive is a stream) and
+    have it written to output_folder by the executor; returns the write's Future"""
+    member = tarfile.data_filter(member, output_folder)  # e.g. no absolute paths
+    path = os.path.join(output_folder, member.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    blocks: Queue = Queue(maxsize=MEMBER_QUEUE_SIZE)  # None marks the end
+    write = executor.submit(_write_blocks, path, blocks, member)
+    data = tar.extractfile(member)
+    assert data is not None  # member is a file
+    try:
+        while block := data.read(MEMBER_BLOCK_SIZE):
+            blocks.put(block)  # blocks while the writer is MEMBER_QUEUE_SIZE behind
+    finally:  # also when the archive is cut off, so the writer always finishes
+        blocks.put(None)
+    return write
+
+
+def _write_blocks(path: str, blocks: Queue, member: tarfile.TarInfo) -> None:
+    try:
+        with open(path, "wb") as f:
+            while (block := blocks.get()) is not None:
+                f.write(block)
+    except BaseException:
+        while blocks.get() is not None:  # unblock the reader
+            pass
+        raise
+    if member.mode is not None:
+        os.chmod(path, member.mode)
+    os.utime(path, (member.mtime, member.mtime))
+
+
+def _open_compressor(fileobj, archive_format: ArchiveFormat, level: int, threads: int):
+    match archive_format.name:
+        case "gzip":
+            return ParallelGzipWriter(fileobj, level, threads)
+        case "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor(
+                level=level, threads=threads if threads > 1 else 0
+            ).stream_writer(fileobj, closefd=False)
+        case "lz4":
+            import lz4.frame
+
+            # NOTE: lz4 is fast enough to not need multiple threads
+            return lz4.frame.LZ4FrameFile(fileobj, mode="wb", compression_level=level)
+        case _:
+            return fileobj
+
+
+def _open_decompressor(fileobj, archive_format: ArchiveFormat):
+    match archive_format.name:
+        case "gzip":
+            # unlike tarfile's r|gz, GzipFile reads multi-member gzip (as written by
+            # ParallelGzipWriter) from a stream
+            return gzip.GzipFile(fileobj=fileobj, mode="rb")
+        case "zstd":
+            import zstandard
+
+            return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+        case "lz4":
+            import lz4.frame
+
+            return lz4.frame.LZ4FrameFile(fileobj, mode="rb")
+        case _:
+            return fileobj
+
+
+class ParallelGzipWriter:
+    """Write-only stream that gzips everything written to it, using multiple threads.
+
+    The data is cut into blocks of GZIP_BLOCK_SIZE, which are compressed in
+    parallel (zlib releases the GIL) as separate gzip members. Concatenated gzip
+    members form a valid gzip file (e.g. for gzip, tar and Python's gzip module).
+    At most 2 * threads blocks are kept in memory.
+    """
+
+    def __init__(self, fileobj: BinaryIO, level: int, threads: int):
+        self.fileobj = fileobj
+        self.level = level
+        self.max_pending = 2 * max(threads, 1)
+        self._buffer = bytearray()
+        self._pending: Deque[Future] = deque()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(threads, 1), thread_name_prefix="gzip"
+        )
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= GZIP_BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:GZIP_BLOCK_SIZE]))
+            del self._buffer[:GZIP_BLOCK_SIZE]
+        return len(data)
+
+    def close(self) -> None:
+        """Compress the remaining data and write all blocks (in order)"""
+        try:
+            if self._buffer or not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+
+    def _submit(self, block: bytes) -> None:
+        if len(self._pending) >= self.max_pending:  # write the oldest block first
+            self.fileobj.write(self._pending.popleft().result())
+        self._pending.append(self._executor.submit(_gzip_block, block, self.level))
+
+
+def _gzip_block(block: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush()
@@ -66,9 +66,77 @@ def validate_config(config: CfgNode) -> bool:
         assert check_setting(
             config.FILE_SYSTEM.OUTPUT_DIR, str
         ), "FILE_SYSTEM.OUTPUT_DIR"
+        assert check_setting(
+            config.FILE_SYSTEM.get("CACHE_DIR", "input-cache"), str
+        ), "FILE_SYSTEM.CACHE_DIR"
+        assert check_setting(
+            config.FILE_SYSTEM.get("MODEL_DIR", "model"), str
+        ), "FILE_SYSTEM.MODEL_DIR"
+        assert check_setting(
+            config.FILE_SYSTEM.get("RESERVATION_DIR", "disk-reservations"), str
+        ), "FILE_SYSTEM.RESERVATION_DIR"
+        assert (
+            check_setting(config.FILE_SYSTEM.get("DISK_BUDGET_MB", 0), int)
+            and config.FILE_SYSTEM.get("DISK_BUDGET_MB", 0) >= 0
+        ), "FILE_SYSTEM.DISK_BUDGET_MB"
+        assert (
+            check_setting(config.FILE_SYSTEM.get("MIN_FREE_MB", 1024), int)
+            and config.FILE_SYSTEM.get("MIN_FREE_MB", 1024) >= 0
+        ), "FILE_SYSTEM.MIN_FREE_MB"
+        assert check_setting(
+            config.FILE_SYSTEM.get("STAGE_JOURNAL", False), bool
+        ), "FILE_SYSTEM.STAGE_JOURNAL"
+        assert check_setting(
+            config.FILE_SYSTEM.get("STAGE_JOURNAL_DIR", "stage-journal"), str
+        ), "FILE_SYSTEM.STAGE_JOURNAL_DIR"
 
         # settings for this worker specifically
         # TODO: check all relevant settings
+        assert config.WORKER_SETTINGS, "WORKER_SETTINGS"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("MAX_CONCURRENT_TASKS", 1), int)
+            and config.WORKER_SETTINGS.get("MAX_CONCURRENT_TASKS", 1) > 0
+        ), "WORKER_SETTINGS.MAX_CONCURRENT_TASKS"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("PREFETCH_COUNT", 1), int)
+            and config.WORKER_SETTINGS.get("PREFETCH_COUNT", 1) > 0
+        ), "WORKER_SETTINGS.PREFETCH_COUNT"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("TASK_TIMEOUT_S", 0), int)
+            and config.WORKER_SETTINGS.get("TASK_TIMEOUT_S", 0) >= 0
+        ), "WORKER_SETTINGS.TASK_TIMEOUT_S"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("DRAIN_TIMEOUT_S", 60), int)
+            and config.WORKER_SETTINGS.get("DRAIN_TIMEOUT_S", 60) >= 0
+        ), "WORKER_SETTINGS.DRAIN_TIMEOUT_S"
+        assert check_setting(
+            config.WORKER_SETTINGS.get("PIPELINE_MODE", False), bool
+        ), "WORKER_SETTINGS.PIPELINE_MODE"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("PIPELINE_QUEUE_SIZE", 1), int)
+            and config.WORKER_SETTINGS.get("PIPELINE_QUEUE_SIZE", 1) > 0
+        ), "WORKER_SETTINGS.PIPELINE_QUEUE_SIZE"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("BATCH_SIZE", 1), int)
+            and config.WORKER_SETTINGS.get("BATCH_SIZE", 1) > 0
+        ), "WORKER_SETTINGS.BATCH_SIZE"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("BATCH_MAX_WAIT_MS", 100), int)
+            and config.WORKER_SETTINGS.get("BATCH_MAX_WAIT_MS", 100) >= 0
+        ), "WORKER_SETTINGS.BATCH_MAX_WAIT_MS"
+        # the pipeline's single model thread would only ever submit batches of one
+        assert not (
+            config.WORKER_SETTINGS.get("PIPELINE_MODE", False)
+            and config.WORKER_SETTINGS.get("BATCH_SIZE", 1) > 1
+        ), "WORKER_SETTINGS.BATCH_SIZE > 1 cannot be combined with PIPELINE_MODE"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("METRICS_PORT", 0), int)
+            and 0 <= config.WORKER_SETTINGS.get("METRICS_PORT", 0) < 65536
+        ), "WORKER_SETTINGS.METRICS_PORT"
+        assert (
+            check_setting(config.WORKER_SETTINGS.get("PROFILE_EVERY_N_TASKS", 0), int)
+            and config.WORKER_SETTINGS.get("PROFILE_EVERY_N_TASKS", 0) >= 0
+        ), "WORKER_SETTINGS.PROFILE_EVERY_N_TASKS"
 
         # settings for input & output handling
         assert config.INPUT, "INPUT"
@@ -78,6 +146,57 @@ def validate_config(config: CfgNode) -> bool:
         assert check_setting(
             config.INPUT.DELETE_ON_COMPLETION, bool
         ), "INPUT.DELETE_ON_COMPLETION"
+        assert check_setting(
+            config.INPUT.get("STREAM_EXTRACT", False), bool
+        ), "INPUT.STREAM_EXTRACT"
+        assert check_setting(config.INPUT.get("MEMBER_PATTERNS", []), list) and all(
+            isinstance(pattern, str)
+            for pattern in config.INPUT.get("MEMBER_PATTERNS", [])
+        ), "INPUT.MEMBER_PATTERNS"
+        assert (
+            check_setting(config.INPUT.get("EXTRACT_THREADS", 1), int)
+            and config.INPUT.get("EXTRACT_THREADS", 1) > 0
+        ), "INPUT.EXTRACT_THREADS"
+        assert __check_transfer_settings(config.INPUT), "INPUT transfer settings"
+        assert check_setting(
+            config.INPUT.get("CACHE_ENABLED", False), bool
+        ), "INPUT.CACHE_ENABLED"
+        assert (
+            check_setting(config.INPUT.get("CACHE_MAX_SIZE_MB", 10240), int)
+            and config.INPUT.get("CACHE_MAX_SIZE_MB", 10240) > 0
+        ), "INPUT.CACHE_MAX_SIZE_MB"
+        assert check_setting(
+            config.INPUT.get("LOOKAHEAD", False), bool
+        ), "INPUT.LOOKAHEAD"
+        assert (
+            check_setting(config.INPUT.get("LOOKAHEAD_TTL_S", 300), int)
+            and config.INPUT.get("LOOKAHEAD_TTL_S", 300) >= 0
+        ), "INPUT.LOOKAHEAD_TTL_S"
+        assert (
+            check_setting(config.INPUT.get("LOOKAHEAD_MAX_WAIT_MS", 50), int)
+            and config.INPUT.get("LOOKAHEAD_MAX_WAIT_MS", 50) >= 0
+        ), "INPUT.LOOKAHEAD_MAX_WAIT_MS"
+        assert check_setting(
+            config.INPUT.get("DISK_ADMISSION", False), bool
+        ), "INPUT.DISK_ADMISSION"
+        assert (
+            check_setting(config.INPUT.get("DISK_EXPANSION_FACTOR", 3.0), float)
+            and config.INPUT.get("DISK_EXPANSION_FACTOR", 3.0) > 0
+        ), "INPUT.DISK_EXPANSION_FACTOR"
+        assert (
+            check_setting(config.INPUT.get("DISK_WAIT_TIMEOUT_S", 0), int)
+            and config.INPUT.get("DISK_WAIT_TIMEOUT_S", 0) >= 0
+        ), "INPUT.DISK_WAIT_TIMEOUT_S"
+        assert check_setting(
+            config.INPUT.get("S3_BUCKET_MODEL"), str, True
+        ), "INPUT.S3_BUCKET_MODEL"
+        assert check_setting(
+            config.INPUT.get("MODEL_VERSION", ""), str
+        ), "INPUT.MODEL_VERSION"
+        assert (
+            check_setting(config.INPUT.get("MODEL_CHECK_INTERVAL_S", 0), int)
+            and config.INPUT.get("MODEL_CHECK_INTERVAL_S", 0) >= 0
+        ), "INPUT.MODEL_CHECK_INTERVAL_S"
 
         assert config.OUTPUT, "OUTPUT"
         assert check_setting(
@@ -86,6 +205,52 @@ def validate_config(config: CfgNode) -> bool:
         assert check_setting(
             config.OUTPUT.TRANSFER_ON_COMPLETION, bool
         ), "OUTPUT.TRANSFER_ON_COMPLETION"
+        assert check_setting(
+            config.OUTPUT.get("STREAM_UPLOAD", False), bool
+        ), "OUTPUT.STREAM_UPLOAD"
+        assert check_setting(
+            config.OUTPUT.get("REUSE_EXISTING_OUTPUT", False), bool
+        ), "OUTPUT.REUSE_EXISTING_OUTPUT"
+        assert check_setting(
+            config.OUTPUT.get("UPLOAD_PROFILE", False), bool
+        ), "OUTPUT.UPLOAD_PROFILE"
+        assert check_setting(
+            config.OUTPUT.get("BULK_RESULTS", False), bool
+        ), "OUTPUT.BULK_RESULTS"
+        assert (
+            check_setting(config.OUTPUT.get("BULK_RESULTS_SIZE", 100), int)
+            and config.OUTPUT.get("BULK_RESULTS_SIZE", 100) > 0
+        ), "OUTPUT.BULK_RESULTS_SIZE"
+        assert (
+            check_setting(config.OUTPUT.get("BULK_RESULTS_MAX_WAIT_MS", 500), int)
+            and config.OUTPUT.get("BULK_RESULTS_MAX_WAIT_MS", 500) >= 0
+        ), "OUTPUT.BULK_RESULTS_MAX_WAIT_MS"
+        assert check_setting(
+            config.OUTPUT.get("RESULT_SPOOL_FILE", "result-spool.jsonl"), str
+        ), "OUTPUT.RESULT_SPOOL_FILE"
+        assert config.OUTPUT.get("LAYOUT", "archive") in [
+            "archive",
+            "objects",
+        ], "OUTPUT.LAYOUT"
+        assert __check_archive_format(
+            config.OUTPUT.get("ARCHIVE_FORMAT", "gzip")
+        ), "OUTPUT.ARCHIVE_FORMAT"
+        assert (
+            check_setting(config.OUTPUT.get("COMPRESSION_LEVEL", 6), int)
+            and config.OUTPUT.get("COMPRESSION_LEVEL", 6) >= 0
+        ), "OUTPUT.COMPRESSION_LEVEL"
+        assert (
+            check_setting(config.OUTPUT.get("COMPRESSION_THREADS", 1), int)
+            and config.OUTPUT.get("COMPRESSION_THREADS", 1) > 0
+        ), "OUTPUT.COMPRESSION_THREADS"
+        assert __check_feature_format(
+            config.OUTPUT.get("FEATURE_FORMAT", "npy")
+        ), "OUTPUT.FEATURE_FORMAT"
+        assert (
+            check_setting(config.OUTPUT.get("FEATURE_BUFFER_MB", 8), int)
+            and config.OUTPUT.get("FEATURE_BUFFER_MB", 8) > 0
+        ), "OUTPUT.FEATURE_BUFFER_MB"
+        assert __check_transfer_settings(config.OUTPUT), "OUTPUT transfer settings"
         if config.OUTPUT.TRANSFER_ON_COMPLETION:
             # required only in case output must be transferred
             assert check_setting(
@@ -118,6 +283,35 @@ def check_setting(setting: Any, t: type, optional=False) -> bool:
     return (type(setting) is t) or (optional and (setting is None))
 
 
+def __check_transfer_settings(settings: CfgNode) -> bool:
+    """Check the (optional) S3 transfer settings of the INPUT or OUTPUT block"""
+    return (
+        check_setting(settings.get("S3_MAX_POOL_CONNECTIONS", 16), int)
+        and settings.get("S3_MAX_POOL_CONNECTIONS", 16) > 0
+        and check_setting(settings.get("S3_TCP_KEEPALIVE", True), bool)
+        and check_setting(settings.get("MULTIPART_CHUNKSIZE_MB", 8), int)
+        and settings.get("MULTIPART_CHUNKSIZE_MB", 8) > 0
+        and check_setting(settings.get("MAX_CONCURRENCY", 4), int)
+        and settings.get("MAX_CONCURRENCY", 4) > 0
+        and check_setting(settings.get("MAX_BANDWIDTH_MB", 0), int)
+        and settings.get("MAX_BANDWIDTH_MB", 0) >= 0
+    )
+
+
+def __check_archive_format(name: Any) -> bool:
+    """Check the format is known and its (optional) dependency is installed"""
+    from archive_codecs import ARCHIVE_FORMATS
+
+    return any(f.name == name and f.is_available() for f in ARCHIVE_FORMATS)
+
+
+def __check_feature_format(name: Any) -> bool:
+    """Check the format is known and its (optional) dependency is installed"""
+    from feature_writers import FEATURE_FORMATS
+
+    return any(f.name == name and f.is_available() for f in FEATURE_FORMATS)
+
+
 def __check_dane_dependencies(deps: Any) -> bool:
     """Check that all dependencies are in place.
 
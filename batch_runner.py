@@ -0,0 +1,201 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+import json
+import logging
+import multiprocessing
+import os
+from time import perf_counter, time
+from typing import Dict, List, Set, Tuple
+
+from archive_codecs import archive_format_of
+from base_util import LOG_FORMAT
+from dane.config import cfg
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchInput:
+    """An input of the batch: S3 URI or local path, with its source_id and size"""
+
+    path: str
+    source_id: str
+    size: int = 0  # bytes (0 if unknown)
+
+
+class BatchJournal:
+    """Append-only record (JSON lines) of the inputs a batch finished, so an
+    interrupted batch resumes with the inputs that did not complete yet"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()  # source_ids that were processed fine
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:  # cut off by an interruption
+                        continue
+                    if entry.get("state") == 200:
+                        self.completed.add(entry["source_id"])
+        logger.info(f"Journal {path} lists {len(self.completed)} completed inputs")
+
+    def record(self, source_id: str, state: int, message: str, seconds: float):
+        """Append the result of source_id (durably, so it survives a crash)"""
+        entry = {
+            "source_id": source_id,
+            "state": state,
+            "message": message,
+            "seconds": round(seconds, 3),
+            "finished_at": time(),
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if state == 200:
+            self.completed.add(source_id)
+
+
+def list_batch_inputs(location: str) -> List[BatchInput]:
+    """List the inputs under location: the archives under an S3 prefix
+    (s3://<bucket>/<prefix>), or the archives and (extracted) input dirs in a
+    local dir"""
+    from io_util import source_id_from_local_path, source_id_from_s3_uri
+
+    inputs = []
+    if location.startswith("s3://"):
+        from io_util import get_s3_client
+
+        bucket, _, prefix = location[len("s3://") :].partition("/")
+        paginator = get_s3_client(cfg.INPUT).get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if archive_format_of(obj["Key"]):
+                    uri = f"s3://{bucket}/{obj['Key']}"
+                    inputs.append(
+                        BatchInput(uri, source_id_from_s3_uri(uri), obj["Size"])
+                    )
+    else:
+        for entry in sorted(os.scandir(location), key=lambda e: e.name):
+            if entry.is_dir() or archive_format_of(entry.name):
+                inputs.append(
+                    BatchInput(
+                        entry.path,
+                        source_id_from_local_path(entry.path),
+                        _size_of(entry.path),
+                    )
+                )
+    logger.info(f"Found {len(inputs)} inputs in {location}")
+    return inputs
+
+
+def run_batch(location: str, journal_path: str, processes: int) -> Dict:
+    """Process all inputs in location (see list_batch_inputs) with main_data_processor
+    .run, on a pool of processes. Inputs completed according to the journal are
+    skipped, the others are recorded in it once finished.
+
+    Returns the aggregate results of the batch: the throughput of the inputs that
+    were processed fine, and the failed inputs (with their state and message)"""
+    journal = BatchJournal(journal_path)
+    inputs = list_batch_inputs(location)
+    todo = [i for i in inputs if i.source_id not in journal.completed]
+    logger.info(f"Processing {len(todo)} inputs ({len(inputs) - len(todo)} done)")
+
+    start = perf_counter()
+    states, failures, processed_bytes = _process_all(todo, journal, processes)
+    elapsed = perf_counter() - start
+    processed = states.get(200, 0)
+    return {
+        "inputs": len(inputs),
+        "skipped": len(inputs) - len(todo),
+        "processed": processed,
+        "failed": len(failures),
+        "states": states,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "inputs_per_s": round(processed / elapsed, 3) if elapsed else 0,
+        "input_mb_per_s": round(processed_bytes / 1e6 / elapsed, 3) if elapsed else 0,
+        "processes": processes,
+    }
+
+
+def _process_all(
+    todo: List[BatchInput], journal: BatchJournal, processes: int
+) -> Tuple[Dict[int, int], Dict[str, Dict], int]:
+    """Process todo on a pool of processes, recording each result in the journal.
+
+    Returns the number of inputs per (response) state, the state and message per
+    failed source_id, and the bytes processed fine"""
+    states: Dict[int, int] = {}
+    failures: Dict[str, Dict] = {}
+    processed_bytes = 0
+    # spawn: forked children would share the S3 connections of this process
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_process,
+        initargs=(logging.getLogger().level,),
+    ) as executor:
+        pending: Dict[Future, BatchInput] = {}
+        remaining = iter(todo)
+        try:
+            while True:
+                # keep the pool busy, without submitting all inputs at once
+                for batch_input in remaining:
+                    pending[executor.submit(_process, batch_input.path)] = batch_input
+                    if len(pending) >= 2 * processes:
+                        break
+                if not pending:
+                    return states, failures, processed_bytes
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_input = pending.pop(future)
+                    state, message, seconds = _result_of(future, batch_input)
+                    journal.record(batch_input.source_id, state, message, seconds)
+                    states[state] = states.get(state, 0) + 1
+                    if state == 200:
+                        processed_bytes += batch_input.size
+                    else:
+                        failures[batch_input.source_id] = {
+                            "state": state,
+                            "message": message,
+                        }
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, the next run resumes from the journal")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def _result_of(future: Future, batch_input: BatchInput) -> Tuple[int, str, float]:
+    try:
+        return future.result()
+    except Exception as e:  # e.g. the process crashed
+        logger.exception(f"Failed to process {batch_input.path}")
+        return 500, str(e), 0.0
+
+
+def _init_process(log_level: int) -> None:
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.getLogger().setLevel(log_level)
+
+
+def _process(input_path: str) -> Tuple[int, str, float]:
+    """Run main_data_processor on input_path (in a process of the pool)"""
+    import main_data_processor
+
+    start = perf_counter()
+    response, _ = main_data_processor.run(input_path)
+    return response["state"], response["message"], perf_counter() - start
+
+
+def _size_of(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    )
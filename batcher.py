@@ -0,0 +1,93 @@
+import logging
+from concurrent.futures import Future
+from queue import Empty, Queue
+import threading
+from time import time
+from typing import Any, Callable, List, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects items submitted by concurrent tasks into batches.
+
+    A batch is processed as soon as it holds max_batch_size items, or max_wait_ms
+    after its first item arrived, whichever comes first. batch_fn receives the list
+    of items and must return one result per item, in the same order. This trades a
+    little latency for far fewer calls when the per-call overhead of batch_fn
+    dominates (e.g. vectorized model inference).
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: int,
+    ):
+        """Start the thread that forms and processes the batches
+
+        Params:
+            batch_fn: processes a batch of items, returns a result for each
+            max_batch_size: max number of items in a batch
+            max_wait_ms: max time to wait for a batch to fill up
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: Queue = Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="micro-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Add an item to the next batch; the Future resolves to its result"""
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def stop(self) -> None:
+        """Process the items submitted so far, then stop"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = self._fill_batch(batch)
+            self._process(batch)
+            if stopping:
+                return
+
+    def _fill_batch(self, batch: List[Tuple[Any, Future]]) -> bool:
+        """Add items until the batch is full or the deadline passed.
+
+        Returns whether the stop signal was received"""
+        deadline = time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time(), 0))
+            except Empty:
+                break
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    def _process(self, batch: List[Tuple[Any, Future]]) -> None:
+        logger.info(f"Processing a batch of {len(batch)} items")
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Got {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logger.exception("Processing the batch failed")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+import fcntl
+import logging
+import os
+import shutil
+import threading
+from time import sleep, time
+from typing import IO, Dict, Iterator, Optional
+import uuid
+
+
+logger = logging.getLogger(__name__)
+LOCK_FILE = ".lock"
+RESERVATION_SUFFIX = ".reservation"
+
+
+class DiskBudget:
+    """Node-wide admission control for the disk space used by tasks.
+
+    Before downloading, a task reserves the space it is estimated to need (input,
+    extracted input and output). Each reservation is a file in reservation_dir,
+    which is shared by all worker processes on the node (i.e. using the same
+    volume); a (flock) lock file makes checking and reserving atomic across them.
+    The owner keeps a shared lock on each of its reservation files, so that
+    reservations of processes that died (also in other containers) are recognized
+    as unlocked, and removed.
+
+    With a budget, the reservations together may not exceed it. Without one, they
+    may not exceed the free disk space minus min_free. As the free space already
+    excludes what running tasks have written, this is conservative: it never
+    overcommits, but may admit fewer tasks than would fit.
+    """
+
+    def __init__(
+        self,
+        reservation_dir: str,
+        budget: int = 0,
+        min_free: int = 0,
+        poll_interval: float = 1,
+    ):
+        """Params:
+        reservation_dir: where the reservations are kept, on the budgeted volume
+        budget: max bytes reserved by all tasks together (0: use the free space)
+        min_free: bytes to always keep free on the volume
+        poll_interval: seconds between attempts while waiting for space
+        """
+        self.reservation_dir = reservation_dir
+        self.budget = budget
+        self.min_free = min_free
+        self.poll_interval = poll_interval
+        self._held: Dict[str, IO] = {}  # reservations of this process -> locked file
+        self._lock = threading.Lock()
+        os.makedirs(reservation_dir, exist_ok=True)
+
+    def reserve(self, size: int, timeout: float = 0) -> Optional[str]:
+        """Reserve size bytes, waiting up to timeout seconds for space to free up.
+
+        Returns the reservation (to pass to release()), or None if it didn't fit"""
+        if self.budget and size > self.budget:
+            logger.error(f"Reserving {size} bytes exceeds the budget of {self.budget}")
+            return None
+        deadline = time() + timeout
+        while True:
+            with _locked(os.path.join(self.reservation_dir, LOCK_FILE)):
+                available = self._available()
+                if size <= available:
+                    return self._write_reservation(size)
+            if time() >= deadline:
+                logger.warning(f"No disk space for {size} bytes ({available} left)")
+                return None
+            sleep(min(self.poll_interval, max(deadline - time(), 0)))
+
+    def release(self, reservation: str) -> None:
+        """Release a reservation obtained with reserve()"""
+        with self._lock:
+            f = self._held.pop(reservation, None)
+        if f is None:
+            logger.warning(f"Reservation {reservation} was already released")
+            return
+        os.remove(reservation)
+        f.close()  # also releases the lock
+
+    def reserved(self) -> int:
+        """Return the number of bytes reserved by all (live) processes"""
+        with _locked(os.path.join(self.reservation_dir, LOCK_FILE)):
+            return self._reserved()
+
+    def _reserved(self) -> int:
+        total = 0
+        for file_name in os.listdir(self.reservation_dir):
+            if not file_name.endswith(RESERVATION_SUFFIX):
+                continue
+            path = os.path.join(self.reservation_dir, file_name)
+            try:
+                with open(path) as f:
+                    with self._lock:
+                        held = path in self._held
+                    if not held and _is_unlocked(f):
+                        logger.info(f"Removing reservation {path} of stopped process")
+                        os.remove(path)
+                        continue
+                    total += int(f.read() or 0)
+            except FileNotFoundError:  # just released
+                continue
+        return total
+
+    def _available(self) -> int:
+        reserved = self._reserved()
+        if self.budget:
+            return self.budget - reserved
+        free = shutil.disk_usage(self.reservation_dir).free
+        return free - self.min_free - reserved
+
+    def _write_reservation(self, size: int) -> str:
+        path = os.path.join(self.reservation_dir, uuid.uuid4().hex + RESERVATION_SUFFIX)
+        f = open(path, "w")
+        fcntl.flock(f, fcntl.LOCK_SH)  # held until release() (or the process dies)
+        f.write(str(size))
+        f.flush()
+        with self._lock:
+            self._held[path] = f
+        return path
+
+
+@contextmanager
+def _locked(lock_file: str) -> Iterator[None]:
+    """Hold an exclusive lock, shared by all processes, during the with-block"""
+    with open(lock_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _is_unlocked(f: IO) -> bool:
+    """Return whether no process holds a lock on f (i.e. its owner is gone)"""
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
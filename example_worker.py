@@ -0,0 +1,351 @@
+from dataclasses import dataclass, field
+import logging
+import os
+import sys
+import threading
+from time import monotonic
+from typing import Dict, Optional
+from base_util import validate_config
+from dane import Document, Task, Result
+from dane.base_classes import base_worker
+from dane.errors import RefuseJobException
+from dane.provenance import Provenance
+from metrics import timed
+from models import CallbackResponse
+from io_util import (
+    fetch_input_s3_uri,
+    fetch_input_s3_uris,
+    source_id_from_s3_uri,
+    get_output_layout,
+    get_s3_output_file_uri,
+    warm_input_cache,
+)
+from lookahead import InputLookahead
+import main_data_processor
+from result_writer import BulkResultWriter
+
+
+logger = logging.getLogger()
+
+
+@dataclass
+class InFlightTask:
+    """A task that is being processed (or waits for an execution slot)"""
+
+    task_id: str
+    started: float = field(default_factory=monotonic)
+    cancel: threading.Event = field(default_factory=threading.Event)
+
+
+class ExampleWorker(base_worker):
+    """Example worker class
+
+    Dane Example worker class that implements the Dane worker.
+    Thus serves as the process receiving tasks from Dane.
+    Uses the base_worker class from Dane
+    """
+
+    def __init__(self, config, unit_testing=False, profile=False):
+        """Initialises the worker class
+
+        Validates the config, sets some variables and creates a generator if absent.
+
+        Params:
+            config: the configuration
+            profile: profile every task (see main_data_processor.run)
+        """
+        logger.info(config)
+        self.UNIT_TESTING = unit_testing
+        self.profile = profile
+
+        if not self.UNIT_TESTING and not validate_config(config):
+            logger.error("Invalid config, quitting")
+            sys.exit()
+
+        self.__queue_name = "DUMMY"
+        self.__binding_key = "#.DUMMY"
+        self.__depends_on = (
+            list(config.DANE_DEPENDENCIES) if "DANE_DEPENDENCIES" in config else []
+        )
+        # number of messages that may be unacked (i.e. processed) at the same time
+        self.max_concurrent_tasks = config.WORKER_SETTINGS.get(
+            "MAX_CONCURRENT_TASKS", 1
+        )
+        # messages delivered up front, of which only max_concurrent_tasks are
+        # processed at a time; the others wait for a slot (see callback)
+        self.prefetch_count = max(
+            config.WORKER_SETTINGS.get("PREFETCH_COUNT", 1), self.max_concurrent_tasks
+        )
+        self._execution_slots = threading.BoundedSemaphore(self.max_concurrent_tasks)
+        # tasks running longer are cancelled, so they are acked (as failed) before
+        # the broker's consumer_timeout closes the channel (0 = no timeout)
+        self.task_timeout = config.WORKER_SETTINGS.get("TASK_TIMEOUT_S", 0)
+        # on stop, in-flight tasks get this long to finish before they're cancelled
+        self.drain_timeout = config.WORKER_SETTINGS.get("DRAIN_TIMEOUT_S", 60)
+        self._in_flight: Dict[str, InFlightTask] = {}  # task id -> task
+        self._in_flight_lock = threading.Lock()
+        self._stopping = False
+
+        super().__init__(
+            self.__queue_name,
+            self.__binding_key,
+            config,
+            self.__depends_on,
+            auto_connect=not self.UNIT_TESTING,
+            no_api=self.UNIT_TESTING,
+        )
+
+        # NOTE: cannot be automatically filled, because no git client is present
+        if not self.generator:
+            logger.info("Generator was None, creating it now")
+            self.generator = {
+                "id": "dane-example-worker",
+                "type": "Software",
+                "name": "MY_NAME",
+                "homepage": "https://github.com/beeldengeluid/dane-example-worker",
+            }
+
+        # Results are saved in bulk (if configured so), see save_to_dane_index
+        self.result_writer = None
+        if not self.UNIT_TESTING and config.OUTPUT.get("BULK_RESULTS", False):
+            self.result_writer = BulkResultWriter(
+                self.handler.es,
+                self.handler.INDEX,
+                os.path.join(
+                    config.FILE_SYSTEM.BASE_MOUNT,
+                    config.OUTPUT.get("RESULT_SPOOL_FILE", "result-spool.jsonl"),
+                ),
+                config.OUTPUT.get("BULK_RESULTS_SIZE", 100),
+                config.OUTPUT.get("BULK_RESULTS_MAX_WAIT_MS", 500),
+            )
+
+        # the input of waiting tasks is looked up (and prefetched) ahead of time
+        self.lookahead = None
+        if not self.UNIT_TESTING and config.INPUT.get("LOOKAHEAD", False):
+            self.lookahead = InputLookahead(
+                lambda doc_ids: fetch_input_s3_uris(self.handler, doc_ids),
+                warm_input_cache if config.INPUT.get("CACHE_ENABLED", False) else None,
+                config.INPUT.get("LOOKAHEAD_TTL_S", 300),
+                self.prefetch_count,
+                config.INPUT.get("LOOKAHEAD_MAX_WAIT_MS", 50),
+            )
+
+        # load the model up front, so the first task doesn't have to wait for it
+        if not self.UNIT_TESTING:
+            model = main_data_processor.get_model()
+            logger.info(f"Loaded model version: {model.version}")
+
+    """----------------------------------INTERACTION WITH DANE SERVER ---------------------------------"""
+
+    def connect(self):
+        """Connects to RabbitMQ, then applies the configured task concurrency
+
+        base_worker already runs each callback in its own thread and acks/replies
+        per delivery_tag (via add_callback_threadsafe), but it limits the channel to
+        a single unacked message. Raising the prefetch count lets the broker deliver
+        up to MAX_CONCURRENT_TASKS messages, which are then processed in parallel,
+        or up to PREFETCH_COUNT messages, so the next tasks are known (see
+        INPUT.LOOKAHEAD) while the current ones run.
+        """
+        super().connect()
+        logger.info(
+            f"Processing at most {self.max_concurrent_tasks} tasks at a time, "
+            f"of {self.prefetch_count} delivered tasks"
+        )
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+
+    def _start_processing_task(self, task, doc, ch, method, props):
+        """Tracks the task while base_worker runs it (in this thread), until its
+        ack (or nack) is handed to the connection thread (see stop)"""
+        with self._in_flight_lock:
+            self._in_flight[task._id] = InFlightTask(task._id)
+        try:
+            super()._start_processing_task(task, doc, ch, method, props)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(task._id, None)
+
+    def callback(self, task: Task, doc: Document) -> CallbackResponse:
+        """Dane callback function
+
+        DANE callback function is called whenever there is a job for this worker.
+        Fetches input from S3,
+        Runs the main process,
+        Saves the results and provenance to the dane index.
+
+        base_worker runs it in its own thread, so the connection thread keeps
+        servicing heartbeats meanwhile. A task that is cancelled because the worker
+        stops is refused, so the broker hands it to another worker; a task that
+        is cancelled otherwise (see cancel and WORKER_SETTINGS.TASK_TIMEOUT_S)
+        fails.
+
+        Params:
+            task: the Dane Task
+            doc: the Dane Document
+
+        Returns:
+            CallbackResponse: the main processing result
+
+        """
+        logger.info("Receiving a task from the DANE server!")
+        logger.info(task)
+        logger.info(doc)
+        with self._in_flight_lock:
+            cancel = self._in_flight.get(task._id, InFlightTask(task._id)).cancel
+        if self._stopping:
+            raise RefuseJobException("The worker is stopping")
+        if self.lookahead:  # while waiting for a slot, the input is looked up
+            self.lookahead.announce(doc._id)
+
+        while not self._execution_slots.acquire(timeout=1):
+            if self._stopping:
+                raise RefuseJobException("The worker is stopping")
+        timer = None
+        if self.task_timeout:
+            timer = threading.Timer(self.task_timeout, self._time_out, (task, cancel))
+            timer.daemon = True
+            timer.start()
+        try:
+            # fetch s3 uri of input data:
+            with timed("fetch_input_s3_uri"):
+                s3_uri = self.fetch_input_s3_uri(doc)
+
+            # now run the main process!
+            processing_result, full_provenance_chain = main_data_processor.run(
+                s3_uri, self.profile, cancel
+            )
+        finally:
+            if timer:
+                timer.cancel()
+            self._execution_slots.release()
+        cancelled = (
+            processing_result["message"] == main_data_processor.TASK_CANCELLED_MESSAGE
+        )
+        if cancelled and self._stopping:
+            raise RefuseJobException("Cancelled the task, because the worker stops")
+
+        # if results are fine, save something to the DANE index
+        if processing_result.get("state", 500) == 200:
+            logger.info(
+                "applying IO on output went well, now finally saving to DANE index"
+            )
+            with timed("save_to_dane_index"):
+                self.save_to_dane_index(
+                    doc,
+                    task,
+                    get_s3_output_file_uri(source_id_from_s3_uri(s3_uri)),
+                    provenance=full_provenance_chain,
+                )
+        return processing_result
+
+    def cancel(self, task_id: str) -> bool:
+        """Cancel the in-flight task with task_id (see main_data_processor.run);
+        returns whether it was in flight"""
+        with self._in_flight_lock:
+            in_flight = self._in_flight.get(task_id)
+        if in_flight:
+            in_flight.cancel.set()
+        return in_flight is not None
+
+    def in_flight_tasks(self) -> Dict[str, float]:
+        """Return the seconds each in-flight task (by id) has been running"""
+        now = monotonic()
+        with self._in_flight_lock:
+            return {t.task_id: now - t.started for t in self._in_flight.values()}
+
+    def _time_out(self, task: Task, cancel: threading.Event) -> None:
+        logger.warning(f"Task {task._id} exceeded {self.task_timeout}s, cancelling it")
+        cancel.set()
+
+    def fetch_input_s3_uri(self, doc: Document) -> str:
+        """Return the S3 URI of the input of doc, as found by the lookahead (if any)
+        or else by querying the DANE index"""
+        if self.lookahead:
+            try:
+                s3_uri = self.lookahead.resolve(doc._id).result()
+                if s3_uri:
+                    return s3_uri
+            except Exception:
+                logger.exception("Looking up the input ahead failed")
+        return fetch_input_s3_uri(self.handler, doc)
+
+    def save_to_dane_index(
+        self,
+        doc: Document,
+        task: Task,
+        s3_location: str,
+        provenance: Provenance,
+    ) -> None:
+        """Save the result to the dane index
+
+        With OUTPUT.BULK_RESULTS, the result is sent along with those of
+        other tasks in a bulk request; this waits until it's stored, so the task is
+        only acknowledged (by base_worker) once its result is persisted.
+
+        Params:
+            doc: The dane Document
+            task: The dane Task
+            s3_location: The location of the output archive, or (with OUTPUT.LAYOUT
+                "objects") of the manifest listing the output objects
+            provenance: The Provenance information (currently not stored but written to S3)
+        """
+        logger.info("saving results to DANE, task id={0}".format(task._id))
+        r = Result(
+            self.generator,
+            payload={
+                "doc_id": doc._id,
+                "task_id": task._id if task else None,
+                "doc_target_id": doc.target["id"],
+                "doc_target_url": doc.target["url"],
+                "s3_location": s3_location,
+                "s3_output_layout": get_output_layout(),
+                # "provenance": provenance.to_json(),
+            },
+            api=self.handler,
+        )
+        if self.result_writer:
+            r._id = self.result_writer.submit(r, task._id).result()
+        else:
+            r.save(task._id)
+
+    def stop(self, drain_timeout: Optional[float] = None):
+        """Stop listening for tasks, then let the in-flight tasks finish (drain).
+
+        Must be called from the connection thread (i.e. the one that ran run()),
+        which sends the acks and replies of the draining tasks and keeps servicing
+        heartbeats meanwhile. Tasks still running after drain_timeout seconds
+        (default: WORKER_SETTINGS.DRAIN_TIMEOUT_S) are cancelled and, once their
+        current stage finished, refused, so the broker requeues them. Finally the
+        Results that are still pending are saved.
+        """
+        self._stopping = True
+        super().stop()
+        if self.channel.is_open:
+            self.channel.cancel()  # requeues the messages that were not handed out
+            timeout = self.drain_timeout if drain_timeout is None else drain_timeout
+            if not self._drain(timeout):
+                in_flight = self.in_flight_tasks()
+                logger.warning(f"Cancelling {len(in_flight)} tasks that still run")
+                for task_id in in_flight:
+                    self.cancel(task_id)
+                self._drain(timeout)
+        else:  # the broker requeued the unacked messages already
+            for task_id in self.in_flight_tasks():
+                self.cancel(task_id)
+        if self.lookahead:
+            self.lookahead.stop()
+        if self.result_writer:
+            self.result_writer.stop()
+
+    def _drain(self, timeout: float) -> bool:
+        """Service the connection until no task is in flight (anymore), or until
+        timeout; returns whether all tasks finished"""
+        deadline = monotonic() + timeout
+        while self.in_flight_tasks():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            logger.info(f"Waiting for {len(self.in_flight_tasks())} in-flight tasks")
+            self.connection.process_data_events(time_limit=min(remaining, 1))
+        self.connection.process_data_events(time_limit=0)  # the last acks
+        return True
@@ -0,0 +1,254 @@
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+import ast
+import importlib.util
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+FEATURE_BUFFER_SIZE = 8 * 1024 * 1024  # bytes buffered before they're written
+NPY_MAGIC = b"\x93NUMPY\x01\x00"  # .npy format version 1.0
+NPY_HEADER_SIZE = 128  # fixed, so the shape can be filled in once all rows are known
+CHUNK_INDEX_FILE = "index.json"
+_BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+# dtype -> array typecode (values are buffered in native byte order)
+DTYPES = {"float32": "f", "float64": "d", "int32": "i", "int64": "q"}
+
+
+@dataclass(frozen=True)
+class FeatureFormat:
+    """A file format for the (numeric) features, see OutputType.FEATURES"""
+
+    name: str  # as configured in OUTPUT.FEATURE_FORMAT
+    extension: str
+    module: str = ""  # (optional) dependency providing the format
+
+    def is_available(self) -> bool:
+        return not self.module or importlib.util.find_spec(self.module) is not None
+
+
+FEATURE_FORMATS = [
+    FeatureFormat("npy", ".npy"),  # a single array, e.g. numpy.load(mmap_mode="r")
+    FeatureFormat("chunked", ".chunks"),  # dir of .npy chunks, listed in index.json
+    FeatureFormat("parquet", ".parquet", "pyarrow"),  # a row group per chunk
+]
+
+
+def get_feature_format(name: str) -> FeatureFormat:
+    """Return the FeatureFormat called name, raises ValueError if unknown"""
+    for feature_format in FEATURE_FORMATS:
+        if feature_format.name == name:
+            return feature_format
+    raise ValueError(f"Unknown feature format: {name}")
+
+
+class FeatureWriter(ABC):
+    """Writes features, i.e. rows of row_size values of dtype, incrementally.
+
+    Rows are collected in a buffer (in their binary form) and written in blocks of
+    buffer_size bytes, so a model can write rows one at a time (or a batch at a
+    time) without paying for a write per row. Use as context manager, or call
+    close() to write the remaining rows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dtype: str = "float32",
+        row_size: int = 1,
+        buffer_size: int = FEATURE_BUFFER_SIZE,
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.row_size = row_size
+        self.rows = 0  # rows written (or buffered) so far
+        self._buffer = array(DTYPES[dtype])
+        self._buffer_rows = max(buffer_size // (self._buffer.itemsize * row_size), 1)
+
+    @property
+    def descr(self) -> str:
+        """The dtype as numpy describes it, e.g. <f4"""
+        return f"{_BYTE_ORDER}{self.dtype[0]}{array(DTYPES[self.dtype]).itemsize}"
+
+    def write(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Add rows, each a sequence of row_size values"""
+        for row in rows:
+            if len(row) != self.row_size:
+                raise ValueError(f"Expected rows of {self.row_size} values")
+            self._buffer.extend(row)
+            self.rows += 1
+            if len(self._buffer) >= self._buffer_rows * self.row_size:
+                self._flush()
+
+    def close(self) -> None:
+        """Write the buffered rows, then finish the file(s)"""
+        self._flush()
+        self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._write_block(self._buffer)
+            self._buffer = array(self._buffer.typecode)
+
+    @abstractmethod
+    def _write_block(self, block: array) -> None:
+        """Write a block of buffered values (a whole number of rows)"""
+
+    def _finish(self) -> None:
+        pass
+
+
+class NpyFeatureWriter(FeatureWriter):
+    """Writes the features as one (rows, row_size) array in a .npy file.
+
+    The header is written up front with a fixed size, and filled in with the number
+    of rows on close, so the rows are streamed to the file as they come in."""
+
+    def __init__(self, path: str, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(self.descr, (0, self.row_size)))
+
+    def _write_block(self, block: array) -> None:
+        block.tofile(self._file)
+
+    def _finish(self) -> None:
+        self._file.seek(0)
+        self._file.write(_npy_header(self.descr, (self.rows, self.row_size)))
+        self._file.close()
+
+
+class ChunkedFeatureWriter(FeatureWriter):
+    """Writes each block of features as a separate .npy file (chunk) in the dir at
+    path, listed in index.json, so readers can load (or download) part of them"""
+
+    def __init__(self, path: str, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        os.makedirs(path, exist_ok=True)
+        self._chunks: List[Dict[str, Any]] = []
+
+    def _write_block(self, block: array) -> None:
+        file_name = f"chunk-{len(self._chunks):05d}.npy"
+        rows = len(block) // self.row_size
+        with open(os.path.join(self.path, file_name), "wb") as f:
+            f.write(_npy_header(self.descr, (rows, self.row_size)))
+            block.tofile(f)
+        self._chunks.append({"file": file_name, "rows": rows})
+
+    def _finish(self) -> None:
+        index = {
+            "dtype": self.descr,
+            "row_size": self.row_size,
+            "rows": self.rows,
+            "chunks": self._chunks,
+        }
+        with open(os.path.join(self.path, CHUNK_INDEX_FILE), "w") as f:
+            json.dump(index, f)
+
+
+class ParquetFeatureWriter(FeatureWriter):
+    """Writes the features to a Parquet file (needs pyarrow), as a single column of
+    fixed size lists, with a row group per block"""
+
+    def __init__(self, path: str, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._value_type = getattr(pa, self.dtype)()  # e.g. pa.float32()
+        self._schema = pa.schema(
+            [("features", pa.list_(self._value_type, self.row_size))]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write_block(self, block: array) -> None:
+        import pyarrow as pa
+
+        values = pa.Array.from_buffers(
+            self._value_type, len(block), [None, pa.py_buffer(block)]
+        )
+        features = pa.FixedSizeListArray.from_arrays(values, self.row_size)
+        self._writer.write_table(pa.Table.from_arrays([features], schema=self._schema))
+
+    def _finish(self) -> None:
+        self._writer.close()
+
+
+def open_feature_writer(
+    path: str,
+    feature_format: FeatureFormat,
+    dtype: str = "float32",
+    row_size: int = 1,
+    buffer_size: int = FEATURE_BUFFER_SIZE,
+) -> FeatureWriter:
+    """Return a FeatureWriter writing to path in feature_format"""
+    match feature_format.name:
+        case "npy":
+            return NpyFeatureWriter(path, dtype, row_size, buffer_size)
+        case "chunked":
+            return ChunkedFeatureWriter(path, dtype, row_size, buffer_size)
+        case "parquet":
+            return ParquetFeatureWriter(path, dtype, row_size, buffer_size)
+        case _:
+            raise ValueError(f"Unknown feature format: {feature_format.name}")
+
+
+@contextmanager
+def map_npy(path: str) -> Iterator[Tuple[Tuple[int, ...], memoryview]]:
+    """Map a .npy file (as written by NpyFeatureWriter) into memory, read-only.
+
+    Yields its shape and its values as (flat) memoryview, without reading or
+    parsing them; the view must not be used after the with-block"""
+    with open(path, "rb") as f:
+        if f.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise ValueError(f"Not a .npy (version 1.0) file: {path}")
+        (header_len,) = struct.unpack("<H", f.read(2))
+        header = ast.literal_eval(f.read(header_len).decode("latin1"))
+        typecode = DTYPES.get(_dtype_of(header["descr"]), "")
+        if not typecode or header["descr"][0] != _BYTE_ORDER:
+            raise ValueError(f"Unsupported dtype: {header['descr']}")
+        offset = len(NPY_MAGIC) + 2 + header_len
+        if os.fstat(f.fileno()).st_size == offset:  # an empty file cannot be mapped
+            yield header["shape"], memoryview(b"").cast(typecode)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as file_view:
+                view = file_view[offset:].cast(typecode)
+                try:
+                    yield header["shape"], view
+                finally:
+                    view.release()
+
+
+def _npy_header(descr: str, shape: Tuple[int, ...]) -> bytes:
+    """Return the .npy header (of NPY_HEADER_SIZE bytes) of a C-ordered array"""
+    header = repr({"descr": descr, "fortran_order": False, "shape": shape})
+    header_len = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+    return (
+        NPY_MAGIC
+        + struct.pack("<H", header_len)
+        + header.ljust(header_len - 1).encode("latin1")
+        + b"\n"
+    )
+
+
+def _dtype_of(descr: str) -> str:
+    """Return the dtype (e.g. float32) of a numpy descr (e.g. <f4)"""
+    kind = {"f": "float", "i": "int"}.get(descr[1], "")
+    return f"{kind}{int(descr[2:]) * 8}"
@@ -0,0 +1,242 @@
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from time import time_ns
+from typing import IO, Callable, Dict, Iterator, Optional, Tuple
+import uuid
+
+
+logger = logging.getLogger(__name__)
+TMP_DIR_SUFFIX = ".tmp"  # entries are filled in <entry>.<uuid>.tmp, then renamed
+LOCK_FILE = ".lock"
+PATH_FILE = ".path"  # in each entry: the path to hand out (relative to the entry)
+
+
+class InputCache:
+    """On-disk cache of (extracted) input, keyed on the S3 bucket, key and ETag.
+
+    Each entry is a dir inside cache_dir. Entries are filled in a temporary dir that
+    is renamed once complete, so a (partially) failed download never shows up as
+    entry. Tasks pin the entry they use (acquire/release); once the cache exceeds
+    max_size, the least recently used entries that are not pinned are evicted.
+
+    The cache dir may be shared by several worker processes (e.g. --run-batch), so
+    its state is kept on disk: a process pins an entry by holding a shared (flock)
+    lock on the entry's .path file, which eviction must lock exclusively first, and
+    the mtime of an entry marks its last use. A lock file makes looking up and
+    pinning (or evicting) an entry atomic across the processes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        """Remove what interrupted fills left behind
+
+        Params:
+            cache_dir: where to keep the cached entries
+            max_size: size budget of the cache in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._fill_locks: Dict[str, threading.Lock] = {}  # one fill per entry at once
+        self._fill_waiters: Dict[str, int] = {}  # entry -> tasks using its fill lock
+        self._pins: Dict[str, int] = {}  # entry -> number of tasks (here) using it
+        self._pin_files: Dict[str, IO] = {}  # entry -> its locked .path file
+        self._sizes: Dict[str, int] = {}  # entry -> size in bytes (seen so far)
+        os.makedirs(cache_dir, exist_ok=True)
+        with _locked(self._lock_file):
+            for entry in os.listdir(cache_dir):
+                path = os.path.join(cache_dir, entry)
+                # fills of other (live) processes keep their tmp dir locked
+                if entry.endswith(TMP_DIR_SUFFIX) and _try_lock(path):
+                    shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Input cache {cache_dir} holds {len(self._entries())} entries")
+
+    @property
+    def _lock_file(self) -> str:
+        return os.path.join(self.cache_dir, LOCK_FILE)
+
+    def acquire(
+        self, bucket: str, key: str, etag: str, fill: Callable[[str], Optional[str]]
+    ) -> Tuple[Optional[str], bool]:
+        """Return the cached path for bucket/key/etag and pin it until release().
+
+        On a cache miss, fill(dir) is called to populate dir; it should return the
+        path (within dir) to hand out, or None on failure. Concurrent tasks asking
+        for the same entry wait for a single fill.
+        Returns:
+            the path (None on failure) and whether it was a cache hit
+        """
+        entry = entry_name(bucket, key, etag)
+        entry_dir = os.path.join(self.cache_dir, entry)
+        with self._lock:
+            fill_lock = self._fill_locks.setdefault(entry, threading.Lock())
+            self._fill_waiters[entry] = self._fill_waiters.get(entry, 0) + 1
+        try:
+            with fill_lock:
+                with _locked(self._lock_file):  # so it's not evicted before it's pinned
+                    cache_hit = os.path.isdir(entry_dir)
+                    if cache_hit:
+                        self._pin(entry)
+                if not cache_hit and not self._fill(entry, fill):
+                    return None, False
+        finally:
+            with self._lock:
+                self._fill_waiters[entry] -= 1
+                if not self._fill_waiters[entry]:  # no other task is (about) to fill
+                    del self._fill_waiters[entry]
+                    del self._fill_locks[entry]
+        now = time_ns()  # finer than the (coarse) clock of the file system
+        os.utime(entry_dir, ns=(now, now))  # marks the last use, for all processes
+        path = self._read_path(entry)
+        logger.info(f"Input cache {'hit' if cache_hit else 'miss'}: {path}")
+        self._evict()
+        return path, cache_hit
+
+    def release(self, path: str) -> None:
+        """Unpin the entry containing path, so it can be evicted again"""
+        entry = self.entry_of(path)
+        if entry is None:
+            return
+        with self._lock:
+            self._pins[entry] = self._pins.get(entry, 1) - 1
+            if self._pins[entry] <= 0:
+                del self._pins[entry]
+                pin_file = self._pin_files.pop(entry, None)
+                if pin_file:
+                    pin_file.close()  # also releases the lock
+        self._evict()
+
+    def entry_of(self, path: str) -> Optional[str]:
+        """Return the entry that path belongs to, None if it is not in the cache"""
+        rel_path = os.path.relpath(
+            os.path.abspath(path), os.path.abspath(self.cache_dir)
+        )
+        if rel_path.startswith(os.pardir) or rel_path == os.curdir:
+            return None
+        return rel_path.split(os.sep)[0]
+
+    def _fill(self, entry: str, fill: Callable[[str], Optional[str]]) -> bool:
+        tmp_dir = os.path.join(
+            self.cache_dir, f"{entry}.{uuid.uuid4().hex}{TMP_DIR_SUFFIX}"
+        )
+        os.makedirs(tmp_dir)
+        tmp_dir_fd = os.open(tmp_dir, os.O_RDONLY)
+        try:
+            fcntl.flock(tmp_dir_fd, fcntl.LOCK_EX)  # see __init__
+            path = fill(tmp_dir)
+            if path is None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return False
+            # remember which path to hand out, relative to the entry dir
+            with open(os.path.join(tmp_dir, PATH_FILE), "w") as f:
+                f.write(os.path.relpath(path, tmp_dir))
+            with _locked(self._lock_file):
+                try:
+                    os.rename(tmp_dir, os.path.join(self.cache_dir, entry))
+                except OSError:  # filled in the meantime (by another process)
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                self._pin(entry)
+        finally:
+            os.close(tmp_dir_fd)
+        return True
+
+    def _read_path(self, entry: str) -> str:
+        entry_dir = os.path.join(self.cache_dir, entry)
+        with open(os.path.join(entry_dir, PATH_FILE)) as f:
+            return os.path.normpath(os.path.join(entry_dir, f.read()))
+
+    def _pin(self, entry: str) -> None:
+        """Pin entry, with the lock file held (i.e. it cannot be evicted meanwhile)"""
+        with self._lock:
+            if entry not in self._pin_files:
+                f = open(os.path.join(self.cache_dir, entry, PATH_FILE))
+                fcntl.flock(f, fcntl.LOCK_SH)  # held until the last release()
+                self._pin_files[entry] = f
+            self._pins[entry] = self._pins.get(entry, 0) + 1
+
+    def _entries(self) -> Dict[str, float]:
+        """Return the entries on disk, with the time of their last use"""
+        entries = {}
+        for entry in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, entry)
+            if entry.endswith(TMP_DIR_SUFFIX) or not os.path.isdir(path):
+                continue
+            try:
+                entries[entry] = os.path.getmtime(path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+        return entries
+
+    def _evict(self) -> None:
+        """Remove least recently used, unpinned entries until within max_size"""
+        to_evict = []
+        with _locked(self._lock_file), self._lock:
+            entries = self._entries()
+            self._sizes = {
+                entry: self._sizes.get(entry)
+                or _dir_size(os.path.join(self.cache_dir, entry))
+                for entry in entries
+            }
+            total = sum(self._sizes.values())
+            candidates = sorted(
+                (e for e in entries if e not in self._pins), key=entries.__getitem__
+            )
+            for entry in candidates:
+                if total <= self.max_size:
+                    break
+                entry_dir = os.path.join(self.cache_dir, entry)
+                if not _try_lock(os.path.join(entry_dir, PATH_FILE)):
+                    continue  # pinned by another process
+                total -= self._sizes.pop(entry)
+                # move it out of the way first, so the entry can be refilled directly
+                evicted_dir = os.path.join(
+                    self.cache_dir, f"{entry}.{uuid.uuid4().hex}{TMP_DIR_SUFFIX}"
+                )
+                os.rename(entry_dir, evicted_dir)
+                to_evict.append(evicted_dir)
+        for evicted_dir in to_evict:
+            logger.info(f"Evicting {evicted_dir} from the input cache")
+            shutil.rmtree(evicted_dir, ignore_errors=True)
+
+
+def entry_name(bucket: str, key: str, etag: str) -> str:
+    """Return the name of the cache entry for bucket/key/etag"""
+    return hashlib.sha256(f"{bucket}/{key}/{etag}".encode()).hexdigest()
+
+
+@contextmanager
+def _locked(lock_file: str) -> Iterator[None]:
+    """Hold an exclusive lock, shared by all processes, during the with-block"""
+    with open(lock_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _try_lock(path: str) -> bool:
+    """Return whether no process holds a lock on path (a file or dir)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)  # also releases the lock
+    return True
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    )
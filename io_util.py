@@ -1,31 +1,73 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import json
 import logging
 import os
 from pathlib import Path
 import shutil
 import tarfile
-from time import time
-from typing import Dict, List
+import threading
+from time import sleep, time
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Sequence, Tuple
 
+from archive_codecs import (
+    ArchiveFormat,
+    ExtractionReport,
+    archive_format_of,
+    extract_archive,
+    get_archive_format,
+    strip_archive_extension,
+    write_archive,
+)
 from dane import Document
 from dane.config import cfg
-from dane.s3_util import S3Store, parse_s3_uri, validate_s3_uri
+from disk_budget import DiskBudget
+from feature_writers import FeatureFormat, get_feature_format
+from input_cache import InputCache
+from metrics import EXTRACTED_BYTES, TRANSFERRED_BYTES, timed
 from models import (
+    INPUT_MEMBER_PATTERNS,
     OutputType,
     Provenance,
     ThisWorkerInput,
 )
+from stage_journal import StageJournal
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
 
 
 logger = logging.getLogger(__name__)
 INPUT_GENERATOR_TASK_KEY = "SOME_KEY"
 OUTPUT_FILE_BASE_NAME = "base_name"
-TAR_GZ_EXTENSION = ".tar.gz"
+OUTPUT_LAYOUT_ARCHIVE = "archive"  # all output in one archive (default)
+OUTPUT_LAYOUT_OBJECTS = "objects"  # each output file as object, plus a manifest
+OUTPUT_LAYOUTS = [OUTPUT_LAYOUT_ARCHIVE, OUTPUT_LAYOUT_OBJECTS]
+MANIFEST_EXTENSION = ".manifest.json"
+MB = 1024 * 1024
+S3_MIN_PART_SIZE = 5 * MB  # S3 minimum for all but the last part of an upload
+S3_DEFAULT_PART_SIZE = 8 * MB
+S3_DEFAULT_MAX_CONCURRENCY = 4  # parts transferred in parallel
+S3_DEFAULT_MAX_POOL_CONNECTIONS = 16  # connections per S3 endpoint
 # specify output types to upload to S3
 S3_OUTPUT_TYPES: List[OutputType] = [
     # TODO: add any output types
     OutputType.PROVENANCE,
     OutputType.FOOBAR,
+    OutputType.FEATURES,
 ]
+# NOTE: boto3 (also imported by dane.s3_util) takes long to import, so it is only
+# imported once S3 is used, keeping the start up time of the worker low
+# S3 clients shared by all tasks, see get_s3_client()
+_s3_clients: Dict[Tuple[Optional[str], int, bool], Any] = {}
+_s3_clients_lock = threading.Lock()
+_input_cache: Optional[InputCache] = None  # see get_input_cache()
+_input_cache_lock = threading.Lock()
+_disk_budget: Optional[DiskBudget] = None  # see get_disk_budget()
+_disk_budget_lock = threading.Lock()
+_stage_journal: Optional[StageJournal] = None  # see get_stage_journal()
+_stage_journal_lock = threading.Lock()
 
 
 def validate_data_dirs() -> bool:
@@ -57,8 +99,7 @@ def generate_output_dirs(source_id: str) -> Dict[str, str]:
     output_dirs = {}
     for output_type in OutputType:
         output_dir = os.path.join(base_output_dir, output_type.value)
-        if not os.path.isdir(output_dir):
-            os.makedirs(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
         output_dirs[output_type.value] = output_dir
     return output_dirs
 
@@ -72,13 +113,55 @@ def get_base_output_dir(source_id: str = "") -> str:
 
 
 def get_archive_file_path(source_id: str) -> str:
-    """Return file name of the final tar.gz that will be uploaded to S3"""
+    """Return file name of the final archive (e.g. tar.gz) that will be uploaded to S3"""
     return os.path.join(
         get_base_output_dir(source_id),
-        f"{OUTPUT_FILE_BASE_NAME}__{source_id}{TAR_GZ_EXTENSION}",
+        f"{OUTPUT_FILE_BASE_NAME}__{source_id}{get_output_archive_format().extension}",
     )
 
 
+def get_output_archive_format() -> ArchiveFormat:
+    """Return the configured OUTPUT.ARCHIVE_FORMAT"""
+    return get_archive_format(cfg.OUTPUT.get("ARCHIVE_FORMAT", "gzip"))
+
+
+def get_output_feature_format() -> FeatureFormat:
+    """Return the configured OUTPUT.FEATURE_FORMAT"""
+    return get_feature_format(cfg.OUTPUT.get("FEATURE_FORMAT", "npy"))
+
+
+def get_output_archive_settings() -> Dict[str, Any]:
+    """Return how the output archive is compressed (e.g. to record in provenance)"""
+    return {
+        "archive_format": get_output_archive_format().name,
+        "compression_level": cfg.OUTPUT.get("COMPRESSION_LEVEL", 6),
+        "compression_threads": cfg.OUTPUT.get("COMPRESSION_THREADS", 1),
+    }
+
+
+def write_output_archive(fileobj, file_list: List[str]) -> None:
+    """Write the file_list as archive (in OUTPUT.ARCHIVE_FORMAT) to fileobj"""
+    write_archive(
+        fileobj,
+        file_list,
+        get_output_archive_format(),
+        cfg.OUTPUT.get("COMPRESSION_LEVEL", 6),
+        cfg.OUTPUT.get("COMPRESSION_THREADS", 1),
+    )
+
+
+def create_output_archive(archive_path: str, file_list: List[str]) -> bool:
+    """Write the file_list as archive (in OUTPUT.ARCHIVE_FORMAT) to archive_path"""
+    logger.info(f"Archiving {len(file_list)} items into {archive_path}")
+    try:
+        with open(archive_path, "wb") as f:
+            write_output_archive(f, file_list)
+    except Exception:
+        logger.exception(f"Failed to create archive: {archive_path}")
+        return False
+    return True
+
+
 def get_output_file_name(source_id: str, output_type: OutputType) -> str:
     """Return file name for specified OutputType"""
     # TODO: specify output file name based on source_id and output_type
@@ -88,6 +171,11 @@ def get_output_file_name(source_id: str, output_type: OutputType) -> str:
             output_file_name = "provenance.json"
         case OutputType.FOOBAR:
             output_file_name = f"{source_id}_foobar.txt"
+        case OutputType.PROFILE:
+            output_file_name = f"{source_id}.prof"  # e.g. python -m pstats <file>
+        case OutputType.FEATURES:
+            extension = get_output_feature_format().extension
+            output_file_name = f"{source_id}_features{extension}"
         case _:
             output_file_name = ""
     return output_file_name
@@ -110,33 +198,70 @@ def get_s3_base_uri(source_id: str) -> str:
     return f"s3://{uri}"
 
 
+def get_output_layout() -> str:
+    """Return the configured OUTPUT.LAYOUT (see OUTPUT_LAYOUTS)"""
+    return cfg.OUTPUT.get("LAYOUT", OUTPUT_LAYOUT_ARCHIVE)
+
+
+def get_s3_output_prefix(source_id: str) -> str:
+    """Return the prefix of all output of source_id within the configured S3 bucket.
+
+    e.g. assets/<source_id>
+    """
+    return os.path.join(
+        cfg.OUTPUT.S3_FOLDER_IN_BUCKET,
+        source_id,  # assets/<program ID>__<carrier ID>
+    )
+
+
+def get_s3_output_file_key(source_id: str) -> str:
+    """Return the key of the output archive (or, with the objects layout, of the
+    manifest) within the configured S3 bucket.
+
+    e.g. assets/<source_id>/<basename>__<source_id>.tar.gz
+    or assets/<source_id>/<basename>__<source_id>.manifest.json
+    """
+    if get_output_layout() == OUTPUT_LAYOUT_OBJECTS:
+        file_name = f"{OUTPUT_FILE_BASE_NAME}__{source_id}{MANIFEST_EXTENSION}"
+    else:
+        file_name = os.path.basename(get_archive_file_path(source_id))
+    return os.path.join(get_s3_output_prefix(source_id), file_name)
+
+
 def get_s3_output_file_uri(source_id: str) -> str:
-    """Return entire output uri for configured S3 folder.
+    """Return entire output uri (of the archive or manifest) for configured S3 folder.
 
     e.g. s3://<bucket>/assets/<source_id>/<basename>__<source_id>.tar.gz
     """
-    return f"{get_s3_base_uri(source_id)}/{get_archive_file_path(source_id)}"
+    return f"s3://{cfg.OUTPUT.S3_BUCKET}/{get_s3_output_file_key(source_id)}"
 
 
 def get_source_id_from_tar(input_path: str) -> str:
     """Parse filename and return source_id.
 
     NOTE: only use for test run & unit test with input that points to tar file!
-    e.g. ./data/input-files/<basename>__testob.tar.gz"""
-    fn = os.path.basename(input_path)
-    tmp = fn.split("__")
-    source_id = tmp[1][: -len(TAR_GZ_EXTENSION)]
+    e.g. ./data/input-files/<basename>__testob.tar.gz (or another archive format)"""
+    source_id = source_id_from_s3_uri(input_path)  # same naming as in S3
     logger.info(f"Using source_id: {source_id}")
     return source_id
 
 
+def source_id_from_local_path(input_path: str) -> str:
+    """Return the source_id of local input: an archive (named like in S3), a dir
+    with extracted input (named after the source_id) or a file in such a dir"""
+    if archive_format_of(input_path):
+        return get_source_id_from_tar(input_path)
+    if os.path.isdir(input_path):
+        return os.path.basename(os.path.normpath(input_path))
+    return os.path.basename(os.path.dirname(input_path))
+
+
 def source_id_from_s3_uri(s3_uri: str) -> str:
     """Parse s3_uri and return source_id.
 
     e.g. s3://<bucket>/assets/<source_id>/<basename>__<source_id>.tar.gz
     """
-    fn = os.path.basename(s3_uri)
-    fn = fn.replace(".tar.gz", "")
+    fn = strip_archive_extension(os.path.basename(s3_uri))
     source_id = "__".join(fn.split("__")[1:])
     return source_id
 
@@ -197,31 +322,451 @@ def _validate_transfer_config() -> bool:
     return True
 
 
-def transfer_output(source_id: str) -> bool:
-    """compress all desired output dirs into a single tar and upload it to S3"""
+def get_s3_client(settings):
+    """Return the S3 client for the INPUT or OUTPUT settings, shared by all tasks.
+
+    Clients are created once per S3_ENDPOINT_URL (and pool settings), so tasks
+    don't pay for a new session, credential resolution and TLS connections.
+    S3_MAX_POOL_CONNECTIONS sets how many connections are kept open to the endpoint
+    (for all concurrent tasks and parts together), S3_TCP_KEEPALIVE keeps idle
+    connections alive. The clients themselves are thread-safe."""
+    key = (
+        settings.S3_ENDPOINT_URL,
+        settings.get("S3_MAX_POOL_CONNECTIONS", S3_DEFAULT_MAX_POOL_CONNECTIONS),
+        settings.get("S3_TCP_KEEPALIVE", True),
+    )
+    with _s3_clients_lock:
+        if key not in _s3_clients:
+            import boto3
+            from botocore.config import Config
+
+            endpoint_url, max_pool_connections, tcp_keepalive = key
+            logger.info(f"Creating S3 client for {endpoint_url}")
+            # boto3's default session is not thread-safe, so use a session per client
+            _s3_clients[key] = boto3.session.Session().client(
+                "s3",
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    tcp_keepalive=tcp_keepalive,
+                ),
+            )
+        return _s3_clients[key]
+
+
+def transfer_output(source_id: str, metadata: Optional[Dict[str, str]] = None) -> bool:
+    """compress all desired output dirs into a single tar and upload it to S3.
+    With OUTPUT.LAYOUT "objects", each output file is uploaded as separate object
+    instead, listed in a manifest (see upload_output_objects)
+
+    The (optional) metadata is stored as S3 user metadata of the archive/manifest"""
     output_dir = get_base_output_dir(source_id)
     logger.info(f"Transferring {output_dir} to S3 (asset={source_id})")
     if not _validate_transfer_config():
         return False
 
-    s3 = S3Store(cfg.OUTPUT.S3_ENDPOINT_URL)
-    file_list = [os.path.join(output_dir, ot.value) for ot in S3_OUTPUT_TYPES]
+    client = get_s3_client(cfg.OUTPUT)
+    output_types = S3_OUTPUT_TYPES.copy()
+    if cfg.OUTPUT.get("UPLOAD_PROFILE", False) and os.path.exists(
+        get_output_file_path(source_id, OutputType.PROFILE)
+    ):
+        output_types.append(OutputType.PROFILE)
+    file_list = [os.path.join(output_dir, ot.value) for ot in output_types]
     tar_file = get_archive_file_path(source_id)
+    s3_key = get_s3_output_file_key(source_id)
+    transfer_config = get_transfer_config(cfg.OUTPUT)
 
-    success = s3.transfer_to_s3(
-        cfg.OUTPUT.S3_BUCKET,
-        os.path.join(
-            cfg.OUTPUT.S3_FOLDER_IN_BUCKET, source_id
-        ),  # assets/<program ID>__<carrier ID>
-        file_list,  # this list of subdirs will be compressed into the tar below
-        tar_file,  # this file will be uploaded
-    )
+    if get_output_layout() == OUTPUT_LAYOUT_OBJECTS:
+        with timed("objects_upload"):
+            success = upload_output_objects(
+                client,
+                cfg.OUTPUT.S3_BUCKET,
+                get_s3_output_prefix(source_id),
+                s3_key,
+                file_list,
+                transfer_config,
+                metadata,
+            )
+        if not success:
+            logger.error(f"Failed to upload the output of {source_id}")
+        return success
+
+    with timed("tar_upload"):
+        if cfg.OUTPUT.get("STREAM_UPLOAD", False):
+            # the archive is compressed straight into the upload, never written to disk
+            success = stream_tar_to_s3(
+                client,
+                cfg.OUTPUT.S3_BUCKET,
+                s3_key,
+                file_list,
+                transfer_config,
+                metadata,
+            )
+        else:
+            # this list of subdirs will be compressed into the tar, which is uploaded
+            success = create_output_archive(tar_file, file_list) and upload_s3_object(
+                client,
+                cfg.OUTPUT.S3_BUCKET,
+                s3_key,
+                tar_file,
+                transfer_config,
+                metadata,
+            )
     if not success:
         logger.error(f"Failed to upload: {tar_file}")
         return False
     return True
 
 
+def get_transfer_config(settings) -> "TransferConfig":
+    """Return how to transfer objects, based on the INPUT or OUTPUT settings.
+
+    Objects larger than MULTIPART_CHUNKSIZE_MB are split in parts of that size,
+    which are transferred (ranged GETs or multipart PUTs) by MAX_CONCURRENCY threads
+    in parallel. MAX_BANDWIDTH_MB caps the MB/s used by a single task (0: no cap)"""
+    part_size = settings.get("MULTIPART_CHUNKSIZE_MB", S3_DEFAULT_PART_SIZE // MB) * MB
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=settings.get("MAX_CONCURRENCY", S3_DEFAULT_MAX_CONCURRENCY),
+        max_bandwidth=settings.get("MAX_BANDWIDTH_MB", 0) * MB or None,
+    )
+
+
+def download_s3_object(
+    client,
+    bucket: str,
+    object_name: str,
+    output_folder: str,
+    transfer_config: "TransferConfig",
+) -> bool:
+    """Download bucket/object_name into output_folder, in parallel parts if large"""
+    logger.info(f"Downloading {bucket}:{object_name} into {output_folder}")
+    os.makedirs(output_folder, exist_ok=True)
+    output_file = os.path.join(output_folder, os.path.basename(object_name))
+    try:
+        client.download_file(
+            Bucket=bucket,
+            Key=object_name,
+            Filename=output_file,
+            Config=transfer_config,
+            Callback=lambda n: TRANSFERRED_BYTES.inc(n, direction="download"),
+        )
+    except Exception:
+        logger.exception(f"Failed to download {object_name}")
+        return False
+    return True
+
+
+def upload_s3_object(
+    client,
+    bucket: str,
+    key: str,
+    file_path: str,
+    transfer_config: "TransferConfig",
+    metadata: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Upload file_path to bucket/key, as a parallel multipart upload if large"""
+    logger.info(f"Uploading {file_path} to {bucket}:{key}")
+    try:
+        client.upload_file(
+            Filename=file_path,
+            Bucket=bucket,
+            Key=key,
+            Config=transfer_config,
+            ExtraArgs={"Metadata": metadata} if metadata else None,
+            Callback=lambda n: TRANSFERRED_BYTES.inc(n, direction="upload"),
+        )
+    except Exception:
+        logger.exception(f"Failed to upload {file_path}")
+        return False
+    return True
+
+
+def stream_tar_to_s3(
+    client,
+    bucket: str,
+    key: str,
+    file_list: List[str],
+    transfer_config: Optional["TransferConfig"] = None,
+    metadata: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Compress the file_list into an archive (in OUTPUT.ARCHIVE_FORMAT) that is
+    directly uploaded to bucket/key.
+
+    Uses an S3 multipart upload, so only the parts being uploaded are kept in memory
+    and compression continues while the previous parts are being uploaded"""
+    logger.info(f"Streaming {len(file_list)} items as archive into {bucket}:{key}")
+    try:
+        writer = S3MultipartUploadWriter(
+            client,
+            bucket,
+            key,
+            transfer_config or get_transfer_config(cfg.OUTPUT),
+            metadata,
+        )
+    except Exception:
+        logger.exception(f"Failed to start multipart upload of {key}")
+        return False
+    try:
+        write_output_archive(writer, file_list)
+        writer.complete()
+    except Exception:
+        logger.exception(f"Failed to stream archive to {key}")
+        writer.abort()
+        return False
+    return True
+
+
+def upload_output_objects(
+    client,
+    bucket: str,
+    prefix: str,
+    manifest_key: str,
+    dir_list: List[str],
+    transfer_config: Optional["TransferConfig"] = None,
+    metadata: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Upload each file in the dirs of dir_list (in parallel) as separate object,
+    under prefix/<dir name>/, then upload a JSON manifest to manifest_key.
+
+    The manifest lists the key, size and SHA-256 checksum of each object, so
+    consumers can fetch only the output (types) they need. It's uploaded last, so
+    its existence means all objects are complete. The (optional) metadata is stored
+    as S3 user metadata of the manifest"""
+    transfer_config = transfer_config or get_transfer_config(cfg.OUTPUT)
+    files = []  # (local path, key)
+    for output_dir in dir_list:
+        base_dir = os.path.dirname(output_dir)
+        for root, _, file_names in os.walk(output_dir):
+            for file_name in sorted(file_names):
+                file_path = os.path.join(root, file_name)
+                rel_path = os.path.relpath(file_path, base_dir)
+                files.append((file_path, f"{prefix}/{Path(rel_path).as_posix()}"))
+    logger.info(f"Uploading {len(files)} output objects to {bucket}:{prefix}")
+
+    def upload(file_path: str, key: str) -> Optional[Dict[str, Any]]:
+        if not upload_s3_object(client, bucket, key, file_path, transfer_config):
+            return None
+        return {
+            "key": key,
+            "size": os.path.getsize(file_path),
+            "sha256": _sha256_of_file(file_path),
+        }
+
+    # each (large) file is itself uploaded in max_concurrency parallel parts
+    with ThreadPoolExecutor(
+        max_workers=transfer_config.max_concurrency,
+        thread_name_prefix="output-upload",
+    ) as executor:
+        entries = list(executor.map(lambda f: upload(*f), files))
+    if None in entries:
+        return False
+
+    manifest = {"bucket": bucket, "prefix": prefix, "objects": entries}
+    try:
+        client.put_object(
+            Bucket=bucket,
+            Key=manifest_key,
+            Body=json.dumps(manifest, indent=2).encode(),
+            ContentType="application/json",
+            Metadata=metadata or {},
+        )
+    except Exception:
+        logger.exception(f"Failed to upload manifest {manifest_key}")
+        return False
+    return True
+
+
+def _sha256_of_file(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(MB):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class BandwidthLimiter:
+    """Caps the throughput of the (possibly multi-threaded) transfer using it"""
+
+    def __init__(self, max_bandwidth: Optional[int]):
+        self.max_bandwidth = max_bandwidth  # bytes/s, None means unlimited
+        self._start = time()
+        self._transferred = 0
+        self._lock = threading.Lock()
+
+    def consume(self, num_bytes: int) -> None:
+        """Register num_bytes as transferred, sleep if that exceeds the cap"""
+        if not self.max_bandwidth:
+            return
+        with self._lock:
+            self._transferred += num_bytes
+            ahead = self._transferred / self.max_bandwidth - (time() - self._start)
+        if ahead > 0:
+            sleep(ahead)
+
+
+class S3MultipartUploadWriter:
+    """Write-only stream that uploads everything written to it to bucket/key.
+
+    Written data is cut into parts (of the transfer_config's multipart_chunksize),
+    which are uploaded in background threads (at most max_concurrency at a time,
+    which also bounds the memory used) as part of an S3 multipart upload.
+    Call complete() when done, or abort() when the upload should be discarded.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        transfer_config: "TransferConfig",
+        metadata: Optional[Dict[str, str]] = None,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(transfer_config.multipart_chunksize, S3_MIN_PART_SIZE)
+        max_concurrency = transfer_config.max_concurrency
+        self._limiter = BandwidthLimiter(transfer_config.max_bandwidth)
+        self._upload_id = client.create_multipart_upload(
+            Bucket=bucket, Key=key, Metadata=metadata or {}
+        )["UploadId"]
+        self._buffer = bytearray()
+        self._parts: List[Future] = []
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="s3-part"
+        )
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._submit_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def complete(self) -> None:
+        """Upload the remaining data, then wait for all parts and finish the upload"""
+        if self._buffer or not self._parts:  # S3 requires at least one part
+            self._submit_part(bytes(self._buffer))
+            self._buffer.clear()
+        parts = [f.result() for f in self._parts]  # raises if a part failed
+        self._executor.shutdown()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        logger.info(f"Uploaded {len(parts)} parts to {self.bucket}:{self.key}")
+
+    def abort(self) -> None:
+        """Discard the upload, including any parts uploaded so far"""
+        self._executor.shutdown(cancel_futures=True)
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+        except Exception:
+            logger.exception(f"Failed to abort multipart upload of {self.key}")
+
+    def _submit_part(self, data: bytes) -> None:
+        # stop early if one of the previous parts already failed
+        for f in self._parts:
+            if f.done() and f.exception():
+                raise f.exception()  # type: ignore
+        self._slots.acquire()  # blocks while max_concurrency parts are in flight
+        self._parts.append(
+            self._executor.submit(self._upload_part, len(self._parts) + 1, data)
+        )
+
+    def _upload_part(self, part_number: int, data: bytes) -> Dict[str, Any]:
+        try:
+            self._limiter.consume(len(data))
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=data,
+            )
+            TRANSFERRED_BYTES.inc(len(data), direction="upload")
+            return {"ETag": response["ETag"], "PartNumber": part_number}
+        finally:
+            self._slots.release()
+
+
+class S3RangedReader:
+    """Read-only stream over bucket/key, fetched as parallel ranged GETs.
+
+    The object is requested in parts (of the transfer_config's multipart_chunksize);
+    up to max_concurrency parts are fetched ahead of the reader in background
+    threads, and returned by read() in order.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        transfer_config: "TransferConfig",
+        size: Optional[int] = None,  # requested (HEAD) if not known yet
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = transfer_config.multipart_chunksize
+        self.size = (
+            size
+            if size is not None
+            else client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        )
+        self._limiter = BandwidthLimiter(transfer_config.max_bandwidth)
+        self._offsets = iter(range(0, self.size, self.part_size))
+        self._pending: Deque[Future] = deque()
+        self._current = memoryview(b"")
+        self._executor = ThreadPoolExecutor(
+            max_workers=transfer_config.max_concurrency, thread_name_prefix="s3-range"
+        )
+        for _ in range(transfer_config.max_concurrency):
+            self._request_next_part()
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while size != 0:
+            if not self._current:
+                if not self._pending:
+                    break  # end of the object
+                self._current = memoryview(self._pending.popleft().result())
+                self._request_next_part()
+            n = len(self._current) if size < 0 else min(size, len(self._current))
+            chunks.append(self._current[:n].tobytes())
+            self._current = self._current[n:]
+            size = size - n if size > 0 else size
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+    def _request_next_part(self) -> None:
+        offset = next(self._offsets, None)
+        if offset is not None:
+            self._pending.append(self._executor.submit(self._get_part, offset))
+
+    def _get_part(self, offset: int) -> bytes:
+        last = min(offset + self.part_size, self.size) - 1
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{last}"
+        )["Body"]
+        data = body.read()
+        TRANSFERRED_BYTES.inc(len(data), direction="download")
+        self._limiter.consume(len(data))
+        return data
+
+
 def get_download_dir() -> str:
     """Return general location where input should be downloaded in."""
     return os.path.join(cfg.FILE_SYSTEM.BASE_MOUNT, cfg.FILE_SYSTEM.INPUT_DIR)
@@ -236,20 +781,36 @@ def delete_input_file(input_file: str, source_id: str, actually_delete: bool) ->
     """Delete specified input archive + corresponding file structure, report success"""
     # TODO: refactor
     logger.info(f"Verifying deletion of input file: {input_file}")
+    input_cache = get_input_cache()
+    if input_cache and input_cache.entry_of(input_file):
+        logger.info("Input is kept in the input cache, skipping deletion")
+        return True
     if actually_delete is False:
         logger.info("Configured to leave the input alone, skipping deletion")
         return True
 
-    # first remove the input file
+    # first remove the input file, or the dir the input archive was extracted in
     try:
-        os.remove(input_file)
-        logger.info(f"Deleted input tar file: {input_file}")
+        if os.path.isdir(input_file):
+            shutil.rmtree(input_file)
+            logger.info(f"Deleted extracted input dir: {input_file}")
+        else:
+            os.remove(input_file)
+            logger.info(f"Deleted input tar file: {input_file}")
     except OSError:
         logger.exception("Could not delete input file")
         return False
 
     # now remove the folders that were extracted from the input tar file
+    _delete_extracted_input_dirs(source_id)
+    return True  # return True even if empty dirs were not removed
+
+
+def _delete_extracted_input_dirs(source_id: str) -> None:
+    """Remove the (remaining) dirs an input archive was extracted in"""
     base_input_dir = get_base_input_dir(source_id)
+    if not os.path.exists(base_input_dir):
+        return
     try:
         for root, dirs, files in os.walk(base_input_dir):
             for d in dirs:
@@ -264,10 +825,10 @@ def delete_input_file(input_file: str, source_id: str, actually_delete: bool) ->
     except FileNotFoundError:
         logger.exception("FileNotFoundError while removing empty input file dirs")
 
-    return True  # return True even if empty dirs were not removed
-
 
-def obtain_input_file(s3_uri: str) -> ThisWorkerInput:
+def obtain_input_file(
+    s3_uri: str, etag: str = "", size: Optional[int] = None
+) -> ThisWorkerInput:
     """Obtain input from s3_uri, report in the form of ThisWorkerInput
 
     NOTE: this function now assumes that the s3_uri is in the form of:
@@ -275,7 +836,11 @@ def obtain_input_file(s3_uri: str) -> ThisWorkerInput:
     However, if the worker's input is a source video, it will more likely be like:
     s3://dane-asset-staging-gb/assets/2101608170158176431__NOS_JOURNAAL_-WON01513227.mp4
     So TODO: make this more universal/configurable
+    The etag and size of the input object are requested (with one HEAD request),
+    unless they're passed in already. With INPUT.DISK_ADMISSION, the disk space of
+    a download is reserved first (not on an input cache hit, nothing is downloaded)
     """
+    from dane.s3_util import parse_s3_uri, validate_s3_uri
 
     if not validate_s3_uri(s3_uri):
         return ThisWorkerInput(500, f"Invalid S3 URI: {s3_uri}")
@@ -285,26 +850,50 @@ def obtain_input_file(s3_uri: str) -> ThisWorkerInput:
     output_folder = get_base_input_dir(source_id)
 
     # TODO download the content into get_download_dir()
-    s3 = S3Store(cfg.OUTPUT.S3_ENDPOINT_URL)
+    client = get_s3_client(cfg.INPUT)
     bucket, object_name = parse_s3_uri(s3_uri)
     logger.info(f"OBJECT NAME: {object_name}")
-    input_file_path = os.path.join(
-        get_download_dir(),
-        source_id,
-        os.path.basename(object_name),  # i.e. <input_base>__<source_id>.tar.gz
-    )
-    success = s3.download_file(bucket, object_name, output_folder)
-    if success:
-        if input_file_path.find(".tar.gz") != -1:
-            input_file_path = untar_input_file(input_file_path)
+    transfer_config = get_transfer_config(cfg.INPUT)
+    if not etag or size is None:
+        try:
+            etag, size = head_s3_object(client, bucket, object_name)
+        except Exception as e:
+            logger.exception(f"Failed to obtain the ETag and size of {object_name}")
+            return ThisWorkerInput(
+                404 if is_not_found(e) else 500, f"Could not request: {s3_uri}"
+            )
 
+    cache_hit = False
+    input_cache = get_input_cache()
+    download = AdmittedDownload(
+        client, bucket, object_name, transfer_config, size, not input_cache
+    )
+    if input_cache:
+        input_file_path, cache_hit = input_cache.acquire(
+            bucket, object_name, etag, download
+        )
+    else:
+        input_file_path = download(output_folder)
+    disk_reservation = download.disk_reservation
+    if not download.admitted:
+        return ThisWorkerInput(507, f"Insufficient disk space for: {s3_uri}")
+    if input_file_path:
         provenance = Provenance(
             activity_name="download",
             activity_description="Download input data",
             start_time_unix=start_time,
-            processing_time_ms=time() - start_time,
-            input_data={},
-            output_data={"file_path": input_file_path},
+            processing_time_ms=(time() - start_time) * 1000,
+            input_data={"s3_uri": s3_uri, "etag": etag},
+            parameters=(
+                {"member_patterns": get_input_member_patterns()}
+                if archive_format_of(object_name)
+                else {}
+            ),
+            output_data={
+                "file_path": input_file_path,
+                "cache_hit": cache_hit,
+                "archive_format": getattr(archive_format_of(object_name), "name", None),
+            },
         )
         return ThisWorkerInput(
             200,
@@ -312,11 +901,295 @@ def obtain_input_file(s3_uri: str) -> ThisWorkerInput:
             source_id_from_s3_uri(s3_uri),  # source_id
             input_file_path,  # locally downloaded .tar.gz
             provenance,
+            etag,
+            disk_reservation,
         )
+    release_disk_space(disk_reservation)
     logger.error("Failed to download input data from S3")
     return ThisWorkerInput(500, f"Failed to download: {s3_uri}")
 
 
+def obtain_local_input(input_path: str) -> ThisWorkerInput:
+    """Obtain local input (see source_id_from_local_path), report in the form of
+    ThisWorkerInput.
+
+    An archive is extracted into the input dir of its source_id (like input from
+    S3); extracted input is used in place, so it is never deleted"""
+    if not os.path.exists(input_path):
+        return ThisWorkerInput(404, f"Input not found: {input_path}")
+    source_id = source_id_from_local_path(input_path)
+    if not archive_format_of(input_path):
+        return ThisWorkerInput(
+            200,
+            f"Processing local input: {input_path}",
+            source_id,
+            input_path if os.path.isdir(input_path) else os.path.dirname(input_path),
+            None,  # no download provenance when using local file
+            keep_input=True,
+        )
+
+    start_time = time()
+    output_folder = get_base_input_dir(source_id)
+    os.makedirs(output_folder, exist_ok=True)
+    try:
+        with timed("untar"), open(input_path, "rb") as f:
+            report = extract_input_archive(
+                f,
+                output_folder,
+                archive_format_of(input_path),  # type: ignore
+                get_input_member_patterns(),
+            )
+    except Exception:
+        logger.exception(f"Failed to extract {input_path}")
+        return ThisWorkerInput(500, f"Failed to extract: {input_path}")
+    provenance = Provenance(
+        activity_name="extract",
+        activity_description="Extract local input archive",
+        start_time_unix=start_time,
+        processing_time_ms=(time() - start_time) * 1000,
+        input_data={"file_path": input_path},
+        parameters={"member_patterns": get_input_member_patterns()},
+        output_data={
+            "file_path": output_folder,
+            "skipped_members": len(report.skipped),
+            "skipped_bytes": report.skipped_bytes,
+        },
+    )
+    return ThisWorkerInput(
+        200,
+        f"Extracted local input: {input_path}",
+        source_id,
+        output_folder,
+        provenance,
+    )
+
+
+class AdmittedDownload:
+    """Downloads an S3 object into a folder (see fetch_s3_object), once the disk
+    space it needs is reserved (with INPUT.DISK_ADMISSION, see reserve_disk_space).
+
+    Only reserves when actually called, so not on an input cache hit"""
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        object_name: str,
+        transfer_config: "TransferConfig",
+        size: int,
+        keep_archive: bool = True,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.object_name = object_name
+        self.transfer_config = transfer_config
+        self.size = size
+        self.keep_archive = keep_archive
+        self.disk_reservation: Optional[str] = None
+        self.admitted = True  # False if there was no disk space
+
+    def __call__(self, output_folder: str) -> Optional[str]:
+        if get_disk_budget():
+            with timed("disk_admission"):
+                self.disk_reservation = reserve_disk_space(self.object_name, self.size)
+            self.admitted = self.disk_reservation is not None
+            if not self.admitted:
+                return None
+        return fetch_s3_object(
+            self.client,
+            self.bucket,
+            self.object_name,
+            output_folder,
+            self.transfer_config,
+            self.keep_archive,
+            self.size,
+        )
+
+
+def fetch_s3_object(
+    client,
+    bucket: str,
+    object_name: str,
+    output_folder: str,
+    transfer_config: "TransferConfig",
+    keep_archive: bool = True,
+    size: Optional[int] = None,
+) -> Optional[str]:
+    """Download bucket/object_name into output_folder, extracting it if it's a tar.gz
+    (size, if known, spares the streaming extraction a HEAD request)
+
+    Returns the local path of the input (None on failure): the downloaded file, or
+    the dir the archive was extracted in"""
+    input_file_path = os.path.join(
+        output_folder,
+        os.path.basename(object_name),  # i.e. <input_base>__<source_id>.tar.gz
+    )
+    is_archive = archive_format_of(input_file_path) is not None
+    if is_archive and cfg.INPUT.get("STREAM_EXTRACT", False):
+        # the archive itself is never written to disk; extraction overlaps download
+        with timed("download"):
+            if stream_untar_s3_object(
+                client, bucket, object_name, output_folder, transfer_config, size
+            ):
+                return output_folder
+        return None
+
+    with timed("download"):
+        if not download_s3_object(
+            client, bucket, object_name, output_folder, transfer_config
+        ):
+            return None
+    if is_archive:
+        with timed("untar"):
+            extracted_path = untar_input_file(
+                input_file_path, get_input_member_patterns()
+            )
+        if not keep_archive:
+            os.remove(input_file_path)
+        return extracted_path
+    return input_file_path
+
+
+def get_s3_output_metadata(source_id: str) -> Optional[Dict[str, str]]:
+    """Return the S3 user metadata of the output archive, None if it doesn't exist"""
+    client = get_s3_client(cfg.OUTPUT)
+    try:
+        return client.head_object(
+            Bucket=cfg.OUTPUT.S3_BUCKET, Key=get_s3_output_file_key(source_id)
+        )["Metadata"]
+    except Exception:  # mostly: the output does not exist (yet)
+        logger.info(f"No existing output found for {source_id}")
+        return None
+
+
+def get_input_info(s3_uri: str) -> Tuple[str, Optional[int]]:
+    """Return the ETag and size of the input at s3_uri, see get_s3_object_info"""
+    from dane.s3_util import parse_s3_uri
+
+    client = get_s3_client(cfg.INPUT)
+    bucket, object_name = parse_s3_uri(s3_uri)
+    return get_s3_object_info(client, bucket, object_name)
+
+
+def head_s3_object(client, bucket: str, object_name: str) -> Tuple[str, int]:
+    """Return the ETag and size of bucket/object_name, from a single HEAD request"""
+    head = client.head_object(Bucket=bucket, Key=object_name)
+    return head["ETag"].strip('"'), head["ContentLength"]
+
+
+def is_not_found(e: Exception) -> bool:
+    """Return whether e tells the S3 object (or its bucket) does not exist"""
+    from botocore.exceptions import ClientError
+
+    return isinstance(e, ClientError) and e.response["Error"]["Code"] in [
+        "NoSuchKey",
+        "NoSuchBucket",
+        "404",
+    ]
+
+
+def get_s3_object_info(
+    client, bucket: str, object_name: str
+) -> Tuple[str, Optional[int]]:
+    """Return the ETag and size of bucket/object_name, from a single HEAD request
+    (empty and None if they could not be obtained)"""
+    try:
+        return head_s3_object(client, bucket, object_name)
+    except Exception:
+        logger.exception(f"Failed to obtain the ETag and size of {object_name}")
+        return "", None
+
+
+def get_disk_budget() -> Optional[DiskBudget]:
+    """Return the node-wide disk budget (None if INPUT.DISK_ADMISSION=False)"""
+    global _disk_budget
+    if not cfg.INPUT.get("DISK_ADMISSION", False):
+        return None
+    with _disk_budget_lock:
+        if _disk_budget is None:
+            _disk_budget = DiskBudget(
+                os.path.join(
+                    cfg.FILE_SYSTEM.BASE_MOUNT,
+                    cfg.FILE_SYSTEM.get("RESERVATION_DIR", "disk-reservations"),
+                ),
+                cfg.FILE_SYSTEM.get("DISK_BUDGET_MB", 0) * MB,
+                cfg.FILE_SYSTEM.get("MIN_FREE_MB", 1024) * MB,
+            )
+        return _disk_budget
+
+
+def reserve_disk_space(object_name: str, size: int) -> Optional[str]:
+    """Reserve the disk space a task on object_name (of size bytes) is estimated to
+    need: the input size times INPUT.DISK_EXPANSION_FACTOR (input, extracted input and
+    output). Waits up to INPUT.DISK_WAIT_TIMEOUT_S for space to free up.
+
+    Returns the reservation, None if there's no space (or no disk budget)"""
+    disk_budget = get_disk_budget()
+    if disk_budget is None:
+        return None
+    footprint = int(size * cfg.INPUT.get("DISK_EXPANSION_FACTOR", 3.0))
+    logger.info(f"Reserving {footprint} bytes of disk space for {object_name}")
+    return disk_budget.reserve(footprint, cfg.INPUT.get("DISK_WAIT_TIMEOUT_S", 0))
+
+
+def release_disk_space(disk_reservation: Optional[str]) -> None:
+    """Release the disk space reserved by reserve_disk_space (if any)"""
+    disk_budget = get_disk_budget()
+    if disk_budget and disk_reservation:
+        disk_budget.release(disk_reservation)
+
+
+def get_input_cache_dir() -> str:
+    """Return where the input cache keeps the (extracted) input"""
+    return os.path.join(
+        cfg.FILE_SYSTEM.BASE_MOUNT, cfg.FILE_SYSTEM.get("CACHE_DIR", "input-cache")
+    )
+
+
+def get_model_dir() -> str:
+    """Return where the model artifacts are kept, one dir per model version"""
+    return os.path.join(
+        cfg.FILE_SYSTEM.BASE_MOUNT, cfg.FILE_SYSTEM.get("MODEL_DIR", "model")
+    )
+
+
+def get_input_cache() -> Optional[InputCache]:
+    """Return the input cache shared by all tasks (None if INPUT.CACHE_ENABLED=False)"""
+    global _input_cache
+    if not cfg.INPUT.get("CACHE_ENABLED", False):
+        return None
+    with _input_cache_lock:
+        if _input_cache is None:
+            _input_cache = InputCache(
+                get_input_cache_dir(), cfg.INPUT.get("CACHE_MAX_SIZE_MB", 10240) * MB
+            )
+        return _input_cache
+
+
+def get_stage_journal() -> Optional[StageJournal]:
+    """Return the stage journal shared by all tasks (None if
+    FILE_SYSTEM.STAGE_JOURNAL=False)"""
+    global _stage_journal
+    if not cfg.FILE_SYSTEM.get("STAGE_JOURNAL", False):
+        return None
+    with _stage_journal_lock:
+        if _stage_journal is None:
+            _stage_journal = StageJournal(
+                os.path.join(
+                    cfg.FILE_SYSTEM.BASE_MOUNT,
+                    cfg.FILE_SYSTEM.get("STAGE_JOURNAL_DIR", "stage-journal"),
+                )
+            )
+        return _stage_journal
+
+
+def release_input_file(input_file_path: str) -> None:
+    """Tell the input cache (if any) that a task no longer uses input_file_path"""
+    input_cache = get_input_cache()
+    if input_cache:
+        input_cache.release(input_file_path)
+
+
 def fetch_input_s3_uri(handler, doc: Document) -> str:
     logger.info("checking input")
     possibles = handler.searchResult(doc._id, INPUT_GENERATOR_TASK_KEY)
@@ -327,11 +1200,175 @@ def fetch_input_s3_uri(handler, doc: Document) -> str:
     return ""
 
 
-def untar_input_file(tar_file_path: str):
-    """Untar archive (.tar.gz) into the same dir"""
+def fetch_input_s3_uris(handler, doc_ids: List[str]) -> Dict[str, str]:
+    """Like fetch_input_s3_uri, for multiple documents in two index queries (instead
+    of two per document). Returns the s3_location per doc_id (if found)"""
+    # the INPUT_GENERATOR_TASK_KEY tasks of the documents...
+    tasks = handler.es.search(
+        index=handler.INDEX,
+        body={
+            "_source": ["role"],
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "has_parent": {
+                                "parent_type": "document",
+                                "query": {"ids": {"values": doc_ids}},
+                            }
+                        },
+                        {"match": {"task.key": INPUT_GENERATOR_TASK_KEY}},
+                    ]
+                }
+            },
+        },
+        size=len(doc_ids) * 10,
+    )["hits"]["hits"]
+    doc_of_task = {hit["_id"]: hit["_source"]["role"]["parent"] for hit in tasks}
+    if not doc_of_task:
+        return {}
+    # ...and their results
+    results = handler.es.search(
+        index=handler.INDEX,
+        body={
+            "_source": ["result.payload.s3_location", "role"],
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "has_parent": {
+                                "parent_type": "task",
+                                "query": {"ids": {"values": list(doc_of_task)}},
+                            }
+                        },
+                        {"exists": {"field": "result.generator.id"}},
+                    ]
+                }
+            },
+        },
+        size=len(doc_of_task) * 10,
+    )["hits"]["hits"]
+    s3_uris = {}
+    for hit in results:
+        payload = hit["_source"].get("result", {}).get("payload", {})
+        doc_id = doc_of_task.get(hit["_source"]["role"]["parent"])
+        if doc_id and payload.get("s3_location"):
+            s3_uris.setdefault(doc_id, payload["s3_location"])
+    logger.info(f"Found the input of {len(s3_uris)} of {len(doc_ids)} documents")
+    return s3_uris
+
+
+def warm_input_cache(s3_uri: str) -> None:
+    """Download (and extract) the input at s3_uri into the input cache, so the task
+    that needs it finds it there (only with INPUT.CACHE_ENABLED)"""
+    from dane.s3_util import parse_s3_uri, validate_s3_uri
+
+    input_cache = get_input_cache()
+    if not input_cache or not validate_s3_uri(s3_uri):
+        return
+    client = get_s3_client(cfg.INPUT)
+    bucket, object_name = parse_s3_uri(s3_uri)
+    etag, size = get_s3_object_info(client, bucket, object_name)
+    if not etag:
+        return
+    transfer_config = get_transfer_config(cfg.INPUT)
+    logger.info(f"Warming the input cache with {s3_uri}")
+    path, _ = input_cache.acquire(
+        bucket,
+        object_name,
+        etag,
+        lambda folder: fetch_s3_object(
+            client, bucket, object_name, folder, transfer_config, False, size
+        ),
+    )
+    if path:
+        input_cache.release(path)
+
+
+def get_input_member_patterns() -> List[str]:
+    """Return the patterns of the input archive members to extract (all if empty)"""
+    return list(cfg.INPUT.get("MEMBER_PATTERNS", INPUT_MEMBER_PATTERNS))
+
+
+def extract_input_archive(
+    fileobj,
+    output_folder: str,
+    archive_format: ArchiveFormat,
+    member_patterns: Sequence[str] = (),
+) -> ExtractionReport:
+    """Extract the members of an archive that match member_patterns (e.g.
+    INPUT.MEMBER_PATTERNS, all if empty), written by INPUT.EXTRACT_THREADS threads,
+    and report the skipped members"""
+    report = extract_archive(
+        fileobj,
+        output_folder,
+        archive_format,
+        member_patterns,
+        cfg.INPUT.get("EXTRACT_THREADS", 1),
+    )
+    EXTRACTED_BYTES.inc(report.extracted_bytes, result="extracted")
+    EXTRACTED_BYTES.inc(report.skipped_bytes, result="skipped")
+    if report.skipped:
+        logger.info(
+            f"Extracted {len(report.extracted)} members ({report.extracted_bytes} "
+            f"bytes), skipped {len(report.skipped)} members ({report.skipped_bytes} "
+            f"bytes) not matching {member_patterns}"
+        )
+        logger.debug(f"Skipped members: {report.skipped}")
+    return report
+
+
+def untar_input_file(tar_file_path: str, member_patterns: Sequence[str] = ()):
+    """Untar archive (e.g. .tar.gz, see ARCHIVE_FORMATS) into the same dir, only
+    the members matching member_patterns (if any)"""
     # TODO: explicitly report back?
     logger.info(f"Uncompressing {tar_file_path}")
     path = str(Path(tar_file_path).parent)
-    with tarfile.open(tar_file_path) as tar:
-        tar.extractall(path=path, filter="data")  # type: ignore
+    archive_format = archive_format_of(tar_file_path)
+    if archive_format:
+        with open(tar_file_path, "rb") as f:
+            extract_input_archive(f, path, archive_format, member_patterns)
+    else:  # let tarfile detect the compression
+        with tarfile.open(tar_file_path) as tar:
+            tar.extractall(path=path, filter="data")  # type: ignore
     return path
+
+
+def stream_untar_s3_object(
+    client,
+    bucket: str,
+    object_name: str,
+    output_folder: str,
+    transfer_config: Optional["TransferConfig"] = None,
+    size: Optional[int] = None,
+) -> bool:
+    """Extract an S3 archive (e.g. .tar.gz) into output_folder while downloading it.
+
+    The object is read as a stream (of parallel ranged GETs), so members are
+    extracted as they arrive and the archive is never stored on local disk"""
+    logger.info(f"Streaming {bucket}:{object_name} into {output_folder}")
+    os.makedirs(output_folder, exist_ok=True)
+    try:
+        reader = S3RangedReader(
+            client,
+            bucket,
+            object_name,
+            transfer_config or get_transfer_config(cfg.INPUT),
+            size,
+        )
+    except Exception:
+        logger.exception(f"Failed to request {object_name}")
+        return False
+    try:
+        extract_input_archive(
+            reader,  # type: ignore
+            output_folder,
+            archive_format_of(object_name) or get_archive_format("gzip"),
+            get_input_member_patterns(),
+        )
+    except Exception:
+        logger.exception(f"Failed to stream and extract {object_name}")
+        return False
+    finally:
+        reader.close()
+    return True
@@ -0,0 +1,106 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from batcher import MicroBatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+class InputLookahead:
+    """Resolves the input URIs of delivered tasks ahead of their execution.
+
+    Tasks announce their document as soon as they're delivered, also when they
+    still wait for an execution slot. Documents announced around the same time are
+    resolved in one batched lookup (see MicroBatcher), and the input of a resolved
+    document can be prefetched (e.g. into the input cache) while earlier tasks run.
+    Resolved URIs are kept for ttl seconds, so redelivered tasks skip the lookup.
+    """
+
+    def __init__(
+        self,
+        resolve_batch: Callable[[List[str]], Dict[str, str]],
+        prefetch: Optional[Callable[[str], None]] = None,
+        ttl: float = 300,
+        max_batch_size: int = 100,
+        max_wait_ms: int = 50,
+    ):
+        """Params:
+        resolve_batch: returns the input URI per document id (missing: not found)
+        prefetch: (optional) prepares the input at a URI for the task that needs it
+        ttl: seconds a resolved URI is kept
+        max_batch_size: max number of documents per lookup
+        max_wait_ms: max time to wait for other documents, to look them up together
+        """
+        self.resolve_batch = resolve_batch
+        self.prefetch = prefetch
+        self.ttl = ttl
+        self._batcher = MicroBatcher(self._resolve, max_batch_size, max_wait_ms)
+        self._lock = threading.RLock()  # also taken by callbacks of done Futures
+        self._cache: Dict[str, Tuple[float, str]] = {}  # doc_id -> (expiry, uri)
+        self._resolving: Dict[str, Future] = {}  # doc_id -> lookup in progress
+        self._prefetching: Dict[str, Future] = {}  # uri -> prefetch in progress
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="input-prefetch"
+        )
+
+    def announce(self, doc_id: str) -> None:
+        """Start resolving (and prefetching) the input of doc_id"""
+        future = self.resolve(doc_id)
+        if self.prefetch:
+            future.add_done_callback(self._start_prefetch)
+
+    def resolve(self, doc_id: str) -> Future:
+        """Return a Future of the input URI of doc_id ("" if it was not found)"""
+        with self._lock:
+            expiry, uri = self._cache.get(doc_id, (0.0, ""))
+            if expiry > time():
+                future: Future = Future()
+                future.set_result(uri)
+                return future
+            if doc_id in self._resolving:
+                return self._resolving[doc_id]
+            future = self._batcher.submit(doc_id)
+            self._resolving[doc_id] = future
+            future.add_done_callback(lambda f: self._store(doc_id, f))
+            return future
+
+    def stop(self) -> None:
+        self._batcher.stop()
+        self._prefetch_executor.shutdown(cancel_futures=True)
+
+    def _resolve(self, doc_ids: List[str]) -> List[str]:
+        logger.info(f"Looking up the input of {len(doc_ids)} documents")
+        uris = self.resolve_batch(doc_ids)
+        return [uris.get(doc_id, "") for doc_id in doc_ids]
+
+    def _store(self, doc_id: str, future: Future) -> None:
+        with self._lock:
+            self._resolving.pop(doc_id, None)
+            if not future.exception() and future.result():  # retry failed lookups
+                self._cache[doc_id] = (time() + self.ttl, future.result())
+            # forget the expired URIs, so the cache doesn't keep growing
+            now = time()
+            for expired in [d for d, (e, _) in self._cache.items() if e <= now]:
+                del self._cache[expired]
+
+    def _start_prefetch(self, future: Future) -> None:
+        if future.exception() or not future.result():
+            return
+        uri = future.result()
+        with self._lock:
+            if uri in self._prefetching:
+                return
+            self._prefetching[uri] = self._prefetch_executor.submit(self._prefetch, uri)
+
+    def _prefetch(self, uri: str) -> None:
+        try:
+            self.prefetch(uri)  # type: ignore
+        except Exception:
+            logger.exception(f"Failed to prefetch {uri}")
+        finally:
+            with self._lock:
+                self._prefetching.pop(uri, None)
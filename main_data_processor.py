@@ -1,27 +1,55 @@
+import functools
+import hashlib
+import json
 import logging
-from typing import Tuple, Optional
-import time
 import os
+from typing import Any, Callable, Dict, List, Tuple, Optional
+import threading
+import time
 from dane.config import cfg
-from dane.s3_util import validate_s3_uri
 from io_util import (
     get_base_output_dir,
+    get_output_archive_settings,
+    get_output_feature_format,
+    get_model_dir,
     get_output_file_path,
     get_s3_output_file_uri,
+    get_s3_output_metadata,
+    get_input_info,
     generate_output_dirs,
-    get_source_id_from_tar,
     obtain_input_file,
+    obtain_local_input,
+    release_disk_space,
     transfer_output,
     delete_local_output,
     delete_input_file,
+    release_input_file,
+    get_input_cache,
+    get_s3_client,
+    get_stage_journal,
+    source_id_from_s3_uri,
     validate_data_dirs,
 )
 from models import (
     CallbackResponse,
+    ProcessingTask,
     ThisWorkerInput,
     ThisWorkerOutput,
     OutputType,
 )
+from batcher import MicroBatcher
+from feature_writers import open_feature_writer
+from metrics import PIPELINE_QUEUE_DEPTH, TASKS, TASKS_IN_FLIGHT, timed
+from model_registry import LoadedModel, ModelRegistry
+from pipeline import Stage, TaskPipeline
+from profiling import profiled, start_task_profiler, stop_task_profiler
+from stage_journal import (
+    STAGE_DOWNLOAD,
+    STAGE_MODEL_OUTPUT,
+    STAGE_UPLOAD,
+    checksum_of_dir,
+    size_of,
+)
 from dane.provenance import (
     Provenance,
     obtain_software_versions,
@@ -32,136 +60,540 @@ from dane.provenance import (
 
 logger = logging.getLogger(__name__)
 DANE_WORKER_ID = "dane-example-worker"
+RESULT_FINGERPRINT_KEY = "result-fingerprint"  # S3 metadata key of the output
+DUMMY_MODEL_DELAY_S = 3  # time the dummy model "takes" per batch
+TASK_CANCELLED_MESSAGE = "Task was cancelled"
+# WORKER_SETTINGS that tune how tasks are run, but don't change their output, so
+# they're left out of the result fingerprint and the provenance parameters
+OPERATIONAL_SETTINGS = frozenset(
+    [
+        "MAX_CONCURRENT_TASKS",
+        "PREFETCH_COUNT",
+        "TASK_TIMEOUT_S",
+        "DRAIN_TIMEOUT_S",
+        "PIPELINE_MODE",
+        "PIPELINE_QUEUE_SIZE",
+        "BATCH_SIZE",
+        "BATCH_MAX_WAIT_MS",
+        "METRICS_PORT",
+        "PROFILE_EVERY_N_TASKS",
+    ]
+)
+_pipeline: Optional[TaskPipeline] = None  # only started in PIPELINE_MODE
+_pipeline_lock = threading.Lock()
+_model_registry: Optional[ModelRegistry] = None
+_model_registry_lock = threading.Lock()
+_batcher: Optional[MicroBatcher] = None  # only started when BATCH_SIZE > 1
+_batcher_lock = threading.Lock()
 
 
-def run(input_file_path: str) -> Tuple[CallbackResponse, Optional[Provenance]]:
+def run(
+    input_file_path: str,
+    profile: bool = False,
+    cancel: Optional[threading.Event] = None,
+) -> Tuple[CallbackResponse, Optional[Provenance]]:
     """Main function to start the process.
 
     Triggered by running: python worker.py --run-test-file
+    Runs all STAGES on the input, either directly or, when
+    WORKER_SETTINGS.PIPELINE_MODE is set, via the pipeline shared by all tasks.
+    Every WORKER_SETTINGS.PROFILE_EVERY_N_TASKS-th task is profiled (see
+    OutputType.PROFILE), or every task when profile is set.
+    Once cancel is set, the task finishes (with TASK_CANCELLED_MESSAGE) before its
+    next stage; the stage that is running is not interrupted.
     Params:
             input_file_path: where to read input from
+            profile: profile this task (regardless of PROFILE_EVERY_N_TASKS)
+            cancel: (optional) set to cancel the task
     Returns:
             CallbackResponse: the main processing result
             Provenance: a Provenance object describing the processing
     """
+    task = ProcessingTask(input_file_path, cancel=cancel)
+    task.profiler = start_task_profiler(
+        cfg.WORKER_SETTINGS.get("PROFILE_EVERY_N_TASKS", 0), profile
+    )
+    TASKS_IN_FLIGHT.inc()
+    try:
+        if cfg.WORKER_SETTINGS.get("PIPELINE_MODE", False):
+            task = get_pipeline().submit(task).result()
+        else:
+            for _, stage in STAGES:
+                if task.response:  # finished early
+                    break
+                stage(task)
+    finally:
+        TASKS_IN_FLIGHT.dec()
+        stop_task_profiler(task.profiler)
+        if task.model_input and task.model_input.state == 200:
+            release_input_file(task.model_input.input_file_path)
+            release_disk_space(task.model_input.disk_reservation)
+    if not task.response:
+        task.response = {"state": 500, "message": "Processing did not finish"}
+    TASKS.inc(state=str(task.response["state"]))
+    return task.response, task.full_provenance_chain
+
+
+def get_pipeline() -> TaskPipeline:
+    """Return the pipeline that runs the STAGES of all tasks, start it if needed"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = TaskPipeline(
+                STAGES, cfg.WORKER_SETTINGS.get("PIPELINE_QUEUE_SIZE", 1)
+            )
+            pipeline = _pipeline
+            PIPELINE_QUEUE_DEPTH.set_function(
+                lambda: {(n,): d for n, d in pipeline.queue_depths().items()}
+            )
+        return _pipeline
+
+
+def get_batcher() -> MicroBatcher:
+    """Return the batcher that applies the model to the inputs of concurrent tasks
+    in batches of (at most) WORKER_SETTINGS.BATCH_SIZE, start it if needed.
+
+    Not used in PIPELINE_MODE (see validate_config), as its single apply_model
+    thread has only one task to submit at a time"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                lambda inputs: apply_model_batch(inputs, get_model()),
+                cfg.WORKER_SETTINGS.get("BATCH_SIZE", 1),
+                cfg.WORKER_SETTINGS.get("BATCH_MAX_WAIT_MS", 100),
+            )
+        return _batcher
+
+
+def get_model() -> LoadedModel:
+    """Return the model shared by all tasks; it is loaded on the first call and
+    reloaded when INPUT.S3_BUCKET_MODEL publishes a new version"""
+    global _model_registry
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry(
+                get_s3_client(cfg.INPUT),
+                cfg.INPUT.get("S3_BUCKET_MODEL"),
+                get_model_dir(),
+                cfg.INPUT.get("MODEL_VERSION", ""),
+                cfg.INPUT.get("MODEL_CHECK_INTERVAL_S", 0),
+            )
+    return _model_registry.get()
+
+
+@profiled
+def fetch_input(task: ProcessingTask) -> None:
+    """First stage: validate the input and download it (if needed)"""
+    input_file_path = task.input_file_path
+
     # there must be an input file
     if not input_file_path:
         logger.error("input file empty")
-        return {"state": 403, "message": "Error, no input file"}, []
+        task.response = {"state": 403, "message": "Error, no input file"}
+        return
 
     # check if the file system is setup properly
     if not validate_data_dirs():
         logger.info("ERROR: data dirs not configured properly")
-        return {"state": 500, "message": "Input & output dirs not ok"}, []
+        task.response = {"state": 500, "message": "Input & output dirs not ok"}
+        return
 
     # create the top-level provenance
     # TODO: add proper name and description
-    top_level_provenance = generate_initial_provenance(
+    task.top_level_provenance = generate_initial_provenance(
         name="",
         description=(""),
         input_data={"input_file_path": input_file_path},
-        parameters=dict(cfg.WORKER_SETTINGS),
+        parameters=get_model_settings(),
         software_version=obtain_software_versions(DANE_WORKER_ID),
     )
-    provenance_chain = []  # will contain the steps of the top-level provenance
 
     # S3 URI, local tar.gz or locally extracted tar.gz is allowed
-    if validate_s3_uri(input_file_path):
-        model_input = obtain_input_file(input_file_path)
+    if input_file_path.startswith("s3://"):  # validated by obtain_input_file
+        # one HEAD request for the ETag and size, if they're needed before download
+        etag, size = (
+            get_input_info(input_file_path)
+            if reuse_output_enabled() or get_stage_journal()
+            else ("", None)
+        )
+        if reuse_existing_output(task, etag):
+            return
+        # an earlier attempt at this task may have downloaded the input already
+        model_input = resume_download(input_file_path, etag)
+        if not model_input:
+            model_input = obtain_input_file(input_file_path, etag, size)
+            record_download(model_input)
     else:
         logger.info("Using local input instead of fetching from S3")
-        if input_file_path.find(".tar.gz") != -1:
-            source_id = get_source_id_from_tar(input_file_path)
-        else:
-            source_id = input_file_path.split("/")[-2]
+        model_input = obtain_local_input(input_file_path)
+    task.model_input = model_input
 
-        model_input = ThisWorkerInput(
-            200,
-            f"Processing tar.gz archive: {input_file_path}",
-            source_id,
-            input_file_path,
-            None,  # no download provenance when using local file
-        )
+    if model_input.state != 200:
+        task.response = {"state": model_input.state, "message": model_input.message}
+        return
 
     # add the download provenance
     if model_input.provenance:
-        provenance_chain.append(model_input.provenance)
+        task.provenance_chain.append(model_input.provenance)
+
+
+def reuse_output_enabled() -> bool:
+    """Whether existing output may be reused, i.e. OUTPUT.REUSE_EXISTING_OUTPUT (and
+    TRANSFER_ON_COMPLETION, as the output is looked up in S3)"""
+    return bool(
+        cfg.OUTPUT.get("REUSE_EXISTING_OUTPUT", False)
+        and cfg.OUTPUT.TRANSFER_ON_COMPLETION
+    )
+
+
+def reuse_existing_output(task: ProcessingTask, input_etag: str) -> bool:
+    """Finish the task if its output already exists in S3, i.e. was produced from
+    the same input, WORKER_SETTINGS, software and model (see get_result_fingerprint)
+
+    Only applies if reuse_output_enabled()"""
+    if not (reuse_output_enabled() and input_etag and task.top_level_provenance):
+        return False
+    start = time.time()
+    source_id = source_id_from_s3_uri(task.input_file_path)
+    fingerprint = get_result_fingerprint(input_etag, get_model().version)
+    metadata = get_s3_output_metadata(source_id)
+    if not metadata or metadata.get(RESULT_FINGERPRINT_KEY) != fingerprint:
+        return False
+
+    output_uri = get_s3_output_file_uri(source_id)
+    logger.info(f"Output {output_uri} already exists, skipping processing")
+    reuse_provenance = Provenance(
+        activity_name="reuse output",
+        activity_description="Output of identical input, settings and software exists",
+        input_data={"s3_uri": task.input_file_path, "etag": input_etag},
+        start_time_unix=start,
+        parameters={"fingerprint": fingerprint},
+        output_data={"output_uri": output_uri},
+        processing_time_ms=(time.time() - start) * 1000,
+    )
+    provenance = task.top_level_provenance
+    provenance.output_data = {"output_uri": output_uri}
+    provenance.processing_time_ms = (time.time() - provenance.start_time_unix) * 1000
+    provenance.steps = [reuse_provenance]
+    task.full_provenance_chain = provenance
+    task.response = {
+        "state": 200,
+        "message": "Output already exists, skipped processing",
+    }
+    return True
+
+
+def resume_download(s3_uri: str, etag: str) -> Optional[ThisWorkerInput]:
+    """Return the input an earlier attempt at the task downloaded, if the stage
+    journal lists it and it's still on disk (None otherwise).
+
+    Not used along with the input cache, which keeps downloaded inputs itself"""
+    journal = get_stage_journal()
+    if not journal or get_input_cache() or not etag:
+        return None
+    start = time.time()
+    source_id = source_id_from_s3_uri(s3_uri)
+    checkpoint = journal.get(source_id, STAGE_DOWNLOAD)
+    if not checkpoint:
+        return None
+    if checkpoint["etag"] != etag:  # the input changed, so nothing can be reused
+        logger.info(f"Input {s3_uri} changed, discarding its stage journal")
+        journal.clear(source_id)
+        return None
+    input_file_path = checkpoint["file_path"]
+    if not os.path.exists(input_file_path) or (
+        size_of(input_file_path) != checkpoint["size"]
+    ):
+        logger.warning(f"Downloaded input {input_file_path} is gone or incomplete")
+        return None
+
+    logger.info(f"Input {s3_uri} was downloaded already, skipping the download")
+    provenance = Provenance(
+        activity_name="download",
+        activity_description="Skipped: input was downloaded by an earlier attempt",
+        input_data={"s3_uri": s3_uri, "etag": etag},
+        start_time_unix=start,
+        output_data={"file_path": input_file_path, "skipped": True},
+        processing_time_ms=(time.time() - start) * 1000,
+    )
+    return ThisWorkerInput(
+        200,
+        f"Reusing downloaded input: {input_file_path}",
+        source_id,
+        input_file_path,
+        provenance,
+        etag,
+    )
+
+
+def record_download(model_input: ThisWorkerInput) -> None:
+    """Record the downloaded input in the stage journal (if enabled)"""
+    journal = get_stage_journal()
+    if not journal or get_input_cache() or not model_input.etag:
+        return
+    if model_input.state != 200:
+        return
+    journal.record(
+        model_input.source_id,
+        STAGE_DOWNLOAD,
+        etag=model_input.etag,
+        file_path=model_input.input_file_path,
+        size=size_of(model_input.input_file_path),
+    )
+
+
+def resume_model_output(model_input: ThisWorkerInput) -> Optional[ThisWorkerOutput]:
+    """Return the model output of an earlier attempt at the task, if the stage
+    journal lists it for the same input, settings, software and model (see
+    get_result_fingerprint) and the output on disk still matches its checksum"""
+    journal = get_stage_journal()
+    if not journal or not model_input.etag:
+        return None
+    start = time.time()
+    checkpoint = journal.get(model_input.source_id, STAGE_MODEL_OUTPUT)
+    if not checkpoint:
+        return None
+    model_version = get_model().version
+    if checkpoint["fingerprint"] != get_result_fingerprint(
+        model_input.etag, model_version
+    ):
+        return None
+    checksum = get_output_checksum(model_input.source_id)
+    if checksum != checkpoint["checksum"]:
+        logger.warning(f"Model output of {model_input.source_id} has changed")
+        return None
+
+    output_dir = get_base_output_dir(model_input.source_id)
+    logger.info(f"Model output {output_dir} exists already, skipping the model")
+    provenance = Provenance(
+        activity_name="apply model",
+        activity_description="Skipped: model was applied by an earlier attempt",
+        input_data={"input_file_path": model_input.input_file_path},
+        start_time_unix=start,
+        software_version={"model": model_version},
+        output_data={"output_path": output_dir, "checksum": checksum, "skipped": True},
+        processing_time_ms=(time.time() - start) * 1000,
+    )
+    return ThisWorkerOutput(
+        200, "Reusing model output", output_dir, provenance, model_version
+    )
+
+
+def record_model_output(
+    model_input: ThisWorkerInput, proc_result: ThisWorkerOutput
+) -> None:
+    """Record the model output in the stage journal (if enabled)"""
+    journal = get_stage_journal()
+    if not journal or not model_input.etag or proc_result.state != 200:
+        return
+    journal.record(
+        model_input.source_id,
+        STAGE_MODEL_OUTPUT,
+        fingerprint=get_result_fingerprint(model_input.etag, proc_result.model_version),
+        checksum=get_output_checksum(model_input.source_id),
+    )
+
+
+def get_output_checksum(source_id: str) -> str:
+    """Return the checksum of the model output; the provenance and profile are
+    left out, since they're (re)written after the model was applied"""
+    return checksum_of_dir(
+        get_base_output_dir(source_id),
+        [OutputType.PROVENANCE.value, OutputType.PROFILE.value],
+    )
+
+
+def get_model_settings() -> Dict[str, Any]:
+    """Return the WORKER_SETTINGS that determine the output (i.e. all but the
+    OPERATIONAL_SETTINGS)"""
+    return {
+        key: value
+        for key, value in cfg.WORKER_SETTINGS.items()
+        if key not in OPERATIONAL_SETTINGS
+    }
+
+
+def get_result_fingerprint(input_etag: str, model_version: str) -> str:
+    """Return a fingerprint of everything that determines the output"""
+    fingerprint = {
+        "input_etag": input_etag,
+        "worker_settings": get_model_settings(),
+        "software_version": obtain_software_versions(DANE_WORKER_ID),
+        "model_version": model_version,
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+
+@profiled
+def process_input(task: ProcessingTask) -> None:
+    """Second stage: apply the model and write the provenance of the processing"""
+    assert task.model_input and task.top_level_provenance
+    model_input = task.model_input
 
     # first generate the output dirs
     generate_output_dirs(model_input.source_id)
 
-    # apply model to input & extract features
-    proc_result = apply_model(model_input)
+    # apply model to input & extract features (batched with other tasks, if enabled),
+    # unless an earlier attempt at the task did so already
+    proc_result = resume_model_output(model_input)
+    if not proc_result:
+        with timed("apply_model"):
+            if cfg.WORKER_SETTINGS.get("BATCH_SIZE", 1) > 1:
+                proc_result = get_batcher().submit(model_input).result()
+            else:
+                proc_result = apply_model(model_input, get_model())
+        record_model_output(model_input, proc_result)
+    task.model_output = proc_result
 
     if proc_result.provenance:
-        provenance_chain.append(proc_result.provenance)
+        task.provenance_chain.append(proc_result.provenance)
 
     # as a last piece of output, generate the provenance.json before packaging&uploading
-    full_provenance_chain = stop_timer_and_persist_provenance_chain(
-        provenance=top_level_provenance,
+    task.full_provenance_chain = stop_timer_and_persist_provenance_chain(
+        provenance=task.top_level_provenance,
         output_data={
             "output_path": get_base_output_dir(model_input.source_id),
             "output_uri": get_s3_output_file_uri(model_input.source_id),
+            **get_output_archive_settings(),
         },
-        provenance_chain=provenance_chain,
+        provenance_chain=task.provenance_chain,
         provenance_file_path=get_output_file_path(
             model_input.source_id, OutputType.PROVENANCE
         ),
     )
 
+
+def handle_output(task: ProcessingTask) -> None:
+    """Last stage: transfer and/or clean up the output and input"""
+    assert task.model_input and task.model_output
+
+    # the profile covers everything up to here, so it can be transferred as well
+    if task.profiler:
+        profile_file = get_output_file_path(
+            task.model_input.source_id, OutputType.PROFILE
+        )
+        task.profiler.dump_stats(profile_file)
+        logger.info(f"Wrote profile to: {profile_file}")
+
     # if all is ok, apply the I/O steps on the outputted features
     validated_output: CallbackResponse = apply_desired_io_on_output(
-        model_input,
-        proc_result,
+        task.model_input,
+        task.model_output,
         cfg.INPUT.DELETE_ON_COMPLETION,
         cfg.OUTPUT.DELETE_ON_COMPLETION,
         cfg.OUTPUT.TRANSFER_ON_COMPLETION,
     )
     logger.info("Results after applying desired I/O")
     logger.info(validated_output)
-    return validated_output, full_provenance_chain
+    task.response = validated_output
+
+
+def cancellable(stage_fn: Callable[[ProcessingTask], None]):
+    """Wrap a stage, so it finishes the task instead when the task was cancelled"""
+
+    @functools.wraps(stage_fn)
+    def stage_unless_cancelled(task: ProcessingTask) -> None:
+        if task.cancel and task.cancel.is_set():
+            logger.warning(f"Cancelled the processing of {task.input_file_path}")
+            task.response = {"state": 500, "message": TASK_CANCELLED_MESSAGE}
+            return
+        stage_fn(task)
+
+    return stage_unless_cancelled
+
+
+# the processing stages, in order; in PIPELINE_MODE each stage gets its own thread
+STAGES: List[Stage] = [
+    ("fetch_input", cancellable(fetch_input)),
+    ("apply_model", cancellable(process_input)),
+    ("handle_output", cancellable(handle_output)),
+]
 
 
 def apply_model(
     feature_extraction_input: ThisWorkerInput,
+    model: LoadedModel,
 ) -> ThisWorkerOutput:
-    logger.info("Starting model application")
-    start = time.time() * 1000  # convert to ms
-    file_to_read = os.path.join(
-        feature_extraction_input.input_file_path,
-        feature_extraction_input.source_id + ".input",
-    )
-    with open(file_to_read, "r") as f:
-        cnt = len(f.readline().split())
-    destination = get_output_file_path(
-        feature_extraction_input.source_id, OutputType.FOOBAR
-    )
-    with open(destination, "w") as f:
-        for i in range(cnt):
-            f.write("Hello world")
-    time.sleep(3)  # wait 3 seconds
-    end = time.time() * 1000  # convert to ms
-
-    model_application_provenance = Provenance(
-        activity_name="hello world\n",
-        activity_description="some dummy processing",
-        input_data="",  # TODO: what what
-        start_time_unix=start,
-        parameters={},
-        software_version="",
-        output_data={},
-        processing_time_ms=end - start,
-    )
+    """Apply the model to a single input (i.e. a batch of one)"""
+    return apply_model_batch([feature_extraction_input], model)[0]
 
-    if not model_application_provenance:
-        return ThisWorkerOutput(500, "Failed to apply model")
 
-    return ThisWorkerOutput(
-        200,
-        "Succesfully applied model",
-        get_base_output_dir(feature_extraction_input.source_id),
-        model_application_provenance,
+def apply_model_batch(
+    feature_extraction_inputs: List[ThisWorkerInput],
+    model: LoadedModel,
+) -> List[ThisWorkerOutput]:
+    """Apply the model to a batch of inputs in a single call.
+
+    The features of all inputs are stacked into one batch, so the per-call overhead
+    of the model is paid once per batch. The result is split back into a
+    ThisWorkerOutput (with its own provenance) per input, in the same order."""
+    logger.info(
+        f"Starting model application on {len(feature_extraction_inputs)} inputs "
+        f"(model version: {model.version})"
     )
+    start = time.time()
+
+    # read the features of each input; a failing input does not fail the batch
+    batch: List[Optional[List[bytes]]] = []
+    for feature_extraction_input in feature_extraction_inputs:
+        try:
+            # only the first line is used, so the rest of the input is never read
+            first_line = next(feature_extraction_input.iter_records(), b"")
+            batch.append(first_line.split())
+        except OSError:
+            logger.exception(
+                f"Could not read input: {feature_extraction_input.input_data_file}"
+            )
+            batch.append(None)
+
+    time.sleep(DUMMY_MODEL_DELAY_S)  # once for the whole batch
+    end = time.time()
+
+    outputs = []
+    feature_format = get_output_feature_format()
+    for feature_extraction_input, tokens in zip(feature_extraction_inputs, batch):
+        if tokens is None:
+            outputs.append(ThisWorkerOutput(500, "Failed to read the model input"))
+            continue
+        source_id = feature_extraction_input.source_id
+        destination = get_output_file_path(source_id, OutputType.FOOBAR)
+        with open(destination, "w") as f:
+            f.write(model.params.get("greeting", "Hello world") * len(tokens))
+
+        # the (dummy) features: the position and length of each token
+        with open_feature_writer(
+            get_output_file_path(source_id, OutputType.FEATURES),
+            feature_format,
+            "float32",
+            2,
+            cfg.OUTPUT.get("FEATURE_BUFFER_MB", 8) * 1024 * 1024,
+        ) as feature_writer:
+            feature_writer.write((i, len(token)) for i, token in enumerate(tokens))
+
+        model_application_provenance = Provenance(
+            activity_name="hello world\n",
+            activity_description="some dummy processing",
+            input_data="",  # TODO: what what
+            start_time_unix=start,
+            parameters={
+                "batch_size": len(feature_extraction_inputs),
+                "feature_format": feature_format.name,
+            },
+            software_version={"model": model.version},
+            output_data={},
+            processing_time_ms=(end - start) * 1000,
+        )
+        outputs.append(
+            ThisWorkerOutput(
+                200,
+                "Succesfully applied model",
+                get_base_output_dir(feature_extraction_input.source_id),
+                model_application_provenance,
+                model.version,
+            )
+        )
+    return outputs
 
 
 # assesses the output and makes sure input & output is handled properly
@@ -184,8 +616,29 @@ def apply_desired_io_on_output(
 
     # transfer the output to S3 (if configured so)
     transfer_success = True
-    if transfer_output_on_completion:
-        transfer_success = transfer_output(source_id)
+    fingerprint = (
+        get_result_fingerprint(model_input.etag, proc_result.model_version)
+        if model_input.etag
+        else None
+    )
+    journal = get_stage_journal()
+    upload = journal.get(source_id, STAGE_UPLOAD) if journal and fingerprint else None
+    output_uri = get_s3_output_file_uri(source_id)
+    if transfer_output_on_completion and upload == {
+        "fingerprint": fingerprint,
+        "output_uri": output_uri,
+    }:
+        logger.info(f"Output {output_uri} was uploaded already, skipping the upload")
+    elif transfer_output_on_completion:
+        # store the fingerprint with the output, so identical tasks can reuse it
+        transfer_success = transfer_output(
+            source_id,
+            {RESULT_FINGERPRINT_KEY: fingerprint} if fingerprint else None,
+        )
+        if transfer_success and journal and fingerprint:
+            journal.record(
+                source_id, STAGE_UPLOAD, fingerprint=fingerprint, output_uri=output_uri
+            )
 
     # failure of transfer, impedes the workflow, so return error
     if not transfer_success:
@@ -194,24 +647,28 @@ def apply_desired_io_on_output(
             "message": "Failed to transfer output to S3",
         }
 
-    # clear the output files (if configured so)
-    if delete_output_on_completetion:
-        delete_success = delete_local_output(source_id)
-        if not delete_success:
-            # NOTE: just a warning for now, but one to keep an eye out for
-            logger.warning(f"Could not delete output files: {output_path}")
+    with timed("cleanup"):
+        # clear the output files (if configured so)
+        if delete_output_on_completetion:
+            delete_success = delete_local_output(source_id)
+            if not delete_success:
+                # NOTE: just a warning for now, but one to keep an eye out for
+                logger.warning(f"Could not delete output files: {output_path}")
 
-    # clean the input file (if configured so)
-    if not delete_input_file(
-        model_input.input_file_path,
-        model_input.source_id,
-        delete_input_on_completion,
-    ):
+        # clean the input file (if configured so)
+        input_deleted = delete_input_file(
+            model_input.input_file_path,
+            model_input.source_id,
+            delete_input_on_completion and not model_input.keep_input,
+        )
+    if not input_deleted:
         return {
             "state": 500,
             "message": "Applied model, but could not delete the input file",
         }
 
+    if journal:  # the task is done, so nothing is left to resume
+        journal.clear(source_id)
     return {
         "state": 200,
         "message": "Successfully applied model",
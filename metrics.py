@@ -0,0 +1,228 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text format
+# seconds; from quick S3 calls up to model application on large input
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+Labels = Tuple[str, ...]  # label values, in the order of the metric's label names
+
+
+class Metric(ABC):
+    """Base class of the metrics, which are kept per combination of label values.
+
+    Metrics add themselves to registry (REGISTRY, unless given), which is what
+    render_metrics() exposes"""
+
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        registry: Optional[List["Metric"]] = None,
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).append(self)
+
+    def render(self) -> List[str]:
+        """Return the metric in the Prometheus text format"""
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Return the lines of the samples, per combination of label values"""
+
+    def _labels(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format(self, values: Labels, extra: str = "") -> str:
+        pairs = [f'{n}="{v}"' for n, v in zip(self.label_names, values)]
+        pairs += [extra] if extra else []
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    """Value that only goes up, e.g. the number of finished tasks"""
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        registry: Optional[List[Metric]] = None,
+    ):
+        super().__init__(name, description, label_names, registry)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{self._format(k)} {v}" for k, v in self._values.items()
+            ]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. the number of tasks in progress.
+
+    With set_function, the values are obtained when the metrics are requested"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        registry: Optional[List[Metric]] = None,
+    ):
+        super().__init__(name, description, label_names, registry)
+        self._values: Dict[Labels, float] = {}
+        self._function: Optional[Callable[[], Dict[Labels, float]]] = None
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], Dict[Labels, float]]) -> None:
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = self._function() if self._function else dict(self._values)
+        return [f"{self.name}{self._format(k)} {v}" for k, v in values.items()]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. the duration of a processing stage"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Optional[List[Metric]] = None,
+    ):
+        super().__init__(name, description, label_names, registry)
+        self.buckets = buckets
+        self._counts: Dict[Labels, List[int]] = {}  # per bucket, last one is +Inf
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def _samples(self) -> List[str]:
+        samples = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                bounds = [str(b) for b in self.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, counts):
+                    le = self._format(key, f'le="{bound}"')
+                    samples.append(f"{self.name}_bucket{le} {count}")
+                samples.append(f"{self.name}_sum{self._format(key)} {self._sums[key]}")
+                samples.append(f"{self.name}_count{self._format(key)} {counts[-1]}")
+        return samples
+
+
+REGISTRY: List[Metric] = []  # all metrics, in order of definition
+
+STAGE_DURATION = Histogram(
+    "dane_worker_stage_duration_seconds",
+    "Duration of each stage of processing a task",
+    ["stage"],
+)
+TRANSFERRED_BYTES = Counter(
+    "dane_worker_transferred_bytes_total",
+    "Bytes transferred from (download) or to (upload) S3",
+    ["direction"],
+)
+EXTRACTED_BYTES = Counter(
+    "dane_worker_extracted_bytes_total",
+    "Bytes of input archive members, by whether they were extracted or skipped",
+    ["result"],
+)
+TASKS = Counter(
+    "dane_worker_tasks_total", "Number of finished tasks, by state", ["state"]
+)
+TASKS_IN_FLIGHT = Gauge("dane_worker_tasks_in_flight", "Number of tasks in progress")
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "dane_worker_pipeline_queue_depth",
+    "Number of tasks waiting in front of each pipeline stage (PIPELINE_MODE)",
+    ["stage"],
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Observe the duration of the with-block in STAGE_DURATION"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(perf_counter() - start, stage=stage)
+
+
+def render_metrics() -> str:
+    """Return all metrics in the Prometheus text format"""
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # don't log every scrape
+        pass
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Serve the metrics on http://<host>:<port>/metrics, in a background thread"""
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    logger.info(f"Serving metrics on port {server.server_address[1]}")
+    return server
@@ -0,0 +1,228 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+from time import time
+from typing import Any, Dict, Iterator, Optional
+import uuid
+
+
+logger = logging.getLogger(__name__)
+VERSION_KEY = "VERSION"  # object in the model bucket holding the current version
+MODEL_CONFIG_FILE = "model.json"  # (optional) parameters of the model artifacts
+BUILTIN_MODEL_VERSION = "builtin"  # used when no model was published (yet)
+TMP_DIR_SUFFIX = ".tmp"  # versions are downloaded in <version>.<uuid>.tmp, then renamed
+LOCK_FILE = ".lock"
+
+
+@dataclass
+class LoadedModel:
+    """A model that is loaded once, then used by all tasks (until a reload)"""
+
+    version: str
+    path: str = ""  # local dir with the model artifacts ("" for the builtin model)
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+class ModelRegistry:
+    """Keeps the model resident, so tasks don't pay for (down)loading it.
+
+    The model bucket holds the artifacts of each version under <version>/ and a
+    VERSION object naming the current version (unless a version is pinned). A
+    version is downloaded once into model_dir/<version>, so a restarted worker only
+    loads it from disk. Every check_interval seconds, get() checks whether the
+    current version changed and if so loads the new one; tasks that are still
+    running keep the model they obtained.
+
+    The builtin model is only used when there is no model bucket, or no VERSION in
+    it; if the bucket cannot be reached, loading the model fails (so the worker
+    doesn't start with the wrong model), while a failed check keeps the current.
+
+    model_dir may be shared by several worker processes (e.g. --run-batch): a lock
+    file makes downloading and pruning versions exclusive, and each process holds a
+    shared (flock) lock on the dirs of the versions it uses, so they're not pruned.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: Optional[str],
+        model_dir: str,
+        pinned_version: str = "",
+        check_interval: float = 0,
+    ):
+        """Params:
+        client: S3 client for the model bucket
+        bucket: the model bucket (None: always use the builtin model)
+        model_dir: local dir in which each version gets its own dir
+        pinned_version: use this version instead of the one in VERSION
+        check_interval: seconds between checks for a new version (0: never)
+        """
+        self.client = client
+        self.bucket = bucket
+        self.model_dir = model_dir
+        self.pinned_version = pinned_version
+        self.check_interval = check_interval
+        self._model: Optional[LoadedModel] = None
+        self._load_lock = threading.Lock()  # one (re)load at a time
+        self._last_check = 0.0
+        self._pins: Dict[str, int] = {}  # version -> fd of its (share-locked) dir
+
+    def get(self) -> LoadedModel:
+        """Return the loaded model, loading it first if needed"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model = self._load(self._current_version())
+                    self._last_check = time()
+        elif self._should_check():
+            self._reload_if_changed()
+        return self._model
+
+    def _should_check(self) -> bool:
+        return (
+            self.check_interval > 0
+            and not self.pinned_version
+            and time() - self._last_check >= self.check_interval
+        )
+
+    def _reload_if_changed(self) -> None:
+        # tasks arriving during a reload just use the current model
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time()
+            version = self._current_version()
+            if self._model and version != self._model.version:
+                logger.info(f"Model version changed to {version}, reloading")
+                previous = self._model.version
+                self._model = self._load(version)
+                self._prune({previous, version})
+        except Exception:
+            logger.exception("Could not check for a new model, keeping the current")
+        finally:
+            self._load_lock.release()
+
+    def _current_version(self) -> str:
+        if self.pinned_version:
+            return self.pinned_version
+        if not self.bucket:
+            return BUILTIN_MODEL_VERSION
+        from botocore.exceptions import ClientError
+
+        # other errors (e.g. S3 is unreachable) are raised: see the class docstring
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=VERSION_KEY)
+            return response["Body"].read().decode().strip()
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ["NoSuchKey", "NoSuchBucket", "404"]:
+                raise
+        logger.warning(f"No model published in {self.bucket}, using builtin model")
+        return BUILTIN_MODEL_VERSION
+
+    def _load(self, version: str) -> LoadedModel:
+        start = time()
+        if version == BUILTIN_MODEL_VERSION:
+            model = LoadedModel(BUILTIN_MODEL_VERSION)
+        else:
+            model = load_model(version, self._download(version))
+        logger.info(f"Loaded model {version} in {time() - start:.2f}s")
+        return model
+
+    def _download(self, version: str) -> str:
+        """Download the artifacts of version (if not already on disk), and pin it"""
+        version_dir = os.path.join(self.model_dir, version)
+        os.makedirs(self.model_dir, exist_ok=True)
+        with _locked(os.path.join(self.model_dir, LOCK_FILE)):
+            if not os.path.isdir(version_dir):
+                self._download_into(version, version_dir)
+            self._pin(version, version_dir)
+        return version_dir
+
+    def _download_into(self, version: str, version_dir: str) -> None:
+        tmp_dir = f"{version_dir}.{uuid.uuid4().hex}{TMP_DIR_SUFFIX}"
+        os.makedirs(tmp_dir)
+        prefix = f"{version}/"
+        num_files = 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                rel_path = os.path.normpath(obj["Key"][len(prefix) :])
+                if obj["Key"].endswith("/") or rel_path.startswith(os.pardir):
+                    continue
+                file_path = os.path.join(tmp_dir, rel_path)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                self.client.download_file(self.bucket, obj["Key"], file_path)
+                num_files += 1
+        if num_files == 0:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise ValueError(f"No artifacts for model {version} in {self.bucket}")
+        logger.info(f"Downloaded {num_files} files of model {version}")
+        try:
+            os.rename(tmp_dir, version_dir)
+        except OSError:  # downloaded in the meantime (by another process)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _pin(self, version: str, version_dir: str) -> None:
+        """Keep other processes from pruning version, until it's unpinned"""
+        if version in self._pins:
+            return
+        fd = os.open(version_dir, os.O_RDONLY)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        self._pins[version] = fd
+
+    def _prune(self, keep: set) -> None:
+        """Remove the downloaded versions that are not in keep, nor used by other
+        processes (and what interrupted downloads left behind)"""
+        for version in [v for v in self._pins if v not in keep]:
+            os.close(self._pins.pop(version))  # also releases the lock
+        with _locked(os.path.join(self.model_dir, LOCK_FILE)):
+            for version in os.listdir(self.model_dir):
+                path = os.path.join(self.model_dir, version)
+                if version == LOCK_FILE or version in keep:
+                    continue
+                # downloads hold the lock file, so .tmp dirs are left behind
+                if not version.endswith(TMP_DIR_SUFFIX) and not _try_lock(path):
+                    continue  # used by another process
+                logger.info(f"Removing model {version} from {self.model_dir}")
+                shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def _locked(lock_file: str) -> Iterator[None]:
+    """Hold an exclusive lock, shared by all processes, during the with-block"""
+    with open(lock_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _try_lock(path: str) -> bool:
+    """Return whether no process holds a lock on path (a file or dir)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)  # also releases the lock
+    return True
+
+
+def load_model(version: str, path: str) -> LoadedModel:
+    """Load the model artifacts in path; replace this with loading your own model"""
+    params = {}
+    config_file = os.path.join(path, MODEL_CONFIG_FILE)
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            params = json.load(f)
+    return LoadedModel(version, path, params)
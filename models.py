@@ -1,9 +1,20 @@
-from dataclasses import dataclass
+from contextlib import contextmanager
+import cProfile
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, TypedDict
+import mmap
+import os
+import threading
+from typing import Iterator, List, Optional, TypedDict
 from dane.provenance import Provenance
 
 
+INPUT_DATA_EXTENSION = ".input"  # the input data is in <source_id>.input
+# the members of an input archive the model reads (see INPUT.MEMBER_PATTERNS)
+INPUT_MEMBER_PATTERNS = [f"*{INPUT_DATA_EXTENSION}"]
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
 class CallbackResponse(TypedDict):
     """Response returned by callback(), with state and message"""
 
@@ -16,6 +27,8 @@ class OutputType(Enum):
 
     FOOBAR = "foobar"
     PROVENANCE = "provenance"  # produced by provenance.py
+    PROFILE = "profile"  # cProfile stats of the processing (if profiled)
+    FEATURES = "features"  # numeric features, see OUTPUT.FEATURE_FORMAT
 
 
 @dataclass
@@ -29,6 +42,65 @@ class ThisWorkerInput:
     source_id: str = ""  # <program ID>__<carrier ID>
     input_file_path: str = ""  # where the input was downloaded from
     provenance: Optional[Provenance] = None  # mostly: how long did it take to download
+    etag: str = ""  # ETag of the input object in S3 (if known)
+    disk_reservation: Optional[str] = None  # see io_util.reserve_disk_space
+    keep_input: bool = False  # local input that is used in place, so never deleted
+
+    @property
+    def input_data_file(self) -> str:
+        """Path of the file with the input data, within the (extracted) input"""
+        return os.path.join(self.input_file_path, self.source_id + INPUT_DATA_EXTENSION)
+
+    @contextmanager
+    def open_input_data(self) -> Iterator[memoryview]:
+        """Map the input data into memory, read-only, and yield it as memoryview.
+
+        Slicing the view does not copy any data, and numpy.frombuffer(view, dtype)
+        wraps (a slice of) it without copying as well. Only the pages that are
+        accessed are read from disk. Views (and arrays wrapping them) must not be
+        used after the with-block"""
+        with open(self.input_data_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:  # an empty file cannot be mapped
+                yield memoryview(b"")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[memoryview]:
+        """Yield the input data in (zero-copy) chunks of chunk_size bytes.
+
+        Pages of a chunk are dropped from memory once the next chunk is requested,
+        so memory use is bounded by chunk_size, regardless of the input size.
+        A chunk is only valid until the next one is requested"""
+        with self.open_input_data() as view:
+            for offset in range(0, len(view), chunk_size):
+                chunk = view[offset : offset + chunk_size]
+                try:
+                    yield chunk
+                finally:
+                    _drop_pages(view, offset, len(chunk))
+                    chunk.release()
+
+    def iter_records(
+        self, separator: bytes = b"\n", chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Yield the records (e.g. lines) of the input data, without separator.
+
+        Reads the input chunk by chunk (see iter_chunks), so only the current
+        chunk and the record being assembled are kept in memory"""
+        remainder = b""
+        for chunk in self.iter_chunks(chunk_size):
+            data = remainder + chunk.tobytes()
+            records = data.split(separator)
+            remainder = records.pop()  # possibly incomplete, continues in next chunk
+            yield from records
+        if remainder:
+            yield remainder
 
 
 @dataclass
@@ -39,3 +111,32 @@ class ThisWorkerOutput:
     message: str  # error/success message
     output_file_path: str = ""  # where to store the worker's output
     provenance: Optional[Provenance] = None  # this worker's provenance
+    model_version: str = ""  # version of the model that produced the output
+
+
+@dataclass
+class ProcessingTask:
+    """Dataclass that tracks a single input while it passes the processing stages.
+
+    Each stage (see main_data_processor.STAGES) fills in its part; as soon as
+    response is set, the task is done (successfully or not)"""
+
+    input_file_path: str  # S3 URI or local path to read input from
+    top_level_provenance: Optional[Provenance] = None
+    provenance_chain: List[Provenance] = field(default_factory=list)
+    model_input: Optional[ThisWorkerInput] = None
+    model_output: Optional[ThisWorkerOutput] = None
+    full_provenance_chain: Optional[Provenance] = None
+    response: Optional[CallbackResponse] = None  # final result of the processing
+    profiler: Optional[cProfile.Profile] = None  # set when the task is profiled
+    cancel: Optional[threading.Event] = None  # once set, the next stage is skipped
+
+
+def _drop_pages(view: memoryview, offset: int, length: int) -> None:
+    """Tell the OS that the mapped pages of view[offset:offset+length] are no longer
+    needed, so they don't add up in the resident memory of the worker"""
+    mm = view.obj
+    if not isinstance(mm, mmap.mmap):
+        return
+    start = offset - offset % mmap.PAGESIZE  # madvise needs page aligned offsets
+    mm.madvise(mmap.MADV_DONTNEED, start, offset + length - start)
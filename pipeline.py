@@ -0,0 +1,85 @@
+import logging
+from concurrent.futures import Future
+from queue import Queue
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from models import ProcessingTask
+
+
+logger = logging.getLogger(__name__)
+Stage = Tuple[str, Callable[[ProcessingTask], None]]  # (name, stage function)
+
+
+class TaskPipeline:
+    """Runs the processing stages of consecutive tasks concurrently.
+
+    Every stage gets its own thread, fed by a bounded queue. While task k is in
+    one stage, task k+1 can already be in the preceding stage and task k-1 in the
+    following one. A full queue blocks the preceding stage (or submit()), which
+    provides back-pressure when one stage is slower than the others.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 1):
+        """Start a thread for each of the stages
+
+        Params:
+            stages: (name, function) of each stage, in order of execution
+            queue_size: max number of tasks waiting in front of each stage
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self._queues: List[Queue] = [Queue(maxsize=queue_size) for _ in stages]
+        self._threads = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(i,),
+                name=f"pipeline-{name}",
+                daemon=True,
+            )
+            for i, (name, _) in enumerate(stages)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, task: ProcessingTask) -> Future:
+        """Add a task to the first stage; blocks while that stage's queue is full.
+
+        Returns a Future that resolves to the task once it passed all stages"""
+        future: Future = Future()
+        self._queues[0].put((task, future))
+        return future
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Return the number of tasks waiting in front of each stage"""
+        return {name: q.qsize() for (name, _), q in zip(self.stages, self._queues)}
+
+    def stop(self) -> None:
+        """Let each stage thread finish its queue, then stop"""
+        self._queues[0].put(None)
+        for t in self._threads:
+            t.join()
+
+    def _run_stage(self, index: int) -> None:
+        name, stage_fn = self.stages[index]
+        logger.info(f"Started pipeline stage: {name}")
+        while True:
+            item = self._queues[index].get()
+            if item is not None:
+                task, future = item
+                try:
+                    stage_fn(task)
+                except Exception as e:
+                    logger.exception(f"Pipeline stage {name} failed")
+                    future.set_exception(e)
+                    continue
+                if index + 1 < len(self.stages) and task.response is None:
+                    # blocks while the next stage is saturated (back-pressure)
+                    self._queues[index + 1].put(item)
+                else:
+                    future.set_result(task)
+            else:  # stop signal, pass it on to the next stage
+                if index + 1 < len(self.stages):
+                    self._queues[index + 1].put(None)
+                logger.info(f"Stopped pipeline stage: {name}")
+                return
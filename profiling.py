@@ -0,0 +1,59 @@
+import cProfile
+from functools import wraps
+import itertools
+import logging
+import threading
+from typing import Callable, Optional
+
+from models import ProcessingTask
+
+
+logger = logging.getLogger(__name__)
+_profiling_lock = threading.Lock()  # held while a task is being profiled
+_task_counter = itertools.count(1)
+
+
+def start_task_profiler(
+    every_n_tasks: int, force: bool = False
+) -> Optional[cProfile.Profile]:
+    """Return a profiler for the task that is about to start, or None.
+
+    Every every_n_tasks-th task is profiled (never if 0), or every task if force.
+    Only one task is profiled at a time (concurrent profilers get in each other's
+    way), so a task that should be profiled while another one is, is not.
+    Call stop_task_profiler when the task is done"""
+    task_number = next(_task_counter)
+    if not force and (every_n_tasks <= 0 or task_number % every_n_tasks != 0):
+        return None
+    if not _profiling_lock.acquire(blocking=False):
+        logger.info("Another task is being profiled, not profiling this one")
+        return None
+    logger.info(f"Profiling task {task_number}")
+    return cProfile.Profile()
+
+
+def stop_task_profiler(profiler: Optional[cProfile.Profile]) -> None:
+    """Allow the next task to be profiled"""
+    if profiler:
+        _profiling_lock.release()
+
+
+def profiled(
+    stage_fn: Callable[[ProcessingTask], None]
+) -> Callable[[ProcessingTask], None]:
+    """Decorates a stage, so it is profiled by the task's profiler (if any).
+
+    The profiler is enabled in the thread running the stage, so this also works
+    when the stages of a task run in different threads (PIPELINE_MODE)"""
+
+    @wraps(stage_fn)
+    def profiled_stage(task: ProcessingTask) -> None:
+        if not task.profiler:
+            return stage_fn(task)
+        task.profiler.enable()
+        try:
+            stage_fn(task)
+        finally:
+            task.profiler.disable()
+
+    return profiled_stage
@@ -0,0 +1,219 @@
+from concurrent.futures import Future
+import datetime
+import fcntl
+import json
+import logging
+import os
+import threading
+from time import sleep, time
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+
+
+logger = logging.getLogger(__name__)
+LOCK_FILE_SUFFIX = ".lock"
+RESULT_ID_NAMESPACE = uuid.UUID("6f1c1ad8-3c5e-4b8e-9a59-0d7c2f1f6a10")
+Entry = Dict[str, Any]  # a spooled result: its id, task_id and ES document
+
+
+class BulkResultWriter:
+    """Saves DANE Results to Elasticsearch in bulk requests, instead of one request
+    per Result.
+
+    A batch is sent as soon as it holds max_batch_size Results, or max_wait_ms after
+    its first Result was submitted, whichever comes first. Each submitted Result is
+    first appended (fsync'ed) to a spool file, and only removed from it once
+    Elasticsearch stored (or rejected) it. The Results of a bulk request that failed
+    altogether (e.g. ES was unreachable, max_retries times) are reported as failed,
+    but stay in the spool, as do those of which the bulk request did not finish
+    before the process died: they are sent again on start up. The ES id of a Result
+    is derived from its task and generator, so sending it again (or reprocessing
+    the task) overwrites it instead of adding a duplicate.
+    """
+
+    def __init__(
+        self,
+        es,
+        index: str,
+        spool_file: str,
+        max_batch_size: int = 100,
+        max_wait_ms: int = 500,
+        max_retries: int = 3,
+    ):
+        """Send the Results left in the spool file (if any), then start the thread
+        that sends the batches
+
+        Params:
+            es: Elasticsearch client (i.e. the handler's)
+            index: the DANE index
+            spool_file: where submitted Results are kept until they are stored;
+                used by a single worker at a time
+            max_batch_size: max number of Results per bulk request
+            max_wait_ms: max time a Result waits for the batch to fill up
+            max_retries: attempts of a failing bulk request, before the Results in it
+                are reported as failed (and kept in the spool for the next start)
+        """
+        self.es = es
+        self.index = index
+        self.spool_file = spool_file
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[Entry, Future, float]] = []  # in order of submit
+        self._in_flight: List[Entry] = []  # being sent, still in the spool
+        self._unsent: List[Entry] = []  # failed to send, kept in the spool
+        self._stopping = False
+        spool_dir = os.path.dirname(os.path.abspath(spool_file))
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock_file = open(spool_file + LOCK_FILE_SUFFIX, "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"Result spool {spool_file} is used by another worker")
+        # a Result may be spooled more than once, e.g. for a redelivered task
+        for entry in {e["id"]: e for e in self._read_spool()}.values():
+            self._pending.append((entry, Future(), 0))
+        if self._pending:
+            logger.info(f"Sending {len(self._pending)} Results left in the spool")
+        self._thread = threading.Thread(
+            target=self._run, name="bulk-result-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, result, task_id: str) -> Future:
+        """Spool the (dane) Result of task_id, to be saved in the next bulk request.
+
+        The Future resolves to the ES id of the Result once it is stored"""
+        now = datetime.datetime.now().replace(microsecond=0).isoformat()
+        doc = json.loads(result.to_json())
+        doc["role"] = {"name": "result", "parent": task_id}  # as DANE's ESHandler
+        doc["created_at"] = doc["updated_at"] = now
+        entry = {
+            "id": str(
+                uuid.uuid5(RESULT_ID_NAMESPACE, f"{task_id}/{result.generator['id']}")
+            ),
+            "task_id": task_id,
+            "doc": doc,
+        }
+        future: Future = Future()
+        with self._cond:
+            self._append_to_spool(entry)
+            self._pending.append((entry, future, time()))
+            self._cond.notify()
+        return future
+
+    def stop(self) -> None:
+        """Send the Results submitted so far, then stop"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._lock_file.close()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._send(batch)
+
+    def _next_batch(self) -> Optional[List[Tuple[Entry, Future, float]]]:
+        """Wait until a batch is full or its deadline passed, then take it out of
+        the pending Results. Returns None when stopping with nothing left"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    deadline = self._pending[0][2] + self.max_wait_ms / 1000
+                    full = len(self._pending) >= self.max_batch_size
+                    if full or self._stopping or time() >= deadline:
+                        break
+                    self._cond.wait(timeout=max(deadline - time(), 0))
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = self._pending[: self.max_batch_size]
+            del self._pending[: self.max_batch_size]
+            self._in_flight = [entry for entry, _, _ in batch]
+            return batch
+
+    def _send(self, batch: List[Tuple[Entry, Future, float]]) -> None:
+        operations: List[Dict[str, Any]] = []
+        for entry, _, _ in batch:
+            operations.append(
+                {
+                    "index": {
+                        "_index": self.index,
+                        "_id": entry["id"],
+                        "routing": entry["task_id"],
+                    }
+                }
+            )
+            operations.append(entry["doc"])
+        try:
+            errors = self._bulk(operations)
+            unsent = []
+        except Exception as e:  # keep the Results, to send them on the next start
+            errors = [str(e)] * len(batch)
+            unsent = [entry for entry, _, _ in batch]
+        with self._cond:
+            self._in_flight = []
+            self._unsent += unsent
+            self._rewrite_spool()
+        for (entry, future, _), error in zip(batch, errors):
+            if error:
+                future.set_exception(RuntimeError(f"Could not save Result: {error}"))
+            else:
+                future.set_result(entry["id"])
+        logger.info(f"Saved {errors.count(None)} of {len(batch)} Results in bulk")
+
+    def _bulk(self, operations: List[Dict[str, Any]]) -> List[Any]:
+        """Send the bulk request (with retries), return the error per Result
+        (None if it was stored). Raises the last error if all attempts failed"""
+        attempt = 1
+        while True:
+            try:
+                response = self.es.bulk(body=operations, refresh="wait_for")
+                return [
+                    item["index"].get("error") if response.get("errors") else None
+                    for item in response["items"]
+                ]
+            except Exception:
+                logger.exception(f"Bulk request failed (attempt {attempt})")
+                if attempt >= self.max_retries:
+                    raise
+                sleep(2**attempt / 10)
+                attempt += 1
+
+    def _read_spool(self) -> List[Entry]:
+        if not os.path.exists(self.spool_file):
+            return []
+        entries = []
+        with open(self.spool_file) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:  # cut off when the process died
+                    logger.warning(f"Skipping incomplete line in {self.spool_file}")
+        return entries
+
+    def _append_to_spool(self, entry: Entry) -> None:
+        with open(self.spool_file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_spool(self) -> None:
+        """Keep only the Results that were not stored yet in the spool (atomically)"""
+        entries = self._in_flight + [e for e, _, _ in self._pending]
+        # an unsent Result that was submitted again is replaced by the new one
+        ids = {entry["id"] for entry in entries}
+        self._unsent = [entry for entry in self._unsent if entry["id"] not in ids]
+        tmp_file = self.spool_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            for entry in self._unsent + entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.spool_file)
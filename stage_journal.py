@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+
+logger = logging.getLogger(__name__)
+JOURNAL_EXTENSION = ".json"
+STAGE_DOWNLOAD = "download"  # the input is on disk (checkpoint: etag, path, size)
+STAGE_MODEL_OUTPUT = "model_output"  # the output is on disk (fingerprint, checksum)
+STAGE_UPLOAD = "upload"  # the output is in S3 (fingerprint, output_uri)
+Checkpoint = Dict[str, Any]
+
+
+class StageJournal:
+    """Records per source_id which processing stages finished, so a task that is
+    redelivered after the worker died resumes after the last finished stage,
+    instead of starting from scratch.
+
+    The journal of a source_id is a JSON file (stage -> checkpoint) in journal_dir,
+    which lives on the data volume, next to the input and output it describes.
+    A checkpoint holds what is needed to check that the result of the stage is
+    still valid (e.g. the ETag of the input or a checksum of the output); that is up
+    to the caller. Files are replaced atomically, so a crash never leaves a
+    partially written journal behind.
+    """
+
+    def __init__(self, journal_dir: str):
+        self.journal_dir = journal_dir
+        self._lock = threading.Lock()  # tasks of one worker may share a source_id
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def get(self, source_id: str, stage: str) -> Optional[Checkpoint]:
+        """Return the checkpoint of stage, None if it did not finish"""
+        with self._lock:
+            return self._read(source_id).get(stage)
+
+    def record(self, source_id: str, stage: str, **checkpoint: Any) -> None:
+        """Record that stage finished for source_id (durably)"""
+        with self._lock:
+            journal = self._read(source_id)
+            journal[stage] = checkpoint
+            path = self._path_of(source_id)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(journal, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        logger.info(f"Recorded stage {stage} of {source_id} in the stage journal")
+
+    def clear(self, source_id: str) -> None:
+        """Forget all stages of source_id, e.g. once its task is done"""
+        with self._lock:
+            try:
+                os.remove(self._path_of(source_id))
+            except FileNotFoundError:
+                pass
+
+    def _path_of(self, source_id: str) -> str:
+        return os.path.join(self.journal_dir, source_id + JOURNAL_EXTENSION)
+
+    def _read(self, source_id: str) -> Dict[str, Checkpoint]:
+        try:
+            with open(self._path_of(source_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning(f"Ignoring the unreadable stage journal of {source_id}")
+            return {}
+
+
+def size_of(path: str) -> int:
+    """Return the size of a file, or the total size of the files in a dir"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    )
+
+
+def checksum_of_dir(path: str, exclude: Iterable[str] = ()) -> str:
+    """Return the sha256 of the (relative) paths and contents of the files in path,
+    leaving out the top-level subdirs in exclude"""
+    sha256 = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        if root == path:
+            dirs[:] = [d for d in dirs if d not in exclude]
+        dirs.sort()  # walk in a fixed order
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            relative_path = os.path.relpath(file_path, path)
+            size = os.path.getsize(file_path)
+            sha256.update(f"{relative_path}\0{size}\0".encode())
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,291 @@
+"""End-to-end benchmark of main_data_processor.run, against S3 mocked by moto.
+
+Runs the whole path (download, extraction, model, archiving, upload and cleanup)
+for a matrix of input archive sizes, member counts and output sizes. For each case
+it reports the throughput, the p50/p95 latency and, per stage, the p50/p95
+duration and the peak RSS and disk use while the stage ran. The results are
+written as JSON; pass the JSON of an earlier run (e.g. of another commit) with
+--compare to see what changed.
+
+The dummy model's 3s delay is left out (see --model-delay), so the I/O dominates.
+Uses the INPUT/OUTPUT settings of config.yml, so e.g. STREAM_EXTRACT can be
+compared by running the benchmark once with and once without it.
+
+Run with: python -m tests.benchmark.e2e_benchmark --help
+"""
+
+from argparse import ArgumentParser
+from collections import Counter
+import io
+import itertools
+import json
+import os
+import subprocess
+import tarfile
+import threading
+from time import perf_counter, sleep, time
+from typing import Any, Callable, Dict, List, Optional
+
+import boto3
+from moto import mock_aws
+
+from dane.config import cfg
+import main_data_processor
+from models import ProcessingTask
+
+
+MB = 1024 * 1024
+
+
+class StageMonitor:
+    """Times the processing stages, and samples the RSS and disk use in the
+    background, attributing the samples to the stage that is running"""
+
+    def __init__(self, disk_dir: str, interval: float = 0.02):
+        self.disk_dir = disk_dir
+        self.interval = interval
+        self.stage: Optional[str] = None
+        self.durations: Dict[str, List[float]] = {}
+        self.peak_rss: Dict[str, int] = {}
+        self.peak_disk: Dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+
+    def wrap(self, name: str, stage_fn: Callable[[ProcessingTask], None]):
+        def timed_stage(task: ProcessingTask) -> None:
+            self.stage = name
+            start = perf_counter()
+            try:
+                stage_fn(task)
+            finally:
+                self.durations.setdefault(name, []).append(perf_counter() - start)
+                self._record(name)  # also catch stages shorter than the interval
+                self.stage = None
+
+        return timed_stage
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if self.stage:
+                self._record(self.stage)
+
+    def _record(self, stage: str) -> None:
+        self.peak_rss[stage] = max(self.peak_rss.get(stage, 0), current_rss())
+        self.peak_disk[stage] = max(
+            self.peak_disk.get(stage, 0), dir_size(self.disk_dir)
+        )
+
+
+def current_rss() -> int:
+    """Return the resident memory of this process in bytes (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:  # removed in the meantime
+                pass
+    return total
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the p-th percentile (nearest rank) of values"""
+    ordered = sorted(values)
+    return ordered[max(0, int(round(p / 100 * len(ordered))) - 1)]
+
+
+def create_input_archive(
+    source_id: str, input_size: int, members: int, output_words: int
+) -> bytes:
+    """Return a .tar.gz of about input_size bytes, with <source_id>.input and
+    (members - 1) other files. The first line of the .input file has output_words
+    words, which determines the size of the dummy model's output"""
+    member_size = input_size // members
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=1) as tar:
+        first_line = b" ".join([b"word"] * output_words) + b"\n"
+        data = first_line + os.urandom(max(member_size - len(first_line), 0))
+        for i in range(members):
+            info = tarfile.TarInfo(f"{source_id}.input" if i == 0 else f"member{i}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            data = os.urandom(member_size)  # random, so it does not compress
+    return buffer.getvalue()
+
+
+def run_case(
+    client, input_size_mb: int, members: int, output_words: int, tasks: int
+) -> Dict[str, Any]:
+    """Process tasks inputs of the same shape, one after the other"""
+    monitor = StageMonitor(cfg.FILE_SYSTEM.BASE_MOUNT)
+    original_stages = list(main_data_processor.STAGES)
+    main_data_processor.STAGES[:] = [
+        (name, monitor.wrap(name, fn)) for name, fn in original_stages
+    ]
+    latencies, states = [], Counter()
+    case_id = f"{input_size_mb}mb{members}m{output_words}w"
+    try:
+        with monitor:
+            start = perf_counter()
+            for i in range(tasks):
+                # a unique source_id per task, so no output is reused
+                source_id = f"{case_id}{i}__bench{int(time() * 1000)}"
+                key = f"{cfg.INPUT.S3_FOLDER_IN_BUCKET}/prep__{source_id}.tar.gz"
+                client.put_object(
+                    Bucket=cfg.INPUT.S3_BUCKET,
+                    Key=key,
+                    Body=create_input_archive(
+                        source_id, input_size_mb * MB, members, output_words
+                    ),
+                )
+                task_start = perf_counter()
+                response, _ = main_data_processor.run(
+                    f"s3://{cfg.INPUT.S3_BUCKET}/{key}"
+                )
+                latencies.append(perf_counter() - task_start)
+                states[response["state"]] += 1
+            duration = sum(latencies)
+            wall_time = perf_counter() - start
+    finally:
+        main_data_processor.STAGES[:] = original_stages
+
+    return {
+        "input_size_mb": input_size_mb,
+        "members": members,
+        "output_words": output_words,
+        "tasks": tasks,
+        "states": {str(k): v for k, v in states.items()},
+        "wall_time_s": wall_time,
+        "throughput_tasks_per_s": tasks / duration,
+        "throughput_input_mb_per_s": tasks * input_size_mb / duration,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+        },
+        "stages": {
+            name: {
+                "p50_ms": percentile(durations, 50) * 1000,
+                "p95_ms": percentile(durations, 95) * 1000,
+                "peak_rss_mb": monitor.peak_rss.get(name, 0) / MB,
+                "peak_disk_mb": monitor.peak_disk.get(name, 0) / MB,
+            }
+            for name, durations in monitor.durations.items()
+        },
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    """Print the latency and throughput of each case against the previous run"""
+
+    def case_key(case):
+        return case["input_size_mb"], case["members"], case["output_words"]
+
+    previous_cases = {case_key(c): c for c in previous["cases"]}
+    print(f"Compared with {previous.get('commit') or 'previous run'}:")
+    for case in results["cases"]:
+        before = previous_cases.get(case_key(case))
+        if not before:
+            continue
+        for label, now, then in [
+            ("p50 ms", case["latency_ms"]["p50"], before["latency_ms"]["p50"]),
+            ("p95 ms", case["latency_ms"]["p95"], before["latency_ms"]["p95"]),
+            (
+                "tasks/s",
+                case["throughput_tasks_per_s"],
+                before["throughput_tasks_per_s"],
+            ),
+        ]:
+            change = (now - then) / then * 100 if then else 0
+            print(
+                f"  {case_key(case)} {label:>8}: {then:10.1f} -> {now:10.1f}"
+                f" ({change:+.1f}%)"
+            )
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--input-sizes-mb", default="1,16", help="comma separated")
+    parser.add_argument("--members", default="1,50", help="comma separated")
+    parser.add_argument("--output-words", default="10,100000", help="comma separated")
+    parser.add_argument("--tasks", type=int, default=5, help="tasks per case")
+    parser.add_argument("--model-delay", type=float, default=0, help="in seconds")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="JSON of an earlier run")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["MOTO_S3_CUSTOM_ENDPOINTS"] = ",".join(
+        {cfg.INPUT.S3_ENDPOINT_URL, cfg.OUTPUT.S3_ENDPOINT_URL}
+    )
+    main_data_processor.DUMMY_MODEL_DELAY_S = args.model_delay
+
+    def as_ints(value: str) -> List[int]:
+        return [int(v) for v in value.split(",")]
+
+    cases = []
+    with mock_aws():
+        client = boto3.client("s3")
+        for bucket in {cfg.INPUT.S3_BUCKET, cfg.OUTPUT.S3_BUCKET}:
+            client.create_bucket(Bucket=bucket)
+        for input_size_mb, members, output_words in itertools.product(
+            as_ints(args.input_sizes_mb),
+            as_ints(args.members),
+            as_ints(args.output_words),
+        ):
+            case = run_case(client, input_size_mb, members, output_words, args.tasks)
+            print(
+                f"{input_size_mb:>4} MB, {members:>4} members, {output_words:>7} words:"
+                f" p50 {case['latency_ms']['p50']:8.1f} ms,"
+                f" p95 {case['latency_ms']['p95']:8.1f} ms,"
+                f" {case['throughput_input_mb_per_s']:7.1f} MB/s, states {case['states']}"
+            )
+            cases.append(case)
+            sleep(0.1)  # let the deleted files settle before the next case
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time(),
+        "settings": {
+            "INPUT": {k: v for k, v in cfg.INPUT.items() if "S3" not in k},
+            "OUTPUT": {k: v for k, v in cfg.OUTPUT.items() if "S3" not in k},
+            "model_delay_s": args.model_delay,
+        },
+        "cases": cases,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Wrote results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
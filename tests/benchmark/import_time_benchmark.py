@@ -0,0 +1,79 @@
+"""Start up benchmark: how long does importing the worker's modules take?
+
+Uses python -X importtime in a fresh interpreter, so nothing is imported yet.
+The import times (IMPORT_BUDGETS_MS) depend on the machine, so they're only
+reported here; tests/unit/import_time_test.py enforces what doesn't: the number
+of modules imported (MODULE_BUDGETS) and the DEFERRED_IMPORTS.
+
+Run with: python -m tests.benchmark.import_time_benchmark [module ...]
+"""
+
+import subprocess
+import sys
+from typing import Dict, List
+
+# max import time (ms) of the modules imported on start up, with some slack for
+# slower machines; main_data_processor is all that --run-test-file needs
+IMPORT_BUDGETS_MS = {
+    "worker": 50,
+    "main_data_processor": 500,
+    "example_worker": 800,
+}
+# max number of modules imported (besides those of the interpreter's start up);
+# each one adds import time, on any machine
+MODULE_BUDGETS = {
+    "worker": 20,
+    "main_data_processor": 300,
+    "example_worker": 450,
+}
+# heavy dependencies that must be imported only once they are actually used
+DEFERRED_IMPORTS = {
+    "worker": ["dane", "boto3", "pika", "elasticsearch7"],
+    "main_data_processor": ["boto3", "botocore", "pika", "elasticsearch7"],
+    "example_worker": ["boto3", "botocore"],
+}
+
+
+def measure_imports(module: str) -> Dict[str, float]:
+    """Import module in a new interpreter, return the cumulative import time (ms)
+    of each module that was imported (also by the interpreter's start up)"""
+    return _import_times(f"import {module}")
+
+
+def count_imported_modules(module: str) -> int:
+    """Return the number of modules importing module adds to a bare interpreter"""
+    return len(set(measure_imports(module)) - set(_import_times("pass")))
+
+
+def _import_times(code: str) -> Dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        timings[name.strip()] = int(cumulative) / 1000
+    return timings
+
+
+def slowest_imports(timings: Dict[str, float], n: int = 10) -> List[str]:
+    return [
+        f"{ms:8.1f} ms  {name}"
+        for name, ms in sorted(timings.items(), key=lambda t: -t[1])[:n]
+    ]
+
+
+if __name__ == "__main__":
+    for module in sys.argv[1:] or IMPORT_BUDGETS_MS:
+        timings = measure_imports(module)
+        print(
+            f"{module}: {timings[module]:.1f} ms (budget {IMPORT_BUDGETS_MS.get(module)})"
+            f", {count_imported_modules(module)} modules"
+            f" (budget {MODULE_BUDGETS.get(module)})"
+        )
+        print("\n".join(slowest_imports(timings)))
@@ -0,0 +1,59 @@
+"""Micro-benchmark of the per-task S3 client setup cost, against moto.
+
+Compares creating a new S3Store for each task (as done before) with reusing the
+pooled client from io_util.get_s3_client. Each "task" does one HEAD request.
+
+Run with: python -m tests.benchmark.s3_client_benchmark [number of tasks]
+"""
+
+import os
+import sys
+from statistics import median
+from time import perf_counter
+
+from moto import mock_aws
+
+from dane.config import cfg
+from dane.s3_util import S3Store
+from io_util import get_s3_client
+
+
+def per_task_ms(setup_and_head, tasks: int) -> list:
+    timings = []
+    for _ in range(tasks):
+        start = perf_counter()
+        setup_and_head()
+        timings.append((perf_counter() - start) * 1000)
+    return timings
+
+
+def main(tasks: int) -> None:
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["MOTO_S3_CUSTOM_ENDPOINTS"] = cfg.OUTPUT.S3_ENDPOINT_URL
+    bucket, key = cfg.OUTPUT.S3_BUCKET, "benchmark/object"
+
+    with mock_aws():
+        client = get_s3_client(cfg.OUTPUT)
+        client.create_bucket(Bucket=bucket)
+        client.put_object(Bucket=bucket, Key=key, Body=b"x")
+
+        def new_store():
+            S3Store(cfg.OUTPUT.S3_ENDPOINT_URL).client.head_object(
+                Bucket=bucket, Key=key
+            )
+
+        def pooled_client():
+            get_s3_client(cfg.OUTPUT).head_object(Bucket=bucket, Key=key)
+
+        for name, fn in [("new S3Store", new_store), ("pooled client", pooled_client)]:
+            timings = per_task_ms(fn, tasks)
+            print(
+                f"{name:>14}: median {median(timings):.2f} ms, "
+                f"max {max(timings):.2f} ms per task ({tasks} tasks)"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -1,13 +1,34 @@
+from mockito import ANY, unstub, when
 from moto import mock_aws
 import boto3
 import pytest
+import hashlib
+import json
 import os
 import shutil
 import tarfile
 
+import io_util
+import main_data_processor
 from main_data_processor import run
 from dane.config import cfg
-from io_util import untar_input_file, S3_OUTPUT_TYPES
+from boto3.s3.transfer import TransferConfig
+from disk_budget import DiskBudget
+from input_cache import InputCache
+from io_util import (
+    obtain_input_file,
+    untar_input_file,
+    download_s3_object,
+    stream_tar_to_s3,
+    stream_untar_s3_object,
+    upload_output_objects,
+    upload_s3_object,
+    S3_OUTPUT_TYPES,
+    S3_MIN_PART_SIZE,
+    S3RangedReader,
+)
+from model_registry import BUILTIN_MODEL_VERSION, VERSION_KEY, ModelRegistry
+from stage_journal import STAGE_DOWNLOAD, STAGE_MODEL_OUTPUT, StageJournal
 
 
 source_id = "resource__carrier"
@@ -88,9 +109,7 @@ def test_main_data_processor(aws, aws_credentials, create_and_fill_buckets, setu
     Relies on fixtures: aws, aws_credentials, create_and_fill_buckets, setup_fs"""
     if cfg.OUTPUT.TRANSFER_ON_COMPLETION:
         # run the main data processor
-        run(
-            input_file_path=f"s3://{cfg.INPUT.S3_BUCKET}/{key_in}"
-        )
+        run(input_file_path=f"s3://{cfg.INPUT.S3_BUCKET}/{key_in}")
 
         # Check if the output is present in S3
         client = boto3.client("s3")
@@ -111,3 +130,212 @@ def test_main_data_processor(aws, aws_credentials, create_and_fill_buckets, setu
     else:
         print("Not configured to transfer output!")
         assert False
+
+
+def test_resume_from_stage_journal(
+    aws, aws_credentials, create_and_fill_buckets, tmp_path
+):
+    """Test that a redelivered task skips the stages an earlier attempt finished.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets"""
+    journal = StageJournal(str(tmp_path))
+    s3_uri = f"s3://{cfg.INPUT.S3_BUCKET}/{key_in}"
+    try:
+        when(main_data_processor).get_stage_journal().thenReturn(journal)
+        # the first attempt "dies" before its output was uploaded
+        when(main_data_processor).transfer_output(ANY, ANY).thenReturn(False)
+        response, _ = run(input_file_path=s3_uri)
+        assert response["state"] == 500
+        assert journal.get(source_id, STAGE_DOWNLOAD)
+        assert journal.get(source_id, STAGE_MODEL_OUTPUT)
+
+        unstub(main_data_processor.transfer_output)
+        response, provenance = run(input_file_path=s3_uri)
+        assert response["state"] == 200
+        assert provenance and provenance.steps
+        assert [
+            (step.activity_name, step.output_data.get("skipped"))
+            for step in provenance.steps
+        ] == [("download", True), ("apply model", True)]
+        assert journal.get(source_id, STAGE_DOWNLOAD) is None  # the task is done
+    finally:
+        unstub()
+
+
+def test_stream_untar_s3_object(
+    aws, aws_credentials, create_and_fill_buckets, setup_fs
+):
+    """Test extracting the input archive while streaming it from mocked S3.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets, setup_fs"""
+    client = boto3.client("s3")
+    assert stream_untar_s3_object(client, cfg.INPUT.S3_BUCKET, key_in, source_id)
+    # only the extracted member is written, not the archive itself
+    assert os.listdir(source_id) == [f"{source_id}.input"]
+
+
+def test_stream_tar_to_s3(aws, aws_credentials, create_and_fill_buckets, setup_fs):
+    """Test compressing output straight into a (multipart) upload to mocked S3.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets, setup_fs"""
+    output_dir = os.path.join(source_id, "foobar")
+    os.makedirs(output_dir)
+    data = os.urandom(S3_MIN_PART_SIZE + 1024)  # incompressible, so 2 parts
+    with open(os.path.join(output_dir, "features.bin"), "wb") as f:
+        f.write(data)
+
+    client = boto3.client("s3")
+    assert stream_tar_to_s3(client, cfg.OUTPUT.S3_BUCKET, key_out, [output_dir])
+
+    client.download_file(Bucket=cfg.OUTPUT.S3_BUCKET, Key=key_out, Filename=tar_out)
+    with tarfile.open(tar_out) as tar:
+        member = tar.extractfile("foobar/features.bin")
+        assert member is not None and member.read() == data
+
+
+def test_upload_output_objects(aws, aws_credentials, create_and_fill_buckets, setup_fs):
+    """Test uploading each output file as object, listed in a manifest.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets, setup_fs"""
+    contents = {
+        "foobar/a.txt": b"a",
+        "foobar/sub/b.txt": b"bb",
+        "provenance/p.json": b"{}",
+    }
+    for rel_path, data in contents.items():
+        os.makedirs(os.path.dirname(os.path.join(source_id, rel_path)), exist_ok=True)
+        with open(os.path.join(source_id, rel_path), "wb") as f:
+            f.write(data)
+
+    client = boto3.client("s3")
+    bucket = cfg.OUTPUT.S3_BUCKET
+    prefix = f"{cfg.OUTPUT.S3_FOLDER_IN_BUCKET}/{source_id}"
+    manifest_key = f"{prefix}/manifest.json"
+    dirs = [os.path.join(source_id, d) for d in ["foobar", "provenance"]]
+    assert upload_output_objects(
+        client, bucket, prefix, manifest_key, dirs, metadata={"fingerprint": "x"}
+    )
+
+    response = client.get_object(Bucket=bucket, Key=manifest_key)
+    assert response["Metadata"] == {"fingerprint": "x"}
+    manifest = json.loads(response["Body"].read())
+    assert sorted(o["key"] for o in manifest["objects"]) == [
+        f"{prefix}/{rel_path}" for rel_path in sorted(contents)
+    ]
+    for entry in manifest["objects"]:
+        data = contents[entry["key"][len(prefix) + 1 :]]
+        assert entry["size"] == len(data)
+        assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+        body = client.get_object(Bucket=bucket, Key=entry["key"])["Body"].read()
+        assert body == data
+
+
+def test_parallel_part_transfers(
+    aws, aws_credentials, create_and_fill_buckets, setup_fs
+):
+    """Test multipart upload and ranged (parallel) download of a large object.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets, setup_fs"""
+    part_size = S3_MIN_PART_SIZE
+    transfer_config = TransferConfig(
+        multipart_threshold=part_size, multipart_chunksize=part_size, max_concurrency=3
+    )
+    data = os.urandom(2 * part_size + 1024)
+    file_path = os.path.join(source_id, "large.bin")
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+    client = boto3.client("s3")
+    key = f"{cfg.OUTPUT.S3_FOLDER_IN_BUCKET}/{source_id}/large.bin"
+    assert upload_s3_object(
+        client, cfg.OUTPUT.S3_BUCKET, key, file_path, transfer_config
+    )
+    # uploaded as 3 parts
+    assert client.head_object(Bucket=cfg.OUTPUT.S3_BUCKET, Key=key)["ETag"].endswith(
+        '-3"'
+    )
+
+    download_dir = os.path.join(source_id, "download")
+    assert download_s3_object(
+        client, cfg.OUTPUT.S3_BUCKET, key, download_dir, transfer_config
+    )
+    with open(os.path.join(download_dir, "large.bin"), "rb") as f:
+        assert f.read() == data
+
+    # the streaming reader returns the ranges in order, whatever the read size
+    reader = S3RangedReader(client, cfg.OUTPUT.S3_BUCKET, key, transfer_config)
+    chunks = []
+    while chunk := reader.read(1000 * 1000):
+        chunks.append(chunk)
+    reader.close()
+    assert b"".join(chunks) == data
+
+
+def test_reuse_existing_output(aws, aws_credentials, create_and_fill_buckets, setup_fs):
+    """Test that processing the same input twice reuses the output of the first run.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets, setup_fs"""
+    if not cfg.OUTPUT.get("REUSE_EXISTING_OUTPUT", False):
+        pytest.skip("Not configured to reuse existing output")
+
+    input_uri = f"s3://{cfg.INPUT.S3_BUCKET}/{key_in}"
+    response, _ = run(input_file_path=input_uri)
+    assert response["state"] == 200
+    client = boto3.client("s3")
+    first_upload = client.head_object(Bucket=cfg.OUTPUT.S3_BUCKET, Key=key_out)
+
+    response, provenance = run(input_file_path=input_uri)
+    assert response == {
+        "state": 200,
+        "message": "Output already exists, skipped processing",
+    }
+    assert provenance and provenance.steps[0].activity_name == "reuse output"
+    # the output was not uploaded again
+    second_upload = client.head_object(Bucket=cfg.OUTPUT.S3_BUCKET, Key=key_out)
+    assert second_upload["LastModified"] == first_upload["LastModified"]
+
+
+def test_model_registry(aws, aws_credentials, create_and_fill_buckets, tmp_path):
+    """Test loading the model once, and reloading it when a new version is published.
+    Relies on fixtures: aws, aws_credentials, create_and_fill_buckets"""
+    client = boto3.client("s3")
+    bucket = cfg.INPUT.S3_BUCKET_MODEL
+    registry = ModelRegistry(client, bucket, str(tmp_path), check_interval=0.001)
+    # nothing published yet
+    assert registry.get().version == BUILTIN_MODEL_VERSION
+
+    for version, greeting in [("v1", "Hello"), ("v2", "Goodbye")]:
+        client.put_object(
+            Bucket=bucket,
+            Key=f"{version}/model.json",
+            Body=f'{{"greeting": "{greeting}"}}',
+        )
+        client.put_object(Bucket=bucket, Key=VERSION_KEY, Body=version)
+        model = registry.get()
+        assert model.version == version
+        assert model.params == {"greeting": greeting}
+        assert os.path.exists(os.path.join(tmp_path, version, "model.json"))
+    # the same model is handed out as long as the version does not change
+    assert registry.get() is model
+
+
+def test_disk_admission(aws, aws_credentials, create_and_fill_buckets, tmp_path):
+    """A missing input is reported as such (not as lack of disk space), and an input
+    cache hit needs no disk space"""
+    s3_uri = f"s3://{cfg.INPUT.S3_BUCKET}/{key_in}"
+    missing_key = f"{cfg.INPUT.S3_FOLDER_IN_BUCKET}/prep__missing__carrier.tar.gz"
+    try:
+        budget = DiskBudget(str(tmp_path / "reservations"), budget=1)  # 1 byte
+        when(io_util).get_disk_budget().thenReturn(budget)
+        assert obtain_input_file(f"s3://{cfg.INPUT.S3_BUCKET}/{missing_key}").state == (
+            404
+        )
+        assert obtain_input_file(s3_uri).state == 507
+
+        cache = InputCache(str(tmp_path / "cache"), 10**9)
+        etag = (
+            boto3.client("s3")
+            .head_object(Bucket=cfg.INPUT.S3_BUCKET, Key=key_in)["ETag"]
+            .strip('"')
+        )
+        cache.acquire(cfg.INPUT.S3_BUCKET, key_in, etag, lambda folder: folder)
+        when(io_util).get_input_cache().thenReturn(cache)
+        model_input = obtain_input_file(s3_uri)
+        assert model_input.state == 200 and model_input.disk_reservation is None
+        assert model_input.provenance.output_data["cache_hit"]
+    finally:
+        unstub()
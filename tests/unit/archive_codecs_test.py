@@ -0,0 +1,114 @@
+import gzip
+import io
+import os
+import pytest
+import threading
+
+from archive_codecs import (
+    ARCHIVE_FORMATS,
+    GZIP_BLOCK_SIZE,
+    archive_format_of,
+    extract_archive,
+    get_archive_format,
+    strip_archive_extension,
+    write_archive,
+)
+
+
+def _write_input(folder) -> list:
+    """Write a few files, one spanning several gzip blocks (i.e. members)"""
+    files = []
+    for name, size in [("small.txt", 10), ("large.bin", 3 * GZIP_BLOCK_SIZE + 5)]:
+        path = os.path.join(folder, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size // 2) + b"x" * (size - size // 2))
+        files.append(path)
+    return files
+
+
+@pytest.mark.parametrize("archive_format", ARCHIVE_FORMATS, ids=lambda f: f.name)
+def test_archive_round_trip(tmp_path, archive_format):
+    if not archive_format.is_available():
+        pytest.skip(f"{archive_format.module} is not installed")
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    files = _write_input(str(src))
+
+    archive = io.BytesIO()
+    write_archive(archive, files, archive_format, level=1, threads=3)
+    archive.seek(0)
+    extract_archive(archive, str(dst), archive_format)
+
+    for path in files:
+        with open(path, "rb") as f1, open(dst / os.path.basename(path), "rb") as f2:
+            assert f1.read() == f2.read()
+
+
+def test_only_matching_members_are_extracted(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    files = _write_input(str(src))
+    (src / "keyframes").mkdir()
+    (src / "keyframes" / "1.jpg").write_bytes(b"jpg")
+
+    archive = io.BytesIO()
+    gzip_format = get_archive_format("gzip")
+    write_archive(archive, files + [str(src / "keyframes")], gzip_format, 1, 1)
+    archive.seek(0)
+    report = extract_archive(
+        archive, str(tmp_path / "dst"), gzip_format, ["*.bin", "*.txt"], threads=2
+    )
+
+    assert sorted(os.listdir(tmp_path / "dst")) == ["large.bin", "small.txt"]
+    for path in files:
+        with (
+            open(path, "rb") as f1,
+            open(tmp_path / "dst" / os.path.basename(path), "rb") as f2,
+        ):
+            assert f1.read() == f2.read()
+    assert sorted(report.skipped) == ["keyframes", "keyframes/1.jpg"]
+    assert report.skipped_bytes == 3
+
+
+def test_truncated_archive_fails_extraction(tmp_path):
+    """A member that is cut off must fail the extraction, not hang its writer"""
+    (tmp_path / "large.bin").write_bytes(os.urandom(5 * 1024 * 1024))
+    archive = io.BytesIO()
+    tar_format = get_archive_format("tar")
+    write_archive(archive, [str(tmp_path / "large.bin")], tar_format, 0, 1)
+    truncated = io.BytesIO(archive.getvalue()[: 3 * 1024 * 1024])
+
+    errors: list = []
+
+    def extract():
+        try:
+            extract_archive(truncated, str(tmp_path / "dst"), tar_format, ["*"], 2)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=extract, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "extraction hangs on a truncated archive"
+    assert errors
+
+
+def test_parallel_gzip_is_regular_gzip(tmp_path):
+    """Multi-member output of ParallelGzipWriter is readable by the gzip module"""
+    files = _write_input(str(tmp_path))
+    archive = io.BytesIO()
+    write_archive(archive, files, get_archive_format("gzip"), level=6, threads=4)
+    with gzip.open(io.BytesIO(archive.getvalue())) as f:
+        assert len(f.read()) > 3 * GZIP_BLOCK_SIZE
+
+
+def test_archive_format_of():
+    assert archive_format_of("s3://bucket/a/b__x.tar.gz").name == "gzip"
+    assert archive_format_of("b__x.tar.zst").name == "zstd"
+    assert archive_format_of("b__x.tar").name == "tar"
+    assert archive_format_of("b__x.mp4") is None
+    assert strip_archive_extension("b__x.tar.lz4") == "b__x"
+    assert strip_archive_extension("b__x.mp4") == "b__x.mp4"
+    with pytest.raises(ValueError):
+        get_archive_format("rar")
@@ -0,0 +1,48 @@
+import tarfile
+from mockito import unstub, when
+
+import batch_runner
+from batch_runner import BatchJournal, list_batch_inputs, run_batch
+
+
+def test_journal_resumes_completed_inputs(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = BatchJournal(path)
+    journal.record("source__a", 200, "Successfully applied model", 1.0)
+    journal.record("source__b", 500, "Failed to apply model", 1.0)
+    with open(path, "a") as f:
+        f.write('{"source_id": "source__c", "sta')  # cut off by an interruption
+
+    # only inputs that were processed fine are skipped when resuming
+    assert BatchJournal(path).completed == {"source__a"}
+
+
+def test_list_local_batch_inputs(tmp_path):
+    extracted = tmp_path / "source__a"
+    extracted.mkdir()
+    (extracted / "source__a.input").write_text("some input")
+    input_file = tmp_path / "source__b.input"
+    input_file.write_text("other input")
+    with tarfile.open(tmp_path / "prep__source__b.tar.gz", "w:gz") as tar:
+        tar.add(input_file, arcname=input_file.name)
+    (tmp_path / "notes.txt").write_text("not an input")
+
+    inputs = list_batch_inputs(str(tmp_path))
+    assert [(i.source_id, i.size > 0) for i in inputs] == [
+        ("source__b", True),
+        ("source__a", True),
+    ]
+
+
+def test_failed_inputs_do_not_count_as_processed(tmp_path):
+    for source_id in ["source__a", "source__b"]:
+        (tmp_path / f"{source_id}.input").write_text("some input")
+    failures = {"source__b": {"state": 500, "message": "Failed to apply model"}}
+    when(batch_runner)._process_all(...).thenReturn(({200: 1, 500: 1}, failures, 10))
+    try:
+        summary = run_batch(str(tmp_path), str(tmp_path / "journal.jsonl"), 2)
+    finally:
+        unstub()
+    assert summary["processed"] == 1 and summary["failed"] == 1
+    assert summary["failures"] == failures
+    assert summary["inputs_per_s"] > 0
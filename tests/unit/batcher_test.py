@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from batcher import MicroBatcher
+
+
+def test_batcher_groups_concurrent_items():
+    """Items submitted at the same time end up in full batches, the remainder is
+    processed after max_wait_ms, and each item gets its own result"""
+    batches: list = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=2, max_wait_ms=200)
+    with ThreadPoolExecutor(3) as executor:
+        results = list(
+            executor.map(lambda i: batcher.submit(i).result(timeout=5), range(3))
+        )
+    batcher.stop()
+
+    assert results == [0, 2, 4]
+    assert sorted(len(batch) for batch in batches) == [1, 2]
+
+
+def test_batcher_reports_errors_to_all_items():
+    def fail(items):
+        raise ValueError("failed")
+
+    batcher = MicroBatcher(fail, max_batch_size=2, max_wait_ms=10)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    batcher.stop()
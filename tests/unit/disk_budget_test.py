@@ -0,0 +1,42 @@
+import os
+import threading
+from time import time
+
+from disk_budget import RESERVATION_SUFFIX, DiskBudget
+
+
+def test_reservations_stay_within_budget(tmp_path):
+    budget = DiskBudget(str(tmp_path), budget=100)
+    first = budget.reserve(60)
+    assert first and budget.reserved() == 60
+    # does not fit, and is rejected once the timeout passed
+    start = time()
+    assert budget.reserve(50, timeout=0.2) is None
+    assert time() - start >= 0.2
+    assert budget.reserve(200) is None  # never fits
+
+    budget.release(first)
+    assert budget.reserved() == 0
+    assert budget.reserve(100)
+
+
+def test_waiting_task_is_admitted_after_release(tmp_path):
+    budget = DiskBudget(str(tmp_path), budget=100, poll_interval=0.01)
+    first = budget.reserve(80)
+    threading.Timer(0.1, budget.release, [first]).start()
+    assert budget.reserve(80, timeout=5)
+
+
+def test_reservations_of_stopped_processes_are_removed(tmp_path):
+    # a reservation file that nobody holds a lock on was left by a dead process
+    stale = tmp_path / f"stale{RESERVATION_SUFFIX}"
+    stale.write_text("1000")
+    budget = DiskBudget(str(tmp_path), budget=100)
+    assert budget.reserved() == 0
+    assert not os.path.exists(stale)
+
+
+def test_free_space_is_used_without_budget(tmp_path):
+    budget = DiskBudget(str(tmp_path), min_free=0)
+    assert budget.reserve(1)
+    assert budget.reserve(2**60) is None  # more than any disk
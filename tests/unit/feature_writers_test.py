@@ -0,0 +1,42 @@
+import json
+import pytest
+
+from feature_writers import (
+    CHUNK_INDEX_FILE,
+    get_feature_format,
+    map_npy,
+    open_feature_writer,
+)
+
+
+def test_npy_features_are_mapped_without_parsing(tmp_path):
+    path = str(tmp_path / "features.npy")
+    # a buffer of 2 rows, so the rows are written in 3 blocks
+    with open_feature_writer(path, get_feature_format("npy"), "float32", 2, 16) as w:
+        for i in range(5):
+            w.write([(i, i / 2)])
+    with map_npy(path) as (shape, values):
+        assert shape == (5, 2)
+        assert values.tolist() == [v for i in range(5) for v in (i, i / 2)]
+
+
+def test_chunked_features_are_indexed(tmp_path):
+    path = str(tmp_path / "features.chunks")
+    writer = open_feature_writer(path, get_feature_format("chunked"), "int64", 3, 48)
+    writer.write((i, i, i) for i in range(5))
+    writer.close()
+
+    with open(tmp_path / "features.chunks" / CHUNK_INDEX_FILE) as f:
+        index = json.load(f)
+    assert index["rows"] == 5 and index["dtype"][1:] == "i8"
+    assert [c["rows"] for c in index["chunks"]] == [2, 2, 1]
+    with map_npy(str(tmp_path / "features.chunks" / "chunk-00002.npy")) as (_, values):
+        assert values.tolist() == [4, 4, 4]
+
+
+def test_rows_of_the_wrong_size_are_rejected(tmp_path):
+    with open_feature_writer(
+        str(tmp_path / "features.npy"), get_feature_format("npy"), "float64", 2
+    ) as w:
+        with pytest.raises(ValueError):
+            w.write([(1, 2, 3)])
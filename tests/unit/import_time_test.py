@@ -0,0 +1,22 @@
+import pytest
+
+from tests.benchmark.import_time_benchmark import (
+    DEFERRED_IMPORTS,
+    MODULE_BUDGETS,
+    count_imported_modules,
+    measure_imports,
+    slowest_imports,
+)
+
+
+@pytest.mark.parametrize("module", MODULE_BUDGETS.keys())
+def test_import_budget(module):
+    """Importing the worker must stay fast, as it's paid on every (pod) start. The
+    time itself depends on the machine (see tests/benchmark/import_time_benchmark
+    .py), so the budget is on the heavy imports and the number of modules"""
+    timings = measure_imports(module)
+    deferred = [name for name in DEFERRED_IMPORTS[module] if name in timings]
+    assert not deferred, f"{module} imports {deferred} up front"
+    assert count_imported_modules(module) <= MODULE_BUDGETS[module], "\n".join(
+        slowest_imports(timings)
+    )
@@ -0,0 +1,90 @@
+import os
+import threading
+
+from input_cache import InputCache
+
+
+def _fill_with(size: int, calls: list):
+    """Return a fill function that writes an input file of size bytes"""
+
+    def fill(folder: str):
+        calls.append(folder)
+        with open(os.path.join(folder, "source.input"), "wb") as f:
+            f.write(b"x" * size)
+        return folder
+
+    return fill
+
+
+def test_cache_hit_skips_fill(tmp_path):
+    cache = InputCache(str(tmp_path), max_size=1000)
+    calls: list = []
+    path, hit = cache.acquire("bucket", "key", "etag1", _fill_with(10, calls))
+    assert not hit and os.path.exists(os.path.join(path, "source.input"))
+    cache.release(path)
+
+    path2, hit = cache.acquire("bucket", "key", "etag1", _fill_with(10, calls))
+    assert hit and path2 == path and len(calls) == 1
+
+    # a new ETag (i.e. changed input) is a different entry
+    _, hit = cache.acquire("bucket", "key", "etag2", _fill_with(10, calls))
+    assert not hit and len(calls) == 2
+
+    # entries survive a restart of the worker
+    _, hit = InputCache(str(tmp_path), 1000).acquire(
+        "bucket", "key", "etag1", _fill_with(10, calls)
+    )
+    assert hit and len(calls) == 2
+
+
+def test_lru_eviction_skips_pinned_entries(tmp_path):
+    cache = InputCache(str(tmp_path), max_size=250)
+    calls: list = []
+    a, _ = cache.acquire("bucket", "a", "etag", _fill_with(100, calls))
+    b, _ = cache.acquire("bucket", "b", "etag", _fill_with(100, calls))
+    cache.release(b)
+    cache.release(a)  # a is now the most recently used...
+    cache.acquire("bucket", "a", "etag", _fill_with(100, calls))
+    cache.release(a)
+
+    # ...so adding c evicts b
+    c, _ = cache.acquire("bucket", "c", "etag", _fill_with(100, calls))
+    assert os.path.exists(a) and not os.path.exists(b) and os.path.exists(c)
+
+    # pinned entries are never evicted, even when over budget
+    d, _ = cache.acquire("bucket", "d", "etag", _fill_with(200, calls))
+    assert not os.path.exists(a) and os.path.exists(c) and os.path.exists(d)
+    cache.release(c)
+    assert not os.path.exists(c)
+
+
+def test_concurrent_tasks_share_a_single_fill(tmp_path):
+    cache = InputCache(str(tmp_path), max_size=1000)
+    calls: list = []
+    paths: list = []
+
+    def task():
+        paths.append(cache.acquire("bucket", "key", "etag", _fill_with(10, calls))[0])
+
+    threads = [threading.Thread(target=task) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len(set(paths)) == 1
+    assert cache._fill_locks == {}  # dropped once no task is filling
+
+
+def test_entries_pinned_by_another_process_are_not_evicted(tmp_path):
+    # each InputCache opens its own lock files, like separate processes would
+    cache = InputCache(str(tmp_path), max_size=150)
+    other_cache = InputCache(str(tmp_path), max_size=150)
+    calls: list = []
+    a, _ = cache.acquire("bucket", "a", "etag", _fill_with(100, calls))
+    b, _ = other_cache.acquire("bucket", "b", "etag", _fill_with(100, calls))
+    assert os.path.exists(a) and os.path.exists(b)
+
+    cache.release(a)
+    assert not os.path.exists(a) and os.path.exists(b)
+    _, hit = cache.acquire("bucket", "b", "etag", _fill_with(100, calls))
+    assert hit and len(calls) == 2
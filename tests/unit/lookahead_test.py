@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import sleep, time
+
+from lookahead import InputLookahead
+
+
+def _wait_until_stored(lookahead: InputLookahead, timeout: float = 5):
+    """Wait for the callbacks that store finished lookups, which run after their
+    Futures already returned the result"""
+    deadline = time() + timeout
+    while lookahead._resolving and time() < deadline:
+        sleep(0.01)
+
+
+def test_lookahead_batches_and_caches_lookups():
+    lookups: list = []
+    prefetched: list = []
+    done = threading.Event()
+
+    def resolve_batch(doc_ids):
+        lookups.append(sorted(doc_ids))
+        return {d: f"s3://bucket/{d}.tar.gz" for d in doc_ids if d != "missing"}
+
+    def prefetch(uri):
+        prefetched.append(uri)
+        done.set()
+
+    lookahead = InputLookahead(resolve_batch, prefetch, ttl=60, max_wait_ms=200)
+    # documents announced around the same time are looked up together
+    with ThreadPoolExecutor(3) as executor:
+        list(executor.map(lookahead.announce, ["a", "b", "missing"]))
+    assert lookahead.resolve("a").result(timeout=5) == "s3://bucket/a.tar.gz"
+    assert lookups == [["a", "b", "missing"]]
+    assert done.wait(timeout=5)
+    _wait_until_stored(lookahead)
+
+    # a found URI is remembered (e.g. for a redelivered task), a missing one is not
+    assert lookahead.resolve("b").result(timeout=5) == "s3://bucket/b.tar.gz"
+    assert lookahead.resolve("missing").result(timeout=5) == ""
+    assert lookups == [["a", "b", "missing"], ["missing"]]
+    lookahead.stop()
+    assert set(prefetched) <= {"s3://bucket/a.tar.gz", "s3://bucket/b.tar.gz"}
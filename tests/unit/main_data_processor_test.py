@@ -0,0 +1,33 @@
+from dane.config import cfg
+from mockito import ANY, unstub, verify, when
+
+import main_data_processor
+from main_data_processor import OPERATIONAL_SETTINGS, fetch_input, get_model_settings
+from models import ProcessingTask, ThisWorkerInput
+
+
+def test_operational_settings_do_not_change_the_fingerprint():
+    """e.g. raising MAX_CONCURRENT_TASKS must not invalidate reusable output"""
+    model_settings = get_model_settings()
+    assert "SETTING_0" in model_settings
+    assert "MAX_CONCURRENT_TASKS" in cfg.WORKER_SETTINGS
+    assert not OPERATIONAL_SETTINGS & set(model_settings)
+
+
+def test_no_lookups_before_download_without_output_reuse():
+    """the ETag and size are only requested (once) by obtain_input_file then"""
+    try:
+        when(main_data_processor).validate_data_dirs().thenReturn(True)
+        when(main_data_processor).reuse_output_enabled().thenReturn(False)
+        when(main_data_processor).get_stage_journal().thenReturn(None)
+        when(main_data_processor).obtain_input_file(ANY, "", None).thenReturn(
+            ThisWorkerInput(404, "Not found")
+        )
+        task = ProcessingTask("s3://test-input-bucket/assets/test__source.tar.gz")
+        fetch_input(task)
+
+        assert task.response == {"state": 404, "message": "Not found"}
+        verify(main_data_processor, times=0).get_input_info(...)
+        verify(main_data_processor, times=0).get_model(...)
+    finally:
+        unstub()
@@ -0,0 +1,39 @@
+from urllib.request import urlopen
+
+from metrics import (
+    STAGE_DURATION,
+    TASKS,
+    Histogram,
+    render_metrics,
+    start_metrics_server,
+    timed,
+)
+
+
+def test_histogram_buckets():
+    # in a registry of its own, so it doesn't show up in render_metrics()
+    histogram = Histogram(
+        "test_seconds", "Test histogram", ["stage"], (0.1, 1), registry=[]
+    )
+    for value in [0.05, 0.5, 5]:
+        histogram.observe(value, stage="test")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="test",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="test",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="test",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="test"} 3' in lines
+
+
+def test_metrics_endpoint():
+    with timed("unit_test"):
+        pass
+    TASKS.inc(state="200")
+    server = start_metrics_server(0)  # any free port
+    try:
+        port = server.server_address[1]
+        body = urlopen(f"http://localhost:{port}/metrics").read().decode()
+    finally:
+        server.shutdown()
+    assert body == render_metrics()
+    assert f'{STAGE_DURATION.name}_count{{stage="unit_test"}} 1' in body
+    assert "# TYPE dane_worker_tasks_total counter" in body
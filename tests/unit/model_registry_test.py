@@ -0,0 +1,109 @@
+import io
+import json
+import os
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+import pytest
+
+from model_registry import BUILTIN_MODEL_VERSION, VERSION_KEY, ModelRegistry
+
+
+class FakeS3:
+    """Model bucket of which the objects are kept in a dict (key -> bytes)"""
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+        self.downloads: list = []
+        self.unreachable = False
+
+    def get_object(self, Bucket, Key):
+        if self.unreachable:
+            raise EndpointConnectionError(endpoint_url=f"https://s3-host/{Bucket}")
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        keys = [key for key in self.objects if key.startswith(Prefix)]
+        return [{"Contents": [{"Key": key} for key in keys]}]
+
+    def download_file(self, bucket, key, file_path):
+        self.downloads.append(key)
+        with open(file_path, "wb") as f:
+            f.write(self.objects[key])
+
+    def publish(self, version: str, greeting: str):
+        self.objects[f"{version}/model.json"] = json.dumps(
+            {"greeting": greeting}
+        ).encode()
+        self.objects[VERSION_KEY] = version.encode()
+
+
+def _s3_with(*versions: str) -> FakeS3:
+    s3 = FakeS3({})
+    for version in versions:
+        s3.publish(version, f"hello from {version}")
+    return s3
+
+
+def test_current_version_is_downloaded_once(tmp_path):
+    s3 = _s3_with("v1")
+    model = ModelRegistry(s3, "models", str(tmp_path)).get()
+    assert model.version == "v1" and model.params == {"greeting": "hello from v1"}
+    assert os.path.exists(tmp_path / "v1" / "model.json")
+
+    # a restarted worker (or another process) loads it from disk
+    assert ModelRegistry(s3, "models", str(tmp_path)).get().version == "v1"
+    assert s3.downloads == ["v1/model.json"]
+    assert sorted(os.listdir(tmp_path)) == [".lock", "v1"]
+
+
+def test_pinned_version_is_used(tmp_path):
+    s3 = _s3_with("v1", "v2")
+    registry = ModelRegistry(s3, "models", str(tmp_path), "v1", check_interval=1)
+    registry._last_check = 0  # a check is due, but the version is pinned
+    assert registry.get().version == "v1"
+    assert registry.get().version == "v1"
+
+
+def test_builtin_model_only_without_a_published_version(tmp_path):
+    assert ModelRegistry(None, None, str(tmp_path)).get().version == (
+        BUILTIN_MODEL_VERSION
+    )
+    registry = ModelRegistry(FakeS3({}), "models", str(tmp_path))
+    assert registry.get().version == BUILTIN_MODEL_VERSION
+
+    # an unreachable bucket must not make the worker use the wrong model
+    s3 = _s3_with("v1")
+    s3.unreachable = True
+    with pytest.raises(EndpointConnectionError):
+        ModelRegistry(s3, "models", str(tmp_path)).get()
+
+
+def test_hot_reload(tmp_path):
+    s3 = _s3_with("v1")
+    registry = ModelRegistry(s3, "models", str(tmp_path), check_interval=1)
+    other_process = ModelRegistry(s3, "models", str(tmp_path))
+    v1 = registry.get()
+    assert other_process.get().version == "v1"
+
+    # a failing check keeps the current model
+    s3.unreachable = True
+    registry._last_check = 0
+    assert registry.get() is v1
+
+    s3.unreachable = False
+    s3.publish("v2", "hello from v2")
+    registry._last_check = 0
+    assert registry.get().version == "v2" and v1.params == {"greeting": "hello from v1"}
+    s3.publish("v3", "hello from v3")
+    registry._last_check = 0
+    assert registry.get().version == "v3"
+    # v1 is no longer used here, but still by the other process
+    assert sorted(os.listdir(tmp_path)) == [".lock", "v1", "v2", "v3"]
+
+    other_process._prune(set())  # e.g. it reloaded too, v2 and v3 are used here
+    assert sorted(os.listdir(tmp_path)) == [".lock", "v2", "v3"]
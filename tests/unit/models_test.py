@@ -0,0 +1,24 @@
+from models import ThisWorkerInput
+
+
+def _write_input(tmp_path, data: bytes) -> ThisWorkerInput:
+    (tmp_path / "source.input").write_bytes(data)
+    return ThisWorkerInput(200, "", "source", str(tmp_path))
+
+
+def test_iter_chunks(tmp_path):
+    model_input = _write_input(tmp_path, bytes(range(256)) * 40)
+    chunks = [bytes(chunk) for chunk in model_input.iter_chunks(chunk_size=4096)]
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 2048]
+    assert b"".join(chunks) == bytes(range(256)) * 40
+
+
+def test_iter_records(tmp_path):
+    model_input = _write_input(tmp_path, b"first line\nsecond line\nlast")
+    # records spanning chunk boundaries are reassembled
+    assert list(model_input.iter_records(chunk_size=4)) == [
+        b"first line",
+        b"second line",
+        b"last",
+    ]
+    assert list(_write_input(tmp_path, b"").iter_records()) == []
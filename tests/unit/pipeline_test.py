@@ -0,0 +1,59 @@
+import time
+import pytest
+
+from models import ProcessingTask
+from pipeline import TaskPipeline
+
+
+def _sleeping_stage(name: str, log: list):
+    def stage(task: ProcessingTask):
+        log.append((name, task.input_file_path))
+        time.sleep(0.2)
+        if name == "last":
+            task.response = {"state": 200, "message": task.input_file_path}
+
+    return stage
+
+
+def test_pipeline_overlaps_stages():
+    """Three tasks through three stages of 0.2s take ~1s instead of 1.8s,
+    and each task still passes the stages in order"""
+    log: list = []
+    pipeline = TaskPipeline(
+        [(name, _sleeping_stage(name, log)) for name in ["first", "middle", "last"]]
+    )
+    start = time.time()
+    futures = [pipeline.submit(ProcessingTask(f"task{i}")) for i in range(3)]
+    results = [f.result(timeout=5) for f in futures]
+    duration = time.time() - start
+    pipeline.stop()
+
+    assert [r.response["message"] for r in results] == ["task0", "task1", "task2"]
+    assert duration < 1.5
+    for i in range(3):
+        assert [name for name, t in log if t == f"task{i}"] == [
+            "first",
+            "middle",
+            "last",
+        ]
+
+
+def test_pipeline_stops_early_and_reports_errors():
+    """A stage that sets a response ends the task, an exception fails its Future"""
+
+    def first(task: ProcessingTask):
+        if task.input_file_path == "skip":
+            task.response = {"state": 403, "message": "skipped"}
+        elif task.input_file_path == "fail":
+            raise ValueError("failed")
+
+    def second(task: ProcessingTask):
+        task.response = {"state": 200, "message": "done"}
+
+    pipeline = TaskPipeline([("first", first), ("second", second)])
+    assert pipeline.submit(ProcessingTask("skip")).result(5).response["state"] == 403
+    with pytest.raises(ValueError):
+        pipeline.submit(ProcessingTask("fail")).result(5)
+    assert pipeline.submit(ProcessingTask("ok")).result(5).response["state"] == 200
+    assert pipeline.queue_depths() == {"first": 0, "second": 0}
+    pipeline.stop()
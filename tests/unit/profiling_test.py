@@ -0,0 +1,30 @@
+import pstats
+
+from models import ProcessingTask
+from profiling import profiled, start_task_profiler, stop_task_profiler
+
+
+def test_every_nth_task_is_profiled():
+    profiled_tasks = []
+    for _ in range(6):
+        profiler = start_task_profiler(3)
+        profiled_tasks.append(profiler is not None)
+        stop_task_profiler(profiler)
+    assert profiled_tasks.count(True) == 2
+    assert start_task_profiler(0) is None
+
+
+def test_one_task_profiled_at_a_time(tmp_path):
+    @profiled
+    def stage(task: ProcessingTask):
+        sorted(range(1000))
+
+    task = ProcessingTask("input", profiler=start_task_profiler(0, force=True))
+    assert task.profiler
+    assert start_task_profiler(1) is None  # another task is being profiled
+    stage(task)
+    stop_task_profiler(task.profiler)
+
+    task.profiler.dump_stats(tmp_path / "stage.prof")
+    stats = pstats.Stats(str(tmp_path / "stage.prof"))
+    assert any(func[2] == "stage" for func in stats.stats)  # type: ignore
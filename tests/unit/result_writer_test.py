@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from dane import Result
+from result_writer import BulkResultWriter
+
+
+GENERATOR = {
+    "id": "dane-example-worker",
+    "type": "Software",
+    "name": "MY_NAME",
+    "homepage": "https://github.com/beeldengeluid/dane-example-worker",
+}
+
+
+class FakeES:
+    """Records the bulk requests; fails the first `failures` of them"""
+
+    def __init__(self, failures: int = 0):
+        self.requests: list = []
+        self.failures = failures
+
+    def bulk(self, body, refresh):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Elasticsearch is unavailable")
+        self.requests.append(body)
+        items = [{"index": {"_id": op["index"]["_id"]}} for op in body[::2]]
+        return {"errors": False, "items": items}
+
+
+def _result(task_id: str) -> Result:
+    return Result(dict(GENERATOR), payload={"task_id": task_id})
+
+
+def test_results_are_saved_in_bulk(tmp_path):
+    es = FakeES()
+    writer = BulkResultWriter(es, "index", str(tmp_path / "spool"), 2, 200)
+    with ThreadPoolExecutor(3) as executor:
+        ids = list(
+            executor.map(
+                lambda i: writer.submit(_result(str(i)), str(i)).result(timeout=5),
+                range(3),
+            )
+        )
+    writer.stop()
+
+    assert len(set(ids)) == 3
+    # one full bulk request, the remaining Result after max_wait_ms
+    assert sorted(len(body) // 2 for body in es.requests) == [1, 2]
+    doc = es.requests[0][1]
+    assert doc["role"]["name"] == "result" and "created_at" in doc
+    assert (tmp_path / "spool").read_text() == ""  # nothing left to send
+
+
+def test_spooled_results_are_sent_after_restart(tmp_path):
+    spool = tmp_path / "spool"
+    # left behind by a worker that died before the Result was sent
+    spool.write_text(
+        '{"id": "a", "task_id": "1", "doc": {"result": {}}}\n{"id": "b", "tas'
+    )
+    es = FakeES()
+    writer = BulkResultWriter(es, "index", str(spool), 10, 10_000)
+    writer.stop()
+    assert es.requests == [
+        [{"index": {"_index": "index", "_id": "a", "routing": "1"}}, {"result": {}}]
+    ]
+    assert spool.read_text() == ""
+
+
+def test_failing_bulk_requests_fail_the_results(tmp_path):
+    spool = tmp_path / "spool"
+    writer = BulkResultWriter(FakeES(failures=3), "index", str(spool), 1, 0)
+    future = writer.submit(_result("1"), "1")
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    writer.stop()
+
+    # the Result stays in the spool, and is sent on the next start
+    assert len(spool.read_text().splitlines()) == 1
+    es = FakeES()
+    writer = BulkResultWriter(es, "index", str(spool), 1, 0)
+    writer.submit(_result("1"), "1").result(timeout=5)  # e.g. the redelivered task
+    writer.stop()
+    assert [len(body) // 2 for body in es.requests] == [1, 1]
+    assert spool.read_text() == ""
@@ -0,0 +1,33 @@
+from stage_journal import STAGE_DOWNLOAD, StageJournal, checksum_of_dir
+
+
+def test_stages_are_recorded_per_source_id(tmp_path):
+    journal = StageJournal(str(tmp_path))
+    journal.record("a", STAGE_DOWNLOAD, etag="1", file_path="in/a", size=3)
+    # e.g. read by the worker that takes over a redelivered task
+    assert StageJournal(str(tmp_path)).get("a", STAGE_DOWNLOAD) == {
+        "etag": "1",
+        "file_path": "in/a",
+        "size": 3,
+    }
+    assert journal.get("b", STAGE_DOWNLOAD) is None
+
+    journal.clear("a")
+    assert journal.get("a", STAGE_DOWNLOAD) is None
+
+
+def test_unreadable_journal_is_ignored(tmp_path):
+    (tmp_path / "a.json").write_text('{"download": {"et')
+    assert StageJournal(str(tmp_path)).get("a", STAGE_DOWNLOAD) is None
+
+
+def test_checksum_of_dir(tmp_path):
+    (tmp_path / "foobar").mkdir()
+    (tmp_path / "provenance").mkdir()
+    (tmp_path / "foobar" / "out.txt").write_text("Hello world")
+    checksum = checksum_of_dir(str(tmp_path), ["provenance"])
+
+    (tmp_path / "provenance" / "provenance.json").write_text("{}")
+    assert checksum_of_dir(str(tmp_path), ["provenance"]) == checksum
+    (tmp_path / "foobar" / "out.txt").write_text("Hello world!")
+    assert checksum_of_dir(str(tmp_path), ["provenance"]) != checksum
@@ -0,0 +1,140 @@
+import json
+import threading
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+from mockito import ANY, mock, unstub, verify, when
+from dane import base_classes
+from dane.base_classes import base_worker
+from dane.config import cfg
+
+import main_data_processor
+from worker import ExampleWorker
+
+
+class FakeChannel:
+    """Records what a worker sends over the channel"""
+
+    def __init__(self):
+        self.is_open = True
+        self.acks: list = []
+        self.nacks: list = []
+        self.replies: list = []
+
+    def basic_ack(self, delivery_tag):
+        self.acks.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag):
+        self.nacks.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.replies.append(json.loads(body))
+
+    def cancel(self):
+        return 0
+
+
+class FakeConnection:
+    """Runs the callbacks of other threads when servicing the connection, like
+    pika's BlockingConnection does"""
+
+    def __init__(self):
+        self._callbacks: list = []
+        self._lock = threading.Lock()
+
+    def add_callback_threadsafe(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def process_data_events(self, time_limit=0):
+        sleep(min(time_limit, 0.01))
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def _fake_worker() -> ExampleWorker:
+    when(base_classes).cwd_is_git().thenReturn(False)
+    w = ExampleWorker(cfg, unit_testing=True)
+    w.channel = FakeChannel()
+    w.connection = FakeConnection()
+    w._connected = True
+    when(w).fetch_input_s3_uri(ANY).thenReturn("s3://bucket/source__carrier.tar.gz")
+    when(w).save_to_dane_index(ANY, ANY, ANY, provenance=ANY).thenReturn(None)
+    return w
+
+
+def _start_task(w: ExampleWorker, task_id: str, delivery_tag: int):
+    """Start the task the way base_worker does, once its dependencies are met"""
+    task = SimpleNamespace(_id=task_id, key="DUMMY")
+    doc = SimpleNamespace(_id=f"doc-{task_id}")
+    method = SimpleNamespace(delivery_tag=delivery_tag)
+    props = SimpleNamespace(reply_to="reply", correlation_id=task_id)
+    threading.Thread(
+        target=w._start_processing_task,
+        args=(task, doc, w.channel, method, props),
+        daemon=True,
+    ).start()
+    while task_id not in w.in_flight_tasks():
+        sleep(0.01)
+
+
+def test_connect_applies_prefetch_count():
+    """The channel prefetch count must follow WORKER_SETTINGS.PREFETCH_COUNT (at
+    least MAX_CONCURRENT_TASKS), so the broker delivers that many messages"""
+    try:
+        when(base_classes).cwd_is_git().thenReturn(False)
+        when(base_worker).connect().thenReturn(None)
+        w = ExampleWorker(cfg, unit_testing=True)
+        w.max_concurrent_tasks = 4
+        w.prefetch_count = 8
+        w.channel = mock()
+        w.connect()
+        verify(w.channel, times=1).basic_qos(prefetch_count=8)
+    finally:
+        unstub()
+
+
+def test_stop_drains_in_flight_tasks():
+    try:
+        w = _fake_worker()
+
+        def slow_run(s3_uri, profile, cancel):
+            sleep(0.3)
+            return {"state": 200, "message": "Successfully applied model"}, None
+
+        when(main_data_processor).run(ANY, ANY, ANY).thenAnswer(slow_run)
+        _start_task(w, "1", delivery_tag=1)
+        w.stop(drain_timeout=5)
+
+        assert w.channel.acks == [1] and w.channel.nacks == []
+        assert w.channel.replies == [
+            {"state": 200, "message": "Successfully applied model"}
+        ]
+        assert w.in_flight_tasks() == {}
+    finally:
+        unstub()
+
+
+def test_stop_cancels_tasks_that_do_not_drain():
+    """Tasks that keep running are cancelled and refused, so they're requeued"""
+    try:
+        w = _fake_worker()
+
+        def cancellable_run(s3_uri, profile, cancel):
+            cancel.wait(timeout=5)
+            return {
+                "state": 500,
+                "message": main_data_processor.TASK_CANCELLED_MESSAGE,
+            }, None
+
+        when(main_data_processor).run(ANY, ANY, ANY).thenAnswer(cancellable_run)
+        _start_task(w, "1", delivery_tag=1)
+        start = monotonic()
+        w.stop(drain_timeout=0.2)
+
+        assert monotonic() - start < 2
+        assert w.channel.nacks == [1] and w.channel.acks == []
+    finally:
+        unstub()
@@ -1,157 +1,63 @@
 import logging
-import sys
 import os
-from base_util import validate_config
-from dane import Document, Task, Result
-from dane.base_classes import base_worker
-from dane.config import cfg
-from dane.provenance import Provenance
-from models import CallbackResponse
-from io_util import (
-    fetch_input_s3_uri,
-    source_id_from_s3_uri,
-    get_s3_output_file_uri,
-)
-from pika.exceptions import ChannelClosedByBroker  # type: ignore
-import main_data_processor
+import sys
 
 
 logger = logging.getLogger()
 
 
-class ExampleWorker(base_worker):
-    """Example worker class
-
-    Dane Example worker class that implements the Dane worker.
-    Thus serves as the process receiving tasks from Dane.
-    Uses the base_worker class from Dane
-    """
-
-    def __init__(self, config, unit_testing=False):
-        """Initialises the worker class
-
-        Validates the config, sets some variables and creates a generator if absent.
-
-        Params:
-            config: the configuration
-        """
-        logger.info(config)
-        self.UNIT_TESTING = unit_testing
-
-        if not self.UNIT_TESTING and not validate_config(config):
-            logger.error("Invalid config, quitting")
-            sys.exit()
-
-        self.__queue_name = "DUMMY"
-        self.__binding_key = "#.DUMMY"
-        self.__depends_on = (
-            list(config.DANE_DEPENDENCIES) if "DANE_DEPENDENCIES" in config else []
-        )
-
-        super().__init__(
-            self.__queue_name,
-            self.__binding_key,
-            config,
-            self.__depends_on,
-            auto_connect=not self.UNIT_TESTING,
-            no_api=self.UNIT_TESTING,
-        )
-
-        # NOTE: cannot be automatically filled, because no git client is present
-        if not self.generator:
-            logger.info("Generator was None, creating it now")
-            self.generator = {
-                "id": "dane-example-worker",
-                "type": "Software",
-                "name": "MY_NAME",
-                "homepage": "https://github.com/beeldengeluid/dane-example-worker",
-            }
-
-    """----------------------------------INTERACTION WITH DANE SERVER ---------------------------------"""
-
-    def callback(self, task: Task, doc: Document) -> CallbackResponse:
-        """Dane callback function
-
-        DANE callback function is called whenever there is a job for this worker.
-        Fetches input from S3,
-        Runs the main process,
-        Saves the results and provenance to the dane index.
+def __getattr__(name: str):
+    """ExampleWorker (see example_worker.py) is only imported on first use"""
+    if name == "ExampleWorker":
+        from example_worker import ExampleWorker
 
-        Params:
-            task: the Dane Task
-            doc: the Dane Document
-
-        Returns:
-            CallbackResponse: the main processing result
-
-        """
-        logger.info("Receiving a task from the DANE server!")
-        logger.info(task)
-        logger.info(doc)
-
-        # fetch s3 uri of input data:
-        s3_uri = fetch_input_s3_uri(self.handler, doc)
-
-        # now run the main process!
-        processing_result, full_provenance_chain = main_data_processor.run(s3_uri)
-
-        # if results are fine, save something to the DANE index
-        if processing_result.get("state", 500) == 200:
-            logger.info(
-                "applying IO on output went well, now finally saving to DANE index"
-            )
-            self.save_to_dane_index(
-                doc,
-                task,
-                get_s3_output_file_uri(source_id_from_s3_uri(s3_uri)),
-                provenance=full_provenance_chain,
-            )
-        return processing_result
-
-    def save_to_dane_index(
-        self,
-        doc: Document,
-        task: Task,
-        s3_location: str,
-        provenance: Provenance,
-    ) -> None:
-        """Save the result to the dane index
-
-        Params:
-            doc: The dane Document
-            task: The dane Task
-            s3_location: The location to save the dane result to
-            provenance: The Provenance information (currently not stored but written to S3)
-        """
-        logger.info("saving results to DANE, task id={0}".format(task._id))
-        r = Result(
-            self.generator,
-            payload={
-                "doc_id": doc._id,
-                "task_id": task._id if task else None,
-                "doc_target_id": doc.target["id"],
-                "doc_target_url": doc.target["url"],
-                "s3_location": s3_location,
-                # "provenance": provenance.to_json(),
-            },
-            api=self.handler,
-        )
-        r.save(task._id)
+        return ExampleWorker
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Start the worker
+# NOTE: only what the chosen mode needs is imported, to keep the start up time low
+# (see tests/unit/import_time_test.py): --run-test-file does not need the DANE
+# worker (pika, elasticsearch), and boto3 is only imported once S3 is used
 # passing --run-test-file will run the whole process on the files in cfg.INPUT.TEST_FILES
+# passing --run-batch <s3://bucket/prefix|dir> will run it on all inputs in there
 if __name__ == "__main__":
     from argparse import ArgumentParser
     import json
     from base_util import LOG_FORMAT
+    from dane.config import cfg
 
     # first read the CLI arguments
     parser = ArgumentParser(description="dane-emotion-recognition-worker")
     parser.add_argument(
         "--run-test-file", action="store", dest="run_test_file", default="n", nargs="?"
     )
+    parser.add_argument(
+        "--run-batch",
+        action="store",
+        dest="run_batch",
+        metavar="S3_PREFIX_OR_DIR",
+        help="process all archives under s3://<bucket>/<prefix> or in a local dir",
+    )
+    parser.add_argument(
+        "--journal",
+        action="store",
+        default="batch-journal.jsonl",
+        help="(--run-batch) records the completed inputs, to resume from",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="(--run-batch) number of inputs processed in parallel",
+    )
     parser.add_argument("--log", action="store", dest="loglevel", default="INFO")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile every task, see WORKER_SETTINGS.PROFILE_EVERY_N_TASKS",
+    )
     args = parser.parse_args()
 
     # initialises the root logger
@@ -166,8 +72,14 @@ if __name__ == "__main__":
     logger.info(f"Logger initialized (log level: {log_level})")
     logger.info(f"Got the following CMD line arguments: {args}")
 
-    # see if the test file must be run
-    if args.run_test_file != "n":
+    # see if the test file or a batch must be run
+    if args.run_batch:
+        from batch_runner import run_batch
+
+        summary = run_batch(args.run_batch, args.journal, args.processes)
+        print(json.dumps(summary, indent=4))
+        sys.exit(1 if summary["failed"] else 0)
+    elif args.run_test_file != "n":
         if cfg.INPUT.TEST_INPUT_PATH:
             input_path = os.path.join(
                 cfg.FILE_SYSTEM.BASE_MOUNT,
@@ -177,8 +89,10 @@ if __name__ == "__main__":
             logger.info(
                 "Running example worker with INPUT.TEST_INPUT_PATH:" f"{input_path}"
             )
+            import main_data_processor
+
             processing_result, full_provenance_chain = main_data_processor.run(
-                input_path
+                input_path, args.profile
             )
             logger.info("Results after applying desired I/O")
             logger.info(processing_result)
@@ -192,9 +106,18 @@ if __name__ == "__main__":
             logger.error("Please configure an input file in INPUT.TEST_INPUT_FILE")
             sys.exit()
     else:
+        from example_worker import ExampleWorker
+        from metrics import start_metrics_server
+        from pika.exceptions import ChannelClosedByBroker  # type: ignore
+        import signal
+
         logger.info("Starting the worker")
         # start the worker
-        w = ExampleWorker(cfg)
+        w = ExampleWorker(cfg, profile=args.profile)
+        if cfg.WORKER_SETTINGS.get("METRICS_PORT", 0):
+            start_metrics_server(cfg.WORKER_SETTINGS.METRICS_PORT)
+        # e.g. a rolling update: stop (and drain) the same way as on Ctrl+C
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
         try:
             w.run()
         except ChannelClosedByBroker:
@@ -204,7 +127,8 @@ if __name__ == "__main__":
             This timeout value can be configured, see consumers doc guide to learn more')
             """
             logger.critical(
-                "Please increase the consumer_timeout in your RabbitMQ server"
+                "A task was not acked within the consumer_timeout of the RabbitMQ "
+                "server: set WORKER_SETTINGS.TASK_TIMEOUT_S below it (or increase it)"
             )
             w.stop()
         except (KeyboardInterrupt, SystemExit):